@@ -0,0 +1,178 @@
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+import numpy as np
+import torch
+
+
+class BatchScheduler:
+    """
+    Cross-request micro-batching for the segmentation model.
+
+    Request threads call forward() with a chunk of 2.5D stacks
+    (N, 3, S, S) and block until their slice of the output is ready.
+    A single scheduler thread concatenates the chunks of all waiting
+    requests into one batch of at most `max_batch_size` stacks — after
+    picking up a chunk it waits up to `max_wait_ms` for more, then still
+    takes every chunk already queued — runs the model once and scatters
+    the result back.
+
+    Chunks are never split, so a chunk larger than max_batch_size runs
+    as a batch of its own, and only chunks with the same per-stack shape
+    (e.g. triage vs full-resolution passes) share a batch.
+
+    forward() raises RuntimeError unless the scheduler is running; chunks
+    still queued when it stops fail with the same error.
+    """
+
+    def __init__(self, model, max_batch_size=32, max_wait_ms=5.0,
+                 window=1000):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._carry = None
+        self._thread = None
+        # Guards _accepting, so nothing is queued behind the stop sentinel
+        self._state_lock = threading.Lock()
+        self._accepting = False
+
+        # Metrics over the lifetime / the last `window` batches
+        self._lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._requests_per_batch = Counter()
+        self._waits = deque(maxlen=window)
+        self._items = 0
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="batch-scheduler", daemon=True
+        )
+        self._thread.start()
+        with self._state_lock:
+            self._accepting = True
+        return self
+
+    def stop(self):
+        with self._state_lock:
+            self._accepting = False
+            if self._thread is None:
+                return
+            self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._fail_pending(RuntimeError("Batch scheduler stopped"))
+
+    def _fail_pending(self, error):
+        """Fail every chunk the scheduler thread will no longer run."""
+        pending = [self._carry] if self._carry is not None else []
+        self._carry = None
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for item in pending:
+            if item is not None:
+                item[1].set_exception(error)
+
+    def forward(self, batch):
+        """Drop-in for model(batch), shared by every request thread."""
+        future = Future()
+        with self._state_lock:
+            if not self._accepting:
+                raise RuntimeError("Batch scheduler is not running")
+            self._queue.put((batch, future, time.perf_counter()))
+        return future.result()
+
+    def _next_item(self, timeout=None):
+        if self._carry is not None:
+            item, self._carry = self._carry, None
+            return item
+        if timeout is not None and timeout <= 0:
+            return self._queue.get_nowait()
+        return self._queue.get(timeout=timeout)
+
+    def _gather(self, first):
+        items = [first]
+        size = first[0].shape[0]
+        # The wait starts when the batch does: a chunk that queued behind
+        # the previous forward must not arrive with its deadline spent
+        deadline = time.perf_counter() + self.max_wait
+
+        while size < self.max_batch_size:
+            # Past the deadline, still take whatever is already queued
+            remaining = max(0.0, deadline - time.perf_counter())
+            try:
+                item = self._next_item(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            if (size + item[0].shape[0] > self.max_batch_size
+                    or item[0].shape[1:] != first[0].shape[1:]):
+                self._carry = item
+                break
+            items.append(item)
+            size += item[0].shape[0]
+
+        return items, size
+
+    def _run(self):
+        # Grad mode is thread-local; this thread never needs autograd
+        torch.set_grad_enabled(False)
+        while True:
+            first = self._next_item()
+            if first is None:
+                return
+
+            items, size = self._gather(first)
+            started = time.perf_counter()
+
+            try:
+                if len(items) == 1:
+                    logits = self.model(items[0][0])
+                else:
+                    logits = self.model(torch.cat([b for b, _, _ in items]))
+            except Exception as e:
+                for _, future, _ in items:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for batch, future, _ in items:
+                n = batch.shape[0]
+                future.set_result(logits[offset:offset + n])
+                offset += n
+
+            with self._lock:
+                self._batch_sizes[size] += 1
+                self._requests_per_batch[len(items)] += 1
+                self._items += size
+                self._waits.extend(started - t for _, _, t in items)
+
+    def stats(self):
+        with self._lock:
+            batches = sum(self._batch_sizes.values())
+            waits_ms = np.array(self._waits) * 1000.0
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "batches": batches,
+                "stacks": self._items,
+                "mean_batch_size": self._items / batches if batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "requests_per_batch": dict(sorted(self._requests_per_batch.items())),
+                "queue_wait_ms": {
+                    "mean": float(waits_ms.mean()) if waits_ms.size else 0.0,
+                    "p50": float(np.percentile(waits_ms, 50)) if waits_ms.size else 0.0,
+                    "p95": float(np.percentile(waits_ms, 95)) if waits_ms.size else 0.0,
+                    "max": float(waits_ms.max()) if waits_ms.size else 0.0,
+                },
+                "pending": self._queue.qsize() + (self._carry is not None),
+            }
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+
+# Stages a job passes through, in order; cached studies skip some of them
+STAGES = ("queued", "decode", "resample", "inference", "overlays", "done")
+
+
+class Job:
+    """
+    One asynchronous segmentation request.
+
+    Worker threads call update()/publish(); every change is appended to
+    an event log that SSE subscribers replay from any position, so a
+    client that connects late still sees the whole history.
+    """
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.stage = "queued"
+        self.progress = 0.0
+        self.status = "pending"        # pending | running | done | failed
+        self.error = None
+        self.result = None
+        self.created = time.time()
+        self.finished = None
+        self.events = []
+        self._lock = threading.Lock()
+        self._listeners = set()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": round(self.progress, 4),
+                "error": self.error,
+                "created": self.created,
+                "finished": self.finished,
+                "result_ready": self.result is not None,
+            }
+
+    def publish(self, event, data, finish=None):
+        """
+        Append an event and wake every subscriber. `finish` sets the
+        final status in the same step, so no subscriber can see a
+        finished job without its last event.
+        """
+        with self._lock:
+            self.events.append((event, data))
+            if finish is not None:
+                self.status = finish
+                self.finished = time.time()
+            listeners = list(self._listeners)
+        for loop, wakeup in listeners:
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def payloads(self, event):
+        """Payloads of every `event` in the log, in order (not copies)."""
+        with self._lock:
+            return [data for name, data in self.events if name == event]
+
+    def update(self, stage=None, progress=None, **extra):
+        with self._lock:
+            if stage is not None and stage != self.stage:
+                self.stage = stage
+                self.progress = 0.0
+            if progress is not None:
+                self.progress = float(progress)
+            if self.status == "pending":
+                self.status = "running"
+            data = {"stage": self.stage, "progress": round(self.progress, 4)}
+        data.update(extra)
+        self.publish("progress", data)
+
+    def succeed(self, result, event_data=None):
+        """Store the result; `event_data` replaces it in the final event."""
+        with self._lock:
+            self.result = result
+            self.stage = "done"
+            self.progress = 1.0
+        self.publish(
+            "result", result if event_data is None else event_data,
+            finish="done"
+        )
+
+    def fail(self, error):
+        with self._lock:
+            self.error = str(error)
+        self.publish("error", {"detail": str(error)}, finish="failed")
+
+    async def stream(self, keepalive=15.0):
+        """
+        Yield server-sent-event frames: the full event log, then live
+        events until the job finishes. Comment frames keep proxies from
+        closing an idle connection during long stages.
+        """
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        listener = (loop, wakeup)
+        with self._lock:
+            self._listeners.add(listener)
+
+        try:
+            sent = 0
+            while True:
+                wakeup.clear()
+                with self._lock:
+                    pending = self.events[sent:]
+                    over = self.finished is not None
+                for event, data in pending:
+                    yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                sent += len(pending)
+                if over:
+                    return
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            with self._lock:
+                self._listeners.discard(listener)
+
+
+class JobStore:
+    """
+    In-process registry of jobs. Finished jobs are dropped after `ttl`
+    seconds, and the oldest finished ones go first once `max_jobs` is hit.
+    """
+
+    def __init__(self, ttl=3600, max_jobs=256):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self):
+        job = Job(uuid.uuid4().hex)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def discard(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _prune(self):
+        now = time.time()
+        finished = sorted(
+            (job.finished, job_id)
+            for job_id, job in self._jobs.items()
+            if job.finished is not None
+        )
+        for when, job_id in finished:
+            if now - when > self.ttl or len(self._jobs) >= self.max_jobs:
+                del self._jobs[job_id]
@@ -1,60 +1,217 @@
+import os
 import sys
+import asyncio
+import json
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import numpy as np
 import torch
 import cv2
-import pydicom
 import uvicorn
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import Depends, FastAPI, Request, UploadFile, HTTPException
 from contextlib import asynccontextmanager
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import tempfile
+from starlette.formparsers import MultiPartException, MultiPartParser
 import zipfile
-import io
 import base64
 
 # Setup paths
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 sys.path.append(str(PROJECT_ROOT))
 
-from src.model import LungAttentionUNet
+from api.batching import BatchScheduler
+from api.jobs import JobStore
+from src.execution import inference_forward, prepare_model
+from src.runtime_config import (
+    apply_runtime_config,
+    available_cpus,
+    cpu_partition,
+    runtime_status,
+    thread_budget,
+)
+from src.model_export import ARTIFACT_NAMES, load_checkpoint_model, load_exported_model
+from src.inference import segment_volume
+from src.dicom_io import (
+    InvalidSeriesError,
+    load_zip_series,
+    series_spacing,
+    zip_dicom_members,
+)
+from src.volume_cache import VolumeCache, derive_key, file_fingerprint, series_key
 from src.preprocessing import (
     convert_to_hu,
     resample_volume,
     window_and_normalize,
-    get_lung_bbox,
-    resize_image
 )
 
 # Global state
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 model = None
 MODEL_PATH = PROJECT_ROOT / "checkpoints" / "best_model.pth"
+# "eager" serves MODEL_PATH with MONAI; "torchscript" / "onnx" serve the
+# artifacts written to EXPORT_DIR by scripts/export_model.py, "int8" the
+# quantized model from scripts/quantize_model.py (CPU only)
+MODEL_BACKEND = "eager"
+EXPORT_DIR = PROJECT_ROOT / "exports"
+ONNX_THREADS = None            # None = this process's torch thread budget
+# Eager backend execution: "fp32" | "bf16" (CPU autocast) | "auto";
+# inputs are fed in channels_last to match the model's weights
+EXECUTION_PRECISION = "fp32"
+CHANNELS_LAST_INPUTS = True
+COMPILE_MODEL = False          # torch.compile the eager model at startup
+model_forward = None
 MODEL_INFO_CACHE = None
 MAX_UPLOAD_MB = 500
+MAX_SERIES_MB = 2048           # uncompressed size of the DICOM members
+UPLOAD_SPOOL_MB = 16           # uploads above this spool to a temp file
+INFERENCE_BATCH_SIZE = 16
+# "full" (whole slice) | "roi" (lung crop) | "cascade" | "tiled" (1 mm windows)
+INFERENCE_MODE = "full"
+# Cascade: slices whose downsampled-pass max probability stays below
+# the threshold are skipped (see scripts/evaluate_cascade.py)
+CASCADE_TRIAGE_SIZE = 128
+CASCADE_TRIAGE_THRESHOLD = 0.1
+# Tiled: 256 px windows on the resampled volume, Gaussian-blended
+TILE_SIZE = 256
+TILE_OVERLAP = 0.5
+INFERENCE_OPTIONS = {
+    "full": {"img_size": 256},
+    "roi": {"img_size": 256},
+    "cascade": {
+        "img_size": 256,
+        "triage_size": CASCADE_TRIAGE_SIZE,
+        "triage_threshold": CASCADE_TRIAGE_THRESHOLD
+    },
+    "tiled": {"tile_size": TILE_SIZE, "overlap": TILE_OVERLAP}
+}
+RESAMPLE_BACKEND = "sitk"      # "sitk" | "scipy" | "torch"
+RESAMPLE_THREADS = None        # None = this process's SimpleITK budget
+TARGET_SPACING = (1.0, 1.0, 1.0)
+HU_WINDOW = (-1000, 400)
+
+# Decoding, resampling and inference run on a bounded thread pool so the
+# event loop keeps serving /health and admitting new uploads meanwhile
+INFERENCE_WORKERS = 2          # studies processed concurrently
+MAX_QUEUED_REQUESTS = 8        # admitted studies waiting for a worker
+executor = None
+_admission_lock = threading.Lock()
+_in_flight = 0
+
+# Concurrent requests share model forward passes: their chunks of
+# INFERENCE_BATCH_SIZE stacks are merged into batches of up to
+# MICRO_BATCH_MAX_SIZE, waiting at most MICRO_BATCH_MAX_WAIT_MS
+MICRO_BATCHING = True
+MICRO_BATCH_MAX_SIZE = 32
+MICRO_BATCH_MAX_WAIT_MS = 5.0
+scheduler = None
+
+# Thread budgets: SERVER_PROCESSES API processes (uvicorn --workers)
+# share this host's CPUs equally. Within a process torch gets the whole
+# share, OpenCV / SimpleITK split it between the INFERENCE_WORKERS
+# studies that run at once. PIN_CPUS also pins every process to its own
+# NUMA-local slice, picked by SERVER_PROCESS_INDEX (0..SERVER_PROCESSES-1),
+# which the process manager must then set for each process
+SERVER_PROCESSES = int(os.environ.get("SERVER_PROCESSES", 1))
+PIN_CPUS = False
+runtime = None
+
+# Asynchronous jobs (/jobs) for series that outlive client/proxy timeouts
+JOB_TTL_S = 3600               # finished jobs are kept this long
+MAX_JOBS = 256
+jobs = JobStore(ttl=JOB_TTL_S, max_jobs=MAX_JOBS)
+
+# Content-addressed caches of preprocessed volumes and predicted masks
+CACHE_ROOT = PROJECT_ROOT / "cache"
+VOLUME_CACHE_MB = 4096
+PREDICTION_CACHE_MB = 512
+volume_cache = VolumeCache(CACHE_ROOT / "volumes", VOLUME_CACHE_MB * 1024**2)
+prediction_cache = VolumeCache(CACHE_ROOT / "predictions", PREDICTION_CACHE_MB * 1024**2)
+MODEL_FINGERPRINT = None
+# Anything that changes the preprocessed volume for a given series
+PREPROCESS_SETTINGS = (
+    f"backend={RESAMPLE_BACKEND}|threads={RESAMPLE_THREADS}|"
+    f"spacing={TARGET_SPACING}|window={HU_WINDOW}"
+)
+# Anything that changes the mask for a given volume and checkpoint
+INFERENCE_SETTINGS = (
+    f"threshold=0.5|mode={INFERENCE_MODE}|precision={EXECUTION_PRECISION}|"
+    f"{sorted(INFERENCE_OPTIONS.get(INFERENCE_MODE, {}).items())}"
+)
+
+def configure_runtime():
+    """Apply this process's thread budget (and CPU pinning) at startup."""
+    cpus = available_cpus()
+    index = os.environ.get("SERVER_PROCESS_INDEX")
+    if index is None and SERVER_PROCESSES == 1:
+        index = 0
+    if index is None and PIN_CPUS:
+        # pids are not consecutive across workers, so they cannot pick
+        # distinct slices: several processes would share one
+        raise RuntimeError(
+            f"PIN_CPUS needs SERVER_PROCESS_INDEX (0..{SERVER_PROCESSES - 1}) "
+            f"set per process when SERVER_PROCESSES > 1"
+        )
+    index = int(index) if index is not None else None
+
+    # Unpinned processes without an index are only sized from a share
+    share = cpu_partition(index or 0, SERVER_PROCESSES, cpus)
+    budget = thread_budget(len(share), concurrent_tasks=INFERENCE_WORKERS)
+    status = apply_runtime_config(budget, affinity=share if PIN_CPUS else None)
+    print(f"Runtime: process {index}/{SERVER_PROCESSES} | "
+          f"cpus {status['affinity']} | threads {status['threads']}")
+    return {
+        "process_index": index,
+        "processes": SERVER_PROCESSES,
+        "pinned": PIN_CPUS,
+        "budget": budget,
+    }
+
 
 def load_model():
-    global model
-    print(f"--- Init: Loading weights from {MODEL_PATH} ---")
+    global model, model_forward, device, MODEL_FINGERPRINT
     try:
-        model = LungAttentionUNet(
-            in_channels=3,
-            out_channels=1
-        ).to(device, memory_format=torch.channels_last)
-
-        # Load weights (weights_only=False required for complex model structures)
-        checkpoint = torch.load(MODEL_PATH, map_location=device, weights_only=False)
+        if MODEL_BACKEND == "eager":
+            print(f"--- Init: Loading weights from {MODEL_PATH} ---")
+            model, checkpoint = load_checkpoint_model(MODEL_PATH, device)
+            model = prepare_model(
+                model, device,
+                channels_last=CHANNELS_LAST_INPUTS, compile=COMPILE_MODEL
+            )
+            model_forward = inference_forward(
+                model, device, EXECUTION_PRECISION, CHANNELS_LAST_INPUTS
+            )
+            model_file = MODEL_PATH
 
-        if isinstance(checkpoint, dict) and "model_state_dict" in checkpoint:
-            model.load_state_dict(checkpoint['model_state_dict'])
-            print(f"SUCCESS: Model loaded from epoch {checkpoint['epoch']}")
+            if isinstance(checkpoint, dict) and "model_state_dict" in checkpoint:
+                print(f"SUCCESS: Model loaded from epoch {checkpoint['epoch']}")
+            else:
+                print("SUCCESS: Model weights loaded directly.")
         else:
-            model.load_state_dict(checkpoint)
-            print("SUCCESS: Model weights loaded directly.")
+            if MODEL_BACKEND == "int8":
+                # Quantized kernels are CPU only: batches must stay there
+                device = torch.device("cpu")
+            model_file = EXPORT_DIR / ARTIFACT_NAMES[MODEL_BACKEND]
+            print(f"--- Init: Loading {MODEL_BACKEND} artifact {model_file} ---")
+            model = load_exported_model(
+                MODEL_BACKEND, model_file, device,
+                threads=ONNX_THREADS or runtime["budget"]["torch"]
+            )
+            model_forward = model
+            checkpoint = {}
+            manifest = EXPORT_DIR / (
+                "quantization_report.json" if MODEL_BACKEND == "int8"
+                else "export_manifest.json"
+            )
+            if manifest.exists():
+                with open(manifest) as f:
+                    checkpoint = json.load(f)
 
-        model.eval()
-        print(f"SUCCESS: Model ready on {device}")
+        MODEL_FINGERPRINT = file_fingerprint(model_file)
+        print(f"SUCCESS: Model ready on {device} ({MODEL_BACKEND})")
         return checkpoint
     except Exception as e:
         print(f"CRITICAL ERROR loading model: {str(e)}")
@@ -63,19 +220,34 @@ def load_model():
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global MODEL_INFO_CACHE
+    global MODEL_INFO_CACHE, executor, scheduler, runtime
     print("\n--- API Lifecycle Startup ---")
+    # Before the model loads, so torch's inter-op pool can still be sized
+    runtime = configure_runtime()
     checkpoint = load_model()
+    if model is not None and MICRO_BATCHING:
+        scheduler = BatchScheduler(
+            model_forward,
+            max_batch_size=MICRO_BATCH_MAX_SIZE,
+            max_wait_ms=MICRO_BATCH_MAX_WAIT_MS
+        ).start()
+    executor = ThreadPoolExecutor(
+        max_workers=INFERENCE_WORKERS, thread_name_prefix="inference"
+    )
     
-    if checkpoint and MODEL_PATH.exists():
+    if checkpoint is not None and model is not None:
         MODEL_INFO_CACHE = {
             'architecture': "Attention U-Net",
             'input_size': "256x256",
             'trained_epoch': checkpoint.get('epoch', 'N/A') if isinstance(checkpoint, dict) else 'N/A',
+            'backend': MODEL_BACKEND,
             'device': str(device)
         }
     print("--- API Lifecycle Ready ---\n")
     yield
+    executor.shutdown(wait=False, cancel_futures=True)
+    if scheduler is not None:
+        scheduler.stop()
 
 # Create App (Lifespan MUST be defined before this line)
 app = FastAPI(
@@ -98,95 +270,355 @@ async def health_check():
     return {
         "status": "healthy" if model else "unhealthy",
         "model_loaded": model is not None,
-        "device": str(device)
+        "device": str(device),
+        "queue": queue_status()
+    }
+
+
+@app.get('/metrics')
+async def metrics():
+    return {
+        "queue": queue_status(),
+        "batching": scheduler.stats() if scheduler is not None else None,
+        "volume_cache": volume_cache.stats(),
+        "prediction_cache": prediction_cache.stats()
+    }
+
+
+@app.get('/runtime')
+async def runtime_settings():
+    """Effective thread pools and CPU affinity of the serving process."""
+    return {
+        **(runtime or {}), **runtime_status(),
+        "device": str(device), "backend": MODEL_BACKEND,
+    }
+
+
+def queue_status():
+    with _admission_lock:
+        in_flight = _in_flight
+    return {
+        "workers": INFERENCE_WORKERS,
+        "running": min(in_flight, INFERENCE_WORKERS),
+        "queued": max(0, in_flight - INFERENCE_WORKERS),
+        "max_queued": MAX_QUEUED_REQUESTS
+    }
+
+
+def _release_slot(_future):
+    global _in_flight
+    with _admission_lock:
+        _in_flight -= 1
+
+
+def submit_blocking(fn, *args):
+    """
+    Admit a blocking call to the worker pool and return an awaitable for
+    its result. Raises 429 with the queue depth once all workers are busy
+    and MAX_QUEUED_REQUESTS more are already waiting.
+
+    The slot is released when the call finishes, not when the request
+    goes away, so a disconnected client still counts until its work ends.
+    """
+    global _in_flight
+    with _admission_lock:
+        if _in_flight >= INFERENCE_WORKERS + MAX_QUEUED_REQUESTS:
+            raise HTTPException(
+                status_code=429,
+                detail={
+                    "message": "Server busy, retry later",
+                    "queue_depth": _in_flight - INFERENCE_WORKERS,
+                    "max_queue_depth": MAX_QUEUED_REQUESTS
+                }
+            )
+        _in_flight += 1
+
+    try:
+        future = executor.submit(fn, *args)
+    except BaseException:
+        _release_slot(None)
+        raise
+    future.add_done_callback(_release_slot)
+    return asyncio.wrap_future(future)
+
+
+def _no_progress(stage, fraction=None, **extra):
+    pass
+
+
+def preprocess_series(pixels, slices):
+    spacing = series_spacing(slices)
+
+    volume = convert_to_hu(slices, pixels)
+    volume = resample_volume(
+        volume, spacing, TARGET_SPACING,
+        backend=RESAMPLE_BACKEND, threads=RESAMPLE_THREADS
+    )
+    min_hu, max_hu = HU_WINDOW
+    return window_and_normalize(volume, min_hu, max_hu, inplace=True)
+
+
+def segment_series(pixels, slices, progress=_no_progress):
+    """
+    Preprocessed volume and binary prediction for one decoded series.
+    Both are looked up by content address first, so a re-uploaded study
+    skips preprocessing and inference entirely.
+
+    progress: callable(stage, fraction, **extra) for job reporting
+    """
+    key = derive_key(series_key(slices, pixels), PREPROCESS_SETTINGS)
+    cache_hits = {"preprocess": False, "prediction": False}
+
+    volume = volume_cache.get(key)
+    if volume is None:
+        progress("resample", 0.0)
+        volume = preprocess_series(pixels, slices)
+        volume_cache.put(key, volume)
+    else:
+        cache_hits["preprocess"] = True
+
+    prediction_key = derive_key(key, MODEL_FINGERPRINT, INFERENCE_SETTINGS)
+    predictions = prediction_cache.get(prediction_key)
+    if predictions is None:
+        progress("inference", 0.0, total_slices=volume.shape[0])
+        predictions = segment_volume(
+            model,
+            volume,
+            device,
+            mode=INFERENCE_MODE,
+            **INFERENCE_OPTIONS.get(INFERENCE_MODE, {}),
+            batch_size=INFERENCE_BATCH_SIZE,
+            forward=scheduler.forward if scheduler is not None else model_forward,
+            progress=lambda done, total: progress(
+                "inference", done / total, slices_done=done, total_slices=total
+            )
+        )
+        prediction_cache.put(prediction_key, predictions)
+    else:
+        cache_hits["prediction"] = True
+
+    return volume, predictions, cache_hits
+
+
+def format_response(volume, predictions, cache_hits, on_overlay=None):
+    """
+    JSON response with one PNG overlay per tumor slice. `on_overlay`,
+    if given, receives each overlay (and its position) as it is rendered.
+    """
+    total_z = volume.shape[0]
+    tumor_pixels = predictions.sum(axis=(1, 2))
+    tumor_slices = [int(z) for z in np.flatnonzero(tumor_pixels > 10)]
+    overlays = []
+    for i, z in enumerate(tumor_slices):
+        ct_uint8 = (volume[z] * 255).astype(np.uint8)
+        ct_rgb = cv2.cvtColor(ct_uint8, cv2.COLOR_GRAY2BGR)
+
+        overlay = ct_rgb.copy()
+        overlay[predictions[z] > 0] = [255, 0, 0] # Red
+        res = cv2.addWeighted(ct_rgb, 0.7, overlay, 0.3, 0)
+
+        _, buf = cv2.imencode('.png', cv2.resize(res, (256, 256)))
+        overlays.append({
+            "slice_index": z,
+            "image_base64": base64.b64encode(buf).decode('utf-8'),
+            "tumor_pixels": int(tumor_pixels[z])
+        })
+        if on_overlay is not None:
+            on_overlay(overlays[-1], i + 1, len(tumor_slices))
+
+    return {
+        "status": "success",
+        "total_slices": total_z,
+        "tumor_slices": len(tumor_slices),
+        "tumor_slice_ids": tumor_slices,
+        "total_tumor_volume": float(tumor_pixels.sum()),
+        "overlays": overlays,
+        "cache": cache_hits
+    }
+
+
+# Multipart uploads are held in a SpooledTemporaryFile. Our own parser
+# raises Starlette's 1 MB default so typical series stay in memory and
+# only big ones hit disk, without touching other apps in the process
+assert hasattr(MultiPartParser, "spool_max_size"), \
+    "Starlette's MultiPartParser no longer has spool_max_size"
+
+
+class UploadTooLarge(MultiPartException):
+    pass
+
+
+class SeriesUploadParser(MultiPartParser):
+    """
+    Multipart parser with our spool size that stops reading the body as
+    soon as its parts exceed MAX_UPLOAD_MB, before spooling the rest.
+    """
+    spool_max_size = UPLOAD_SPOOL_MB * 1024**2
+    max_upload_bytes = MAX_UPLOAD_MB * 1024**2
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._received = 0
+
+    def on_part_data(self, data, start, end):
+        self._received += end - start
+        if self._received > self.max_upload_bytes:
+            raise UploadTooLarge(
+                f"Upload exceeds {self.max_upload_bytes // 1024**2} MB"
+            )
+        super().on_part_data(data, start, end)
+
+
+async def series_upload(request: Request):
+    """The `file` part of a multipart series upload, parsed by SeriesUploadParser."""
+    content_length = request.headers.get("content-length")
+    if (content_length and content_length.isdigit()
+            and int(content_length) > SeriesUploadParser.max_upload_bytes):
+        raise HTTPException(
+            status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_MB} MB"
+        )
+    try:
+        form = await SeriesUploadParser(
+            request.headers, request.stream(), max_files=1
+        ).parse()
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=e.message)
+    except MultiPartException as e:
+        raise HTTPException(status_code=400, detail=e.message)
+    try:
+        file = form.get("file")
+        if file is None or isinstance(file, str):
+            raise HTTPException(status_code=422, detail="Missing 'file' upload")
+        yield file
+    finally:
+        await form.close()
+
+
+# /predict and /jobs parse their body themselves; document it for OpenAPI
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file"],
+            "properties": {"file": {"type": "string", "format": "binary"}},
+        }}},
     }
+}
+
+
+def run_prediction(upload, progress=_no_progress, on_overlay=None):
+    """Blocking part of /predict and /jobs: ZIP → volume → mask → overlays."""
+    progress("decode", 0.0)
+    # Read members straight out of the spooled upload — no copy into
+    # memory, no extraction to a temp dir
+    with zipfile.ZipFile(upload) as zf:
+        members = zip_dicom_members(zf)
+        if not members:
+            raise HTTPException(status_code=400, detail="No DICOM files in ZIP")
+        if sum(m.file_size for m in members) > MAX_SERIES_MB * 1024**2:
+            raise HTTPException(
+                status_code=413,
+                detail=f"DICOM series exceeds {MAX_SERIES_MB} MB uncompressed"
+            )
+
+        # Headers are validated before any pixel data is decoded
+        pixels, slices = load_zip_series(zf, members)
 
-@app.post("/predict")
-async def predict(file: UploadFile = File(...)):
+    # 1. Preprocess + 2. Predict (served from cache when seen before)
+    volume, predictions, cache_hits = segment_series(pixels, slices, progress)
+
+    # 3. Format Overlays
+    progress("overlays", 0.0)
+    return format_response(volume, predictions, cache_hits, on_overlay)
+
+
+def run_job(job, upload):
+    """Worker-thread body of a /jobs request; all outcomes land on `job`."""
+    def on_overlay(overlay, done, total):
+        job.publish("overlay", overlay)
+        job.update("overlays", done / total)
+
+    try:
+        result = run_prediction(upload, job.update, on_overlay)
+        # Overlays already live in the event log, one event each; keep
+        # them only there and store the rest as the result
+        job.succeed({k: v for k, v in result.items() if k != "overlays"})
+    except HTTPException as e:
+        job.fail(e.detail)
+    except Exception as e:
+        print(f"Job {job.id} Error: {str(e)}")
+        job.fail(e)
+    finally:
+        upload.close()
+
+
+@app.post("/predict", openapi_extra=UPLOAD_REQUEST_BODY)
+async def predict(file: UploadFile = Depends(series_upload)):
     if model is None:
         raise HTTPException(status_code=503, detail="Model not loaded on server")
-    
-    contents = await file.read()
-    zip_buffer = io.BytesIO(contents)
 
     try:
-        with tempfile.TemporaryDirectory() as tmpdir:
-            tmpdir = Path(tmpdir)
-            with zipfile.ZipFile(zip_buffer) as zf:
-                zf.extractall(tmpdir)
-
-            dicom_files = list(tmpdir.rglob("*dcm"))
-            if not dicom_files:
-                raise HTTPException(status_code=400, detail="No DICOM files in ZIP")
-            
-            # 1. Preprocess
-            slices = [pydicom.dcmread(f) for f in dicom_files]
-            slices.sort(key=lambda s: float(s.ImagePositionPatient[2]))
-            
-            spacing = np.array([
-                float(slices[0].SliceThickness),
-                float(slices[0].PixelSpacing[0]),
-                float(slices[0].PixelSpacing[1])
-            ])
-
-            volume = convert_to_hu(slices)
-            volume = resample_volume(volume, spacing)
-            volume = window_and_normalize(volume)
-
-            # 2. Predict
-            total_z = volume.shape[0]
-            predictions = np.zeros(volume.shape, dtype=np.float32)
-
-            with torch.no_grad():
-                for z in range(total_z):
-                    # Simple 2.5D context
-                    prev_idx = max(0, z-1)
-                    next_idx = min(total_z - 1, z+1)
-                    
-                    # Stack context
-                    img_stack = np.stack([volume[prev_idx], volume[z], volume[next_idx]], axis=0)
-                    
-                    # Resize to model input
-                    resized = np.stack([resize_image(img_stack[c], 256) for c in range(3)], axis=0)
-                    
-                    tensor = torch.from_numpy(resized).unsqueeze(0).to(device)
-                    output = model(tensor)
-                    pred = torch.sigmoid(output).squeeze().cpu().numpy()
-                    
-                    # Resize back (simplified for this update)
-                    pred_back = cv2.resize(pred, (volume.shape[2], volume.shape[1]), interpolation=cv2.INTER_NEAREST)
-                    predictions[z] = (pred_back > 0.5).astype(np.float32)
-
-            # 3. Format Overlays
-            tumor_slices = [z for z in range(total_z) if predictions[z].sum() > 10]
-            overlays = []
-            for z in tumor_slices:
-                ct_uint8 = (volume[z] * 255).astype(np.uint8)
-                ct_rgb = cv2.cvtColor(ct_uint8, cv2.COLOR_GRAY2BGR)
-                
-                overlay = ct_rgb.copy()
-                overlay[predictions[z] > 0.5] = [255, 0, 0] # Red
-                res = cv2.addWeighted(ct_rgb, 0.7, overlay, 0.3, 0)
-                
-                _, buf = cv2.imencode('.png', cv2.resize(res, (256, 256)))
-                overlays.append({
-                    "slice_index": z,
-                    "image_base64": base64.b64encode(buf).decode('utf-8'),
-                    "tumor_pixels": int(predictions[z].sum())
-                })
-
-            return {
-                "status": "success",
-                "total_slices": total_z,
-                "tumor_slices": len(tumor_slices),
-                "tumor_slice_ids": tumor_slices,
-                "total_tumor_volume": float(predictions.sum()),
-                "overlays": overlays
-            }
+        return await submit_blocking(run_prediction, file.file)
 
+    except HTTPException:
+        raise
+    except (zipfile.BadZipFile, InvalidSeriesError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Prediction Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/jobs", status_code=202, openapi_extra=UPLOAD_REQUEST_BODY)
+async def create_job(file: UploadFile = Depends(series_upload)):
+    if model is None:
+        raise HTTPException(status_code=503, detail="Model not loaded on server")
+
+    # The request's upload is closed once this handler returns, so the
+    # job gets its own spooled copy
+    upload = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MB * 1024**2)
+    await asyncio.to_thread(shutil.copyfileobj, file.file, upload)
+    upload.seek(0)
+
+    job = jobs.create()
+    try:
+        submit_blocking(run_job, job, upload)
+    except BaseException:
+        jobs.discard(job.id)
+        upload.close()
+        raise
+
+    return {
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events"
+    }
+
+
+def _get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = _get_job(job_id)
+    status = job.snapshot()
+    if job.result is not None:
+        status["result"] = {**job.result, "overlays": job.payloads("overlay")}
+    return status
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    job = _get_job(job_id)
+    return StreamingResponse(
+        job.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -5,6 +5,7 @@ DATA_DIR = BASE_DIR/'data'
 RAW_DATA_DIR = DATA_DIR/'raw'
 ANNOTATION_DIR = DATA_DIR/'annotations'
 MASK_DIR = DATA_DIR/'masks'
+CACHE_DIR = DATA_DIR/'cache'
 
 BATCH_SIZE = 2
 EPOCHS = 50
@@ -15,7 +16,18 @@ SEED = 42
 PATIENCE = 15
 GRAD_CLIP = 1.0
 NUM_WORKERS = 4
+PREP_WORKERS = 4
+# Threads per library in each DataLoader / prep worker (see src/runtime_config.py);
+# PIN_WORKERS also pins the training process to its own cores and gives every
+# DataLoader worker its own NUMA-local slice of the rest
+WORKER_THREADS = 1
+PIN_WORKERS = False
 MIN_TUMOR_PIXELS = 10
+# Stored encodings of the patient cache (see src/cache.py and
+# scripts/cache_encoding_report.py): "float32" | "float16" | "uint8"
+# volumes, "uint8" | "packbits" masks. Reads always decode to float32
+CACHE_VOLUME_ENCODING = "float32"
+CACHE_MASK_ENCODING = "uint8"
 
 WARMUP_EPOCHS = 5
 COSINE_EPOCHS = 45
@@ -23,7 +35,29 @@ COSINE_EPOCHS = 45
 IMG_SIZE = 256
 BG_RATIO = 2
 
+# Training-resolution tensor store (scripts/build_tensor_store.py):
+# pre-cropped, pre-resized 2.5D stacks per split, read instead of the cache
+USE_TENSOR_STORE = False
+TENSOR_STORE_DIR = CACHE_DIR/'tensor_store'
+TENSOR_STORE_DTYPE = "float16"   # "float16" | "uint8"
+
+# Sequential tar shards streamed by an IterableDataset (scripts/write_shards.py),
+# for training from read-only network / object-store mounts
+USE_SHARDS = False
+SHARD_DIR = DATA_DIR/'shards'
+SAMPLES_PER_SHARD = 2048
+SHUFFLE_BUFFER = 2048     # samples held by each DataLoader worker
+
 # Training settings
 REMOVE_EMPTY_SLICES = True
 BCE_WEIGHT = 0.5
-DICE_WEIGHT = 0.5
\ No newline at end of file
+DICE_WEIGHT = 0.5
+
+# Execution mode for training / validation (see src/execution.py)
+PRECISION = "auto"        # "auto" (fp16 on CUDA, fp32 on CPU) | "fp32" | "bf16" | "fp16"
+CHANNELS_LAST = True
+COMPILE_MODEL = False     # torch.compile the forward pass
+
+# Post-training INT8 quantization (scripts/quantize_model.py)
+QUANT_CALIB_BATCHES = 32
+QUANT_MAX_DICE_DROP = 0.01
@@ -0,0 +1,113 @@
+import argparse
+import itertools
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+import torch
+
+from src.execution import (
+    autocast_context,
+    inference_forward,
+    prepare_model,
+    to_input,
+)
+from src.losses import TverskyFocalLoss
+from src.model import LungAttentionUNet
+
+
+def bf16_supported():
+    """Whether this CPU has native bf16 kernels (AVX512-BF16 / AMX)."""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def images_per_sec(step, batch_size, repeats, warmup):
+    for _ in range(warmup):
+        step()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        step()
+    return batch_size * repeats / (time.perf_counter() - start)
+
+
+def bench_inference(precision, channels_last, compile, args):
+    model = prepare_model(
+        LungAttentionUNet(in_channels=3, out_channels=1).eval(), "cpu",
+        channels_last=channels_last, compile=compile
+    )
+    forward = inference_forward(model, "cpu", precision, channels_last)
+    batch = torch.rand(args.batch_size, 3, args.img_size, args.img_size)
+    return images_per_sec(lambda: forward(batch), args.batch_size,
+                          args.repeats, args.warmup)
+
+
+def bench_training(precision, channels_last, compile, args):
+    model = LungAttentionUNet(in_channels=3, out_channels=1).train()
+    model = prepare_model(model, "cpu", channels_last=channels_last)
+    run_model = prepare_model(model, "cpu", channels_last, compile=compile)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-4)
+    criterion = TverskyFocalLoss()
+
+    images = torch.rand(args.batch_size, 3, args.img_size, args.img_size)
+    masks  = (torch.rand(args.batch_size, 1, args.img_size, args.img_size) > 0.9).float()
+
+    def step():
+        optimizer.zero_grad(set_to_none=True)
+        with autocast_context("cpu", precision):
+            loss = criterion(run_model(to_input(images, "cpu", channels_last)).float(), masks)
+        loss.backward()
+        optimizer.step()
+
+    return images_per_sec(step, args.batch_size, args.repeats, args.warmup)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Images/sec of LungAttentionUNet per CPU execution mode."
+    )
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--img-size", type=int, default=256)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--precisions", nargs="+", default=["fp32", "bf16"],
+                        choices=["fp32", "bf16", "fp16"])
+    parser.add_argument("--compile", action="store_true",
+                        help="also benchmark torch.compile (slow first call)")
+    parser.add_argument("--train", action="store_true",
+                        help="also benchmark a training step")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    print(f"torch {torch.__version__} | threads {torch.get_num_threads()} | "
+          f"native bf16: {bf16_supported()}")
+    print(f"batch {args.batch_size} x 3 x {args.img_size} x {args.img_size}\n")
+
+    benches = [("inference", bench_inference)]
+    if args.train:
+        benches.append(("train", bench_training))
+
+    print(f"{'phase':<10} {'precision':<9} {'layout':<14} {'compile':<8} {'img/s':>8}")
+    for (phase, bench), precision, channels_last, compile in itertools.product(
+        benches, args.precisions, (False, True),
+        (False, True) if args.compile else (False,)
+    ):
+        layout = "channels_last" if channels_last else "contiguous"
+        try:
+            rate = bench(precision, channels_last, compile, args)
+            result = f"{rate:>8.1f}"
+        except Exception as e:
+            result = f"  failed: {type(e).__name__}: {e}"
+        print(f"{phase:<10} {precision:<9} {layout:<14} {str(compile):<8} {result}")
+
+
+if __name__ == "__main__":
+    main()
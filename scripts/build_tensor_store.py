@@ -0,0 +1,47 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+from configs.config import (
+    MASK_DIR, CACHE_DIR, VAL_SPLIT, SEED, IMG_SIZE,
+    TENSOR_STORE_DIR, TENSOR_STORE_DTYPE,
+)
+from src.tensor_store import STORE_DTYPES, build_tensor_store
+from src.train_dataset import split_patients
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Materialise the training cache at IMG_SIZE, one store per split."
+    )
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR)
+    parser.add_argument("--output-dir", type=Path, default=TENSOR_STORE_DIR)
+    parser.add_argument("--img-size", type=int, default=IMG_SIZE)
+    parser.add_argument("--dtype", choices=STORE_DTYPES, default=TENSOR_STORE_DTYPE)
+    args = parser.parse_args()
+
+    train_ids, val_ids = split_patients(MASK_DIR, VAL_SPLIT, SEED)
+
+    for split, ids in (("train", train_ids), ("val", val_ids)):
+        start = time.time()
+        print(f"\nBuilding {split} store ({len(ids)} patients)...")
+        manifest = build_tensor_store(
+            args.cache_dir, args.output_dir / split, ids,
+            img_size=args.img_size, dtype=args.dtype
+        )
+        nbytes = sum(
+            p.stat().st_size for p in (args.output_dir / split).glob("*.npy")
+        )
+        print(f"  {manifest['num_samples']} samples | {nbytes / 1e6:.1f} MB | "
+              f"{time.time() - start:.1f}s")
+
+    print(f"\nStores written to {args.output_dir} — set USE_TENSOR_STORE = True "
+          f"in configs/config.py to train from them")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import argparse
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+import numpy as np
+from torch.utils.data import DataLoader
+
+from configs.config import (
+    RAW_DATA_DIR, MASK_DIR, CACHE_DIR, VAL_SPLIT, SEED, IMG_SIZE,
+    MIN_TUMOR_PIXELS,
+)
+from src.cache import (
+    MASK_ENCODINGS,
+    VOLUME_ENCODINGS,
+    PatientCache,
+    decode_volume,
+    encode_volume,
+    has_patient_cache,
+    patient_cache_dir,
+    reencode_patient_cache,
+)
+from src.losses import mean_slice_dice
+from src.model_export import load_checkpoint_model
+from src.train_dataset import (
+    BalancedSliceSampler,
+    LungSegmentationDataset,
+    split_patients,
+)
+
+BYTES_PER_VOXEL = {"float32": 4.0, "float16": 2.0, "uint8": 1.0}
+
+
+def stored_bytes(shape, volume_encoding, mask_encoding):
+    """(volume, mask) bytes of a (Z, H, W) entry in the given encodings."""
+    z, h, w = shape
+    volume = z * h * w * BYTES_PER_VOXEL[volume_encoding]
+    mask = z * h * ((w + 7) // 8 if mask_encoding == "packbits" else w)
+    return int(volume), int(mask)
+
+
+def encoded_dice(model, cache_dir, patient_ids, volume_encoding, batch_size):
+    """Dice on `patient_ids` after a round trip through `volume_encoding`."""
+    with tempfile.TemporaryDirectory() as tmp:
+        for pid in patient_ids:
+            reencode_patient_cache(cache_dir, pid, volume_encoding,
+                                   "packbits", out_cache_dir=tmp)
+        dataset = LungSegmentationDataset(
+            RAW_DATA_DIR, MASK_DIR, patient_ids, img_size=IMG_SIZE,
+            augment=False, min_tumor_pixels=MIN_TUMOR_PIXELS, cache_dir=tmp
+        )
+        # Same background draw for every encoding
+        loader = DataLoader(
+            dataset, batch_size=batch_size,
+            sampler=BalancedSliceSampler(dataset, shuffle=False, seed=SEED)
+        )
+        return mean_slice_dice(model, loader)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Disk size, precision and Dice of each cache encoding"
+    )
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR)
+    parser.add_argument("--checkpoint", type=Path,
+                        default=PROJECT_ROOT / "checkpoints" / "best_model.pth")
+    parser.add_argument("--batch-size", type=int, default=8)
+    args = parser.parse_args()
+
+    headers = {
+        path.parent.name: json.loads(path.read_text())
+        for path in sorted(args.cache_dir.glob("patients/*/header.json"))
+    }
+    if not headers:
+        print(f"No consolidated cache entries in {args.cache_dir}")
+        sys.exit(1)
+
+    # Sizes are exact from the headers, for the whole cache
+    current = sum(
+        sum(stored_bytes(h["shape"], h.get("volume_encoding", "float32"),
+                         h.get("mask_encoding", "uint8")))
+        for h in headers.values()
+    )
+    sizes = {}
+    for volume_encoding in VOLUME_ENCODINGS:
+        for mask_encoding in MASK_ENCODINGS:
+            volume, mask = np.sum([
+                stored_bytes(h["shape"], volume_encoding, mask_encoding)
+                for h in headers.values()
+            ], axis=0)
+            sizes[f"{volume_encoding}/{mask_encoding}"] = {
+                "volume_bytes": int(volume), "mask_bytes": int(mask),
+            }
+
+    # Precision and Dice on the validation patients
+    _, val_ids = split_patients(MASK_DIR, VAL_SPLIT, SEED)
+    val_ids = [pid for pid in val_ids if has_patient_cache(args.cache_dir, pid)]
+
+    errors = {encoding: 0.0 for encoding in VOLUME_ENCODINGS}
+    for pid in val_ids:
+        cache  = PatientCache(patient_cache_dir(args.cache_dir, pid))
+        volume = cache.read_stack(slice(None), 0, None, 0, None)
+        for encoding in VOLUME_ENCODINGS:
+            decoded = decode_volume(encode_volume(volume, encoding))
+            errors[encoding] = max(errors[encoding],
+                                   float(np.abs(decoded - volume).max()))
+
+    dice = {}
+    if args.checkpoint.exists() and val_ids:
+        model, _ = load_checkpoint_model(args.checkpoint)
+        for encoding in VOLUME_ENCODINGS:
+            print(f"Scoring {encoding} volumes on {len(val_ids)} validation patients...")
+            dice[encoding] = encoded_dice(
+                model, args.cache_dir, val_ids, encoding, args.batch_size
+            )
+    else:
+        print(f"No checkpoint at {args.checkpoint} — skipping the Dice comparison")
+
+    source = sorted({h.get("volume_encoding", "float32") for h in headers.values()})
+    print(f"\n{len(headers)} cached patients, currently {current / 1e9:.2f} GB "
+          f"(volumes stored as {', '.join(source)})")
+    print(f"{'encoding':<18} {'volume GB':>10} {'mask GB':>8} {'total GB':>9} "
+          f"{'vs now':>7} {'max |err|':>10} {'Dice':>7} {'ΔDice':>8}")
+    for name, size in sizes.items():
+        volume_encoding = name.split("/")[0]
+        total = size["volume_bytes"] + size["mask_bytes"]
+        size["total_bytes"] = total
+        size["max_abs_error"] = errors[volume_encoding]
+        row = (f"{name:<18} {size['volume_bytes'] / 1e9:>10.2f} "
+               f"{size['mask_bytes'] / 1e9:>8.2f} {total / 1e9:>9.2f} "
+               f"{total / current:>6.0%} {errors[volume_encoding]:>10.1e}")
+        if volume_encoding in dice:
+            size["dice"] = dice[volume_encoding]
+            size["dice_delta"] = dice[volume_encoding] - dice["float32"]
+            row += f" {size['dice']:>7.4f} {size['dice_delta']:>+8.4f}"
+        print(row)
+
+    report = {
+        "cache_dir": str(args.cache_dir),
+        "patients": len(headers),
+        "current_bytes": current,
+        "validation_patients": val_ids,
+        "checkpoint": str(args.checkpoint) if dice else None,
+        "encodings": sizes,
+    }
+    out = args.cache_dir / "encoding_report.json"
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import argparse
+import shutil
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+from configs.config import (
+    CACHE_DIR, MIN_TUMOR_PIXELS,
+    CACHE_VOLUME_ENCODING, CACHE_MASK_ENCODING,
+)
+from src.cache import (
+    INDEX_NAME,
+    MASK_ENCODINGS,
+    VOLUME_ENCODINGS,
+    PatientCache,
+    convert_legacy_cache,
+    has_legacy_cache,
+    has_patient_cache,
+    legacy_cache_paths,
+    reencode_patient_cache,
+    write_patient_index,
+)
+
+
+def find_legacy_patients(cache_dir):
+    return sorted(
+        p.stem.replace('_bboxes', '')
+        for p in Path(cache_dir).glob('*_bboxes.npy')
+    )
+
+
+def backfill_indexes(cache_dir, min_tumor_pixels):
+    """Write index.json for consolidated entries created without one."""
+    for header in sorted(Path(cache_dir).glob('patients/*/header.json')):
+        entry_dir = header.parent
+        if (entry_dir / INDEX_NAME).exists():
+            continue
+        cache = PatientCache(entry_dir)
+        write_patient_index(entry_dir, cache.read_masks(), cache.bboxes, min_tumor_pixels)
+        print(f"  {entry_dir.name} — index written")
+
+
+def reencode_entries(cache_dir, volume_encoding, mask_encoding):
+    """Rewrite consolidated entries stored in other encodings."""
+    for header in sorted(Path(cache_dir).glob('patients/*/header.json')):
+        cache = PatientCache(header.parent)
+        current = (
+            cache.header.get("volume_encoding", "float32"),
+            cache.header.get("mask_encoding", "uint8"),
+        )
+        if current == (volume_encoding, mask_encoding):
+            continue
+        del cache
+        reencode_patient_cache(
+            cache_dir, header.parent.name, volume_encoding, mask_encoding
+        )
+        print(f"  {header.parent.name} — {current[0]}/{current[1]} → "
+              f"{volume_encoding}/{mask_encoding}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert per-slice .npy caches to the consolidated "
+                    "per-patient memmap layout."
+    )
+    parser.add_argument("--cache-dir", default=str(CACHE_DIR))
+    parser.add_argument("--min-tumor-pixels", type=int, default=MIN_TUMOR_PIXELS)
+    parser.add_argument(
+        "--remove-legacy", action="store_true",
+        help="delete the per-slice files after a successful conversion"
+    )
+    parser.add_argument("--volume-encoding", choices=VOLUME_ENCODINGS,
+                        default=CACHE_VOLUME_ENCODING)
+    parser.add_argument("--mask-encoding", choices=MASK_ENCODINGS,
+                        default=CACHE_MASK_ENCODING)
+    parser.add_argument(
+        "--reencode", action="store_true",
+        help="also rewrite consolidated entries stored in other encodings"
+    )
+    args = parser.parse_args()
+
+    cache_dir   = Path(args.cache_dir)
+    patient_ids = find_legacy_patients(cache_dir)
+    print(f"Legacy patients: {len(patient_ids)}")
+
+    for i, pid in enumerate(patient_ids):
+        prefix = f"  [{i+1}/{len(patient_ids)}] {pid}"
+
+        if not has_legacy_cache(cache_dir, pid):
+            print(f"{prefix} — incomplete legacy entry, skipping")
+            continue
+
+        if has_patient_cache(cache_dir, pid):
+            print(f"{prefix} — already converted")
+        else:
+            try:
+                header = convert_legacy_cache(
+                    cache_dir, pid, min_tumor_pixels=args.min_tumor_pixels,
+                    volume_encoding=args.volume_encoding,
+                    mask_encoding=args.mask_encoding
+                )
+            except Exception as e:
+                print(f"{prefix} — ERROR: {e}")
+                continue
+            print(f"{prefix} — {header['shape'][0]} slices converted")
+
+        if args.remove_legacy:
+            image_dir, mask_dir, bbox_path = legacy_cache_paths(cache_dir, pid)
+            shutil.rmtree(image_dir)
+            shutil.rmtree(mask_dir)
+            bbox_path.unlink()
+
+    backfill_indexes(cache_dir, args.min_tumor_pixels)
+
+    if args.reencode:
+        reencode_entries(cache_dir, args.volume_encoding, args.mask_encoding)
+
+    print("\n✅ Cache conversion finished!")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import argparse
 import sys
 from pathlib import Path
 
@@ -8,39 +9,54 @@ import torch
 import numpy as np
 from torch.utils.data import DataLoader
 
-from configs.config import RAW_DATA_DIR, MASK_DIR, BATCH_SIZE, VAL_SPLIT, SEED
-from src.train_dataset import LungSegmentationDataset
+from configs.config import RAW_DATA_DIR, MASK_DIR, CACHE_DIR, BATCH_SIZE, VAL_SPLIT, SEED
+from src.cache import load_patient_arrays
+from src.inference import INFERENCE_MODES, segment_volume
+from src.train_dataset import (
+    BalancedSliceSampler,
+    LungSegmentationDataset,
+    split_patients,
+)
 from src.model import LungAttentionUNet
-from sklearn.model_selection import train_test_split
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-def get_patient_ids(mask_dir):
-    mask_dir = Path(mask_dir)
-    return [
-        f.stem.replace('_mask', '')
-        for f in mask_dir.glob('*_mask.npy')
-    ]
-
-def split_patients(patient_ids, val_split, seed):
-    return train_test_split(
-        patient_ids,
-        test_size=val_split,
-        random_state=seed
-    )
-
 def dice_score(pred, target):
     pred = (pred > 0.5).float()
     intersection = (pred * target).sum()
     return (2. * intersection) / (pred.sum() + target.sum() + 1e-6)
 
-def main():
-    patient_ids = get_patient_ids(MASK_DIR)
-    _, val_ids = split_patients(patient_ids, VAL_SPLIT, SEED)
+def evaluate_volumes(model, val_ids, mode, options):
+    """
+    Whole-volume Dice per validation patient with the same
+    segment_volume inference the API runs.
+    """
+    dices = []
+    for pid in val_ids:
+        volume, mask = load_patient_arrays(CACHE_DIR, pid)
+        if volume is None:
+            print(f"  {pid} — not cached, skipped")
+            continue
 
-    val_dataset = LungSegmentationDataset(RAW_DATA_DIR, MASK_DIR, val_ids)
+        pred = segment_volume(model, volume, device, mode=mode, **options)
+        inter = np.logical_and(pred, mask).sum()
+        total = pred.sum() + mask.sum()
+        dices.append(1.0 if total == 0 else 2.0 * inter / total)
+        print(f"  {pid} — Dice {dices[-1]:.4f}")
+
+    print(f"\nFinal Volume Dice ({mode}): {np.mean(dices):.4f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate on the validation split")
+    parser.add_argument("--mode", choices=sorted(INFERENCE_MODES), default=None,
+                        help="whole-volume inference mode; default scores lung-crop slices")
+    parser.add_argument("--overlap", type=float, default=0.5,
+                        help="tile overlap for --mode tiled")
+    parser.add_argument("--triage-threshold", type=float, default=0.1,
+                        help="skip threshold for --mode cascade")
+    args = parser.parse_args()
 
-    val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False)
+    _, val_ids = split_patients(MASK_DIR, VAL_SPLIT, SEED)
 
     model = LungAttentionUNet(in_channels=3, out_channels=1).to(device)
 
@@ -58,6 +74,23 @@ def main():
 
     model.eval()
 
+    if args.mode is not None:
+        options = {
+            "tiled": {"overlap": args.overlap},
+            "cascade": {"triage_threshold": args.triage_threshold},
+        }.get(args.mode, {})
+        evaluate_volumes(model, val_ids, args.mode, options)
+        return
+
+    val_dataset = LungSegmentationDataset(
+        RAW_DATA_DIR, MASK_DIR, val_ids, cache_dir=CACHE_DIR
+    )
+
+    val_loader = DataLoader(
+        val_dataset, batch_size=BATCH_SIZE,
+        sampler=BalancedSliceSampler(val_dataset, shuffle=False, seed=SEED)
+    )
+
     dices = []
     with torch.no_grad():
         for images, masks in val_loader:
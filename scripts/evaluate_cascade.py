@@ -0,0 +1,176 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+import numpy as np
+import torch
+
+from configs.config import CACHE_DIR, MASK_DIR, MIN_TUMOR_PIXELS, SEED, VAL_SPLIT
+from src.cache import load_patient_arrays
+from src.inference import cascade_candidates, predict_volume, triage_scores
+from src.model_export import load_checkpoint_model
+from src.train_dataset import split_patients
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+DEFAULT_THRESHOLDS = [0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5]
+
+
+def dice(pred, target):
+    inter = np.logical_and(pred, target).sum()
+    total = pred.sum() + target.sum()
+    return 1.0 if total == 0 else float(2.0 * inter / total)
+
+
+def evaluate_patient(model, volume, mask, args):
+    """
+    One full pass and one triage pass; every threshold is then scored
+    from those two. On the slices it keeps, the cascade returns exactly
+    the full-pass output, so its prediction is the full prediction with
+    the skipped slices zeroed, and its cost is triage time plus the
+    full-pass time of the kept fraction.
+    """
+    t0 = time.perf_counter()
+    full = predict_volume(model, volume, device, batch_size=args.batch_size)
+    t_full = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    scores = triage_scores(
+        model, volume, device, size=args.triage_size,
+        batch_size=args.batch_size * 2
+    )
+    t_triage = time.perf_counter() - t0
+
+    total_z   = volume.shape[0]
+    gt_slices = mask.reshape(total_z, -1).sum(axis=1) >= MIN_TUMOR_PIXELS
+    fp_slices = full.reshape(total_z, -1).any(axis=1)
+
+    rows = []
+    for threshold in args.thresholds:
+        kept = np.zeros(total_z, dtype=bool)
+        kept[cascade_candidates(scores, threshold, args.neighbours)] = True
+        cascade = full * kept[:, None, None]
+
+        rows.append({
+            "threshold": threshold,
+            "kept_slices": int(kept.sum()),
+            "gt_tumor_slices": int(gt_slices.sum()),
+            "gt_tumor_slices_kept": int((gt_slices & kept).sum()),
+            "predicted_slices": int(fp_slices.sum()),
+            "predicted_slices_kept": int((fp_slices & kept).sum()),
+            "predicted_voxels": int(full.sum()),
+            "predicted_voxels_kept": int(cascade.sum()),
+            "dice_full": dice(full, mask),
+            "dice_cascade": dice(cascade, mask),
+            "time_cascade_est": t_triage + t_full * kept.sum() / max(total_z, 1),
+        })
+
+    return {
+        "slices": total_z,
+        "time_full": t_full,
+        "time_triage": t_triage,
+        "thresholds": rows,
+    }
+
+
+def summarize(patients, thresholds):
+    """Pool per-patient rows into one line per threshold."""
+    time_full = sum(p["time_full"] for p in patients.values())
+    slices    = sum(p["slices"] for p in patients.values())
+    summary = []
+    for i, threshold in enumerate(thresholds):
+        rows = [p["thresholds"][i] for p in patients.values()]
+
+        def ratio(num, den):
+            den = sum(r[den] for r in rows)
+            return 1.0 if den == 0 else sum(r[num] for r in rows) / den
+
+        time_cascade = sum(r["time_cascade_est"] for r in rows)
+        summary.append({
+            "threshold": threshold,
+            "slices_kept": sum(r["kept_slices"] for r in rows) / max(slices, 1),
+            "gt_slice_recall": ratio("gt_tumor_slices_kept", "gt_tumor_slices"),
+            "pred_slice_recall": ratio("predicted_slices_kept", "predicted_slices"),
+            "pred_voxel_recall": ratio("predicted_voxels_kept", "predicted_voxels"),
+            "mean_dice_full": float(np.mean([r["dice_full"] for r in rows])),
+            "mean_dice_cascade": float(np.mean([r["dice_cascade"] for r in rows])),
+            "est_speedup": time_full / time_cascade if time_cascade else 0.0,
+        })
+    return summary
+
+
+def print_summary(summary):
+    print(f"\n{'thresh':>7} {'kept':>6} {'GT rec':>7} {'pred rec':>9} "
+          f"{'vox rec':>8} {'Dice full':>10} {'Dice casc':>10} {'speedup':>8}")
+    for s in summary:
+        print(f"{s['threshold']:>7.3f} {s['slices_kept']:>6.1%} "
+              f"{s['gt_slice_recall']:>7.1%} {s['pred_slice_recall']:>9.1%} "
+              f"{s['pred_voxel_recall']:>8.1%} {s['mean_dice_full']:>10.4f} "
+              f"{s['mean_dice_cascade']:>10.4f} {s['est_speedup']:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Recall cost vs speedup of cascade inference on the validation split"
+    )
+    parser.add_argument("--checkpoint", type=Path,
+                        default=PROJECT_ROOT / "checkpoints" / "best_model.pth")
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR)
+    parser.add_argument("--thresholds", type=float, nargs="+",
+                        default=DEFAULT_THRESHOLDS)
+    parser.add_argument("--triage-size", type=int, default=128)
+    parser.add_argument("--neighbours", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--max-patients", type=int, default=None)
+    parser.add_argument("--output", type=Path, default=None,
+                        help="report path (default: <cache-dir>/cascade_report.json)")
+    args = parser.parse_args()
+
+    if not args.checkpoint.exists():
+        print(f"No checkpoint found at {args.checkpoint}")
+        return
+
+    model, _   = load_checkpoint_model(args.checkpoint, device)
+    _, val_ids = split_patients(MASK_DIR, VAL_SPLIT, SEED)
+    val_ids    = val_ids[:args.max_patients]
+    print(f"Validation patients: {len(val_ids)}")
+
+    patients = {}
+    for pid in val_ids:
+        volume, mask = load_patient_arrays(args.cache_dir, pid)
+        if volume is None:
+            print(f"  {pid} — not cached, skipped")
+            continue
+        patients[pid] = evaluate_patient(model, volume, mask, args)
+        p = patients[pid]
+        print(f"  {pid} — {p['slices']} slices, full {p['time_full']:.1f}s, "
+              f"triage {p['time_triage']:.1f}s")
+
+    if not patients:
+        print("No cached validation patients found")
+        return
+
+    summary = summarize(patients, args.thresholds)
+    print_summary(summary)
+
+    report = {
+        "device": str(device),
+        "triage_size": args.triage_size,
+        "neighbours": args.neighbours,
+        "min_tumor_pixels": MIN_TUMOR_PIXELS,
+        "summary": summary,
+        "patients": patients,
+    }
+    output = args.output or args.cache_dir / "cascade_report.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+from src.model_export import (
+    ARTIFACT_NAMES,
+    EXPORT_FORMATS,
+    check_parity,
+    export_onnx,
+    export_torchscript,
+    load_checkpoint_model,
+    load_exported_model,
+)
+from src.volume_cache import file_fingerprint
+
+MANIFEST_NAME = "export_manifest.json"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export LungAttentionUNet to TorchScript / ONNX and check parity"
+    )
+    parser.add_argument("--checkpoint", type=Path,
+                        default=PROJECT_ROOT / "checkpoints" / "best_model.pth")
+    parser.add_argument("--output-dir", type=Path,
+                        default=PROJECT_ROOT / "exports")
+    parser.add_argument("--formats", nargs="+", choices=EXPORT_FORMATS,
+                        default=list(EXPORT_FORMATS))
+    parser.add_argument("--img-size", type=int, default=256)
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--atol", type=float, default=1e-4,
+                        help="max |exported - eager| logit difference allowed")
+    args = parser.parse_args()
+
+    if not args.checkpoint.exists():
+        print(f"No checkpoint found at {args.checkpoint}")
+        sys.exit(1)
+
+    model, checkpoint = load_checkpoint_model(args.checkpoint)
+    epoch = checkpoint.get('epoch') if isinstance(checkpoint, dict) else None
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = {
+        "checkpoint": str(args.checkpoint),
+        "checkpoint_fingerprint": file_fingerprint(args.checkpoint),
+        "epoch": epoch,
+        "img_size": args.img_size,
+        "artifacts": {},
+    }
+
+    failed = []
+    for fmt in args.formats:
+        path = args.output_dir / ARTIFACT_NAMES[fmt]
+        print(f"\nExporting {fmt} → {path}")
+        if fmt == "torchscript":
+            export_torchscript(model, path, args.img_size)
+        else:
+            export_onnx(model, path, args.img_size, args.opset)
+
+        parity = check_parity(
+            model, load_exported_model(fmt, path), atol=args.atol
+        )
+        status = "OK" if parity["passed"] else "FAILED"
+        print(f"  parity {status}: max |diff| {parity['max_abs_diff']:.2e} "
+              f"(atol {args.atol:.0e}, {len(parity['cases'])} shapes)")
+
+        if not parity["passed"]:
+            # Never leave an artifact behind that disagrees with the model
+            path.unlink(missing_ok=True)
+            failed.append(fmt)
+            continue
+
+        manifest["artifacts"][fmt] = {
+            "path": path.name,
+            "fingerprint": file_fingerprint(path),
+            "parity": parity,
+        }
+
+    with open(args.output_dir / MANIFEST_NAME, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"\nManifest written to {args.output_dir / MANIFEST_NAME}")
+
+    if failed:
+        print(f"Parity check failed for: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
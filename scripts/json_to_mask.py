@@ -9,17 +9,15 @@ PROJECT_ROOT = Path(__file__).resolve().parent.parent
 sys.path.append(str(PROJECT_ROOT))
 
 from configs.config import RAW_DATA_DIR, ANNOTATION_DIR, MASK_DIR
-import pydicom
+from src.dicom_io import read_series_headers, series_spacing
 
 def load_dicom_slices(series_dir):
-    """Load and sort DICOM slices by z position"""
-    dicom_files = sorted(
-        Path(series_dir).rglob("*.dcm"),
-        key=lambda f: float(pydicom.dcmread(f).ImagePositionPatient[2])
-    )
+    """Load slice headers (no pixel data) sorted by z position"""
+    dicom_files = list(Path(series_dir).rglob("*.dcm"))
     if not dicom_files:
         raise RuntimeError(f"No DICOM files in {series_dir}")
-    return [pydicom.dcmread(f) for f in dicom_files]
+    _, headers = read_series_headers(dicom_files)
+    return headers
 
 def build_sop_uid_map(slices):
     """Map SOPInstanceUID → slice index"""
@@ -82,13 +80,7 @@ def build_mask_from_json(json_path, series_dir):
     tumor_slices = np.sum(mask_volume.sum(axis=(1,2)) > 0)
     print(f"  Tumor slices found: {tumor_slices}/{n_slices}")
 
-    pixel_spacing   = tuple(map(float, slices[0].PixelSpacing))
-    slice_thickness = float(slices[0].SliceThickness)
-    spacing = np.array([
-        slice_thickness,
-        pixel_spacing[0],
-        pixel_spacing[1]
-    ])
+    spacing = series_spacing(slices)
     from src.preprocessing import resample_mask
     mask_resampled = resample_mask(mask_volume, spacing)
 
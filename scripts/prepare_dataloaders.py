@@ -1,133 +1,220 @@
+import argparse
+import json
+import shutil
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 import numpy as np
-import pydicom
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 sys.path.append(str(PROJECT_ROOT))
 
-from configs.config import RAW_DATA_DIR, MASK_DIR
+from configs.config import (
+    RAW_DATA_DIR, MASK_DIR, CACHE_DIR,
+    MIN_TUMOR_PIXELS, PREP_WORKERS,
+    CACHE_VOLUME_ENCODING, CACHE_MASK_ENCODING
+)
+from src.runtime_config import available_cpus, init_process_threads
+from src.cache import (
+    commit_patient_cache,
+    create_staging_dir,
+    has_legacy_cache,
+    has_patient_cache,
+    remove_staging_dirs,
+    write_patient_cache,
+)
+from src.dicom_io import load_series_dir, series_spacing
 from src.preprocessing import (
     convert_to_hu,
     resample_volume,
     resample_mask,
     window_and_normalize,
-    get_lung_bbox,
+    get_lung_bboxes,
+    verify_image_mask_alignment,
 )
 
+DECODE_WORKERS = 4
 
-def main():
-    raw_dir   = Path(RAW_DATA_DIR)
-    mask_dir  = Path(MASK_DIR)
-    cache_dir = Path("data/cache")
-    cache_dir.mkdir(parents=True, exist_ok=True)
-
-    patient_ids = [
-        f.stem.replace('_mask', '')
-        for f in mask_dir.glob('*_mask.npy')
-    ]
-
-    print(f"Total patients: {len(patient_ids)}")
-
-    for i, pid in enumerate(patient_ids):
-        pid_cache_dir = cache_dir / pid
-        mask_cache_dir = cache_dir / f"{pid}_masks"
-        bbox_path     = cache_dir / f"{pid}_bboxes.npy"
 
-        print(f"Checking {pid}: cache {pid_cache_dir.exists()}, masks {mask_cache_dir.exists()}, bbox {bbox_path.exists()}")
+def process_patient(pid, raw_dir, mask_dir, cache_dir, decode_workers=0):
+    """
+    Preprocess one patient into a staging directory and rename it into
+    the cache only once everything is on disk.
 
-        # ✅ Skip if already done
-        if pid_cache_dir.exists() and mask_cache_dir.exists() and bbox_path.exists():
-            print(f"  [{i+1}/{len(patient_ids)}] "
-                  f"{pid} — skipping")
-            continue
+    Runs in a worker process; never raises — returns a result dict with
+    status "done", "skipped" or "failed" (plus the failing stage).
+    """
+    start = time.time()
+    stage = "find_series"
+    staging_dir = None
 
-        pid_cache_dir.mkdir(parents=True, exist_ok=True)
-        mask_cache_dir.mkdir(parents=True, exist_ok=True)
-
-        patient_dir = raw_dir / pid
+    try:
+        patient_dir = Path(raw_dir) / pid
         series_dirs = [
             d for d in patient_dir.iterdir()
             if d.is_dir()
         ]
         if not series_dirs:
-            continue
-
-        try:
-            series_dir  = series_dirs[0]
-            
-            def get_slice_pos(f):
-                ds = pydicom.dcmread(f)
-                if hasattr(ds, 'ImagePositionPatient'):
-                    return float(ds.ImagePositionPatient[2])
-                return float(getattr(ds, 'InstanceNumber', 0))
-
-            dicom_files = sorted(
-                series_dir.rglob("*.dcm"),
-                key=get_slice_pos
-            )
-            slices = [pydicom.dcmread(f) for f in dicom_files]
-
-       
-            pixel_spacing   = tuple(map(float,
-                                slices[0].PixelSpacing))
-            slice_thickness = float(slices[0].SliceThickness)
-            spacing = np.array([
-                slice_thickness,
-                pixel_spacing[0],
-                pixel_spacing[1]
-            ])
-
-            
-            volume = convert_to_hu(slices)
-            volume = resample_volume(volume, spacing)
-            volume = window_and_normalize(volume)
-
-            # Resample mask to match volume
-            mask_path = mask_dir / f"{pid}_mask.npy"
-            raw_mask = np.load(mask_path)
-            resampled_mask = resample_mask(raw_mask, spacing)
-
-            if volume.shape[0] != resampled_mask.shape[0]:
-                print(f"  [WARNING] Shape mismatch for {pid}: "
-                      f"Img {volume.shape} vs Mask {resampled_mask.shape}")
-
-            print(f"  [{i+1}/{len(patient_ids)}] {pid} — "
-                  f"saving {volume.shape[0]} slices...")
-
-            bboxes = np.zeros(
-                (volume.shape[0], 4), dtype=np.int32
+            return {"pid": pid, "status": "skipped",
+                    "reason": "no series directory"}
+
+        stage = "load_dicom"
+        pixels, slices = load_series_dir(
+            series_dirs[0], num_workers=decode_workers
+        )
+        spacing = series_spacing(slices)
+
+        stage = "preprocess_volume"
+        volume = convert_to_hu(slices, pixels)
+        del pixels, slices
+        volume = resample_volume(volume, spacing)
+        volume = window_and_normalize(volume, inplace=True)
+
+        # Resample mask to match volume
+        stage = "preprocess_mask"
+        raw_mask = np.load(Path(mask_dir) / f"{pid}_mask.npy")
+        resampled_mask = resample_mask(raw_mask, spacing)
+
+        if volume.shape != resampled_mask.shape:
+            print(f"  [WARNING] Shape mismatch for {pid}: "
+                  f"Img {volume.shape} vs Mask {resampled_mask.shape}")
+            volume, resampled_mask = verify_image_mask_alignment(
+                volume, resampled_mask
             )
 
-            for z in range(volume.shape[0]):
-                # Save Image slice
-                slice_path = pid_cache_dir / f"{z:04d}.npy"
-                np.save(slice_path, volume[z])
-
-                # Save Mask slice
-                mask_slice_path = mask_cache_dir / f"{z:04d}.npy"
-                np.save(mask_slice_path, resampled_mask[z])
+        stage = "lung_bbox"
+        bboxes, bbox_3d, _ = get_lung_bboxes(volume)
+
+        stage = "write_cache"
+        staging_dir = create_staging_dir(cache_dir, pid)
+        write_patient_cache(
+            staging_dir,
+            volume,
+            resampled_mask,
+            bboxes,
+            min_tumor_pixels=MIN_TUMOR_PIXELS,
+            bbox_3d=bbox_3d,
+            volume_encoding=CACHE_VOLUME_ENCODING,
+            mask_encoding=CACHE_MASK_ENCODING,
+            patient_id=pid,
+            spacing=spacing.tolist(),
+        )
+
+        stage = "commit"
+        commit_patient_cache(staging_dir, cache_dir, pid)
+
+        return {"pid": pid, "status": "done",
+                "slices": int(volume.shape[0]),
+                "seconds": round(time.time() - start, 1)}
+
+    except Exception as e:
+        if staging_dir is not None:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        return {"pid": pid, "status": "failed", "stage": stage,
+                "error": f"{type(e).__name__}: {e}",
+                "seconds": round(time.time() - start, 1)}
+
+
+def print_summary(results, cache_dir):
+    counts = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+
+    print("\n━━━━━━━━━━━━ Cache summary ━━━━━━━━━━━━")
+    for status in ("done", "cached", "skipped", "failed"):
+        print(f"  {status:<8}: {counts.get(status, 0)}")
+
+    failures = [r for r in results if r["status"] == "failed"]
+    if failures:
+        print("\n  Failures:")
+        for r in sorted(failures, key=lambda r: r["pid"]):
+            print(f"    {r['pid']:<16} [{r['stage']}] {r['error']}")
+
+    report_path = Path(cache_dir) / "prepare_report.json"
+    with open(report_path, "w") as f:
+        json.dump({"counts": counts, "results": results}, f, indent=2)
+    print(f"\n  Report written to {report_path}")
 
-                y_min, y_max, x_min, x_max = get_lung_bbox(
-                    volume[z]
-                )
-                bboxes[z] = [y_min, y_max, x_min, x_max]
 
-        
-            np.save(bbox_path, bboxes)
-
-            print(f"  [{i+1}/{len(patient_ids)}] {pid} — "
-                  f"done!")
+def main():
+    parser = argparse.ArgumentParser(
+        description="Preprocess LIDC patients into the training cache."
+    )
+    parser.add_argument(
+        "--workers", type=int, default=PREP_WORKERS,
+        help="patients processed in parallel (1 = in this process)"
+    )
+    args = parser.parse_args()
 
-            del volume, resampled_mask, slices, bboxes
+    raw_dir   = Path(RAW_DATA_DIR)
+    mask_dir  = Path(MASK_DIR)
+    cache_dir = Path(CACHE_DIR)
+    cache_dir.mkdir(parents=True, exist_ok=True)
 
-        except Exception as e:
-            print(f"  [{i+1}/{len(patient_ids)}] "
-                  f"{pid} — ERROR: {e}")
-            continue
+    stale = remove_staging_dirs(cache_dir)
+    if stale:
+        print(f"Removed {stale} unfinished staging directories")
 
-    print("\n✅ All patients cached by slice!")
+    patient_ids = sorted(
+        f.stem.replace('_mask', '')
+        for f in mask_dir.glob('*_mask.npy')
+    )
+
+    # ✅ Skip only entries that were committed completely
+    results = []
+    todo    = []
+    for pid in patient_ids:
+        if has_patient_cache(cache_dir, pid) or has_legacy_cache(cache_dir, pid):
+            results.append({"pid": pid, "status": "cached"})
+        else:
+            todo.append(pid)
+
+    print(f"Total patients: {len(patient_ids)} | "
+          f"cached: {len(results)} | to process: {len(todo)}")
+
+    def report(n, result):
+        detail = (f"{result['slices']} slices in {result['seconds']}s"
+                  if result["status"] == "done"
+                  else result.get("error") or result.get("reason"))
+        print(f"  [{n}/{len(todo)}] {result['pid']} — "
+              f"{result['status']}: {detail}")
+
+    if args.workers <= 1:
+        for n, pid in enumerate(todo, start=1):
+            result = process_patient(
+                pid, raw_dir, mask_dir, cache_dir, DECODE_WORKERS
+            )
+            results.append(result)
+            report(n, result)
+    else:
+        # Each worker resamples with its share of the cores, not all of them
+        threads = max(1, len(available_cpus()) // args.workers)
+        with ProcessPoolExecutor(
+            max_workers=args.workers,
+            initializer=init_process_threads,
+            initargs=(threads,)
+        ) as pool:
+            futures = {
+                pool.submit(process_patient, pid, raw_dir, mask_dir, cache_dir): pid
+                for pid in todo
+            }
+            for n, future in enumerate(as_completed(futures), start=1):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # The worker died (OOM kill → BrokenProcessPool fails
+                    # every pending patient); its staging directory is
+                    # removed by the next run
+                    result = {"pid": futures[future], "status": "failed",
+                              "stage": "worker",
+                              "error": f"{type(e).__name__}: {e}",
+                              "seconds": 0.0}
+                results.append(result)
+                report(n, result)
+
+    print_summary(results, cache_dir)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
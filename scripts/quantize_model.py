@@ -0,0 +1,145 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+import torch
+from torch.utils.data import DataLoader
+
+from configs.config import (
+    RAW_DATA_DIR, MASK_DIR, CACHE_DIR, VAL_SPLIT, SEED,
+    QUANT_CALIB_BATCHES, QUANT_MAX_DICE_DROP,
+)
+from src.losses import mean_slice_dice
+from src.model_export import ARTIFACT_NAMES, load_checkpoint_model
+from src.quantization import (
+    quantize_static_fx,
+    serialized_nbytes,
+    throughput,
+    to_torchscript,
+)
+from src.train_dataset import (
+    BalancedSliceSampler,
+    LungSegmentationDataset,
+    split_patients,
+)
+from src.volume_cache import file_fingerprint
+
+
+def calibration_batches(train_ids, num_batches, batch_size):
+    """Lung-crop 2.5D stacks from the training patients, as the model saw them."""
+    dataset = LungSegmentationDataset(
+        RAW_DATA_DIR, MASK_DIR, train_ids, augment=False, cache_dir=CACHE_DIR
+    )
+    loader = DataLoader(
+        dataset, batch_size=batch_size,
+        sampler=BalancedSliceSampler(dataset, seed=SEED)
+    )
+    batches = []
+    for images, _ in loader:
+        batches.append(images)
+        if len(batches) >= num_batches:
+            break
+    return batches
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="INT8 post-training quantization with a Dice gate"
+    )
+    parser.add_argument("--checkpoint", type=Path,
+                        default=PROJECT_ROOT / "checkpoints" / "best_model.pth")
+    parser.add_argument("--output-dir", type=Path,
+                        default=PROJECT_ROOT / "exports")
+    parser.add_argument("--calib-batches", type=int, default=QUANT_CALIB_BATCHES)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-dice-drop", type=float, default=QUANT_MAX_DICE_DROP,
+                        help="refuse to write the artifact if Dice drops more than this")
+    parser.add_argument("--backend", choices=["x86", "fbgemm", "qnnpack", "onednn"],
+                        default="x86")
+    args = parser.parse_args()
+
+    if not args.checkpoint.exists():
+        print(f"No checkpoint found at {args.checkpoint}")
+        sys.exit(1)
+
+    torch.manual_seed(SEED)
+
+    model, checkpoint = load_checkpoint_model(args.checkpoint)
+    train_ids, val_ids = split_patients(MASK_DIR, VAL_SPLIT, SEED)
+
+    print("Collecting calibration slices...")
+    batches = calibration_batches(train_ids, args.calib_batches, args.batch_size)
+    if not batches:
+        print("No calibration slices found")
+        sys.exit(1)
+
+    print(f"Calibrating on {sum(len(b) for b in batches)} slices...")
+    quantized = quantize_static_fx(model, batches, backend=args.backend)
+    scripted  = to_torchscript(quantized)
+
+    print("Scoring on validation patients...")
+    val_dataset = LungSegmentationDataset(
+        RAW_DATA_DIR, MASK_DIR, val_ids, augment=False, cache_dir=CACHE_DIR
+    )
+    val_sampler = BalancedSliceSampler(val_dataset, shuffle=False, seed=SEED)
+    val_loader  = DataLoader(
+        val_dataset, batch_size=args.batch_size, sampler=val_sampler
+    )
+    dice_float = mean_slice_dice(model, val_loader)
+    dice_int8  = mean_slice_dice(scripted, val_loader)
+    dice_drop  = dice_float - dice_int8
+
+    bench = batches[0]
+    float_scripted = to_torchscript(model)
+    report = {
+        "checkpoint": str(args.checkpoint),
+        "checkpoint_fingerprint": file_fingerprint(args.checkpoint),
+        "epoch": checkpoint.get('epoch') if isinstance(checkpoint, dict) else None,
+        "backend": args.backend,
+        "calibration_slices": sum(len(b) for b in batches),
+        "validation_slices": len(val_sampler),
+        "dice_float": dice_float,
+        "dice_int8": dice_int8,
+        "dice_drop": dice_drop,
+        "max_dice_drop": args.max_dice_drop,
+        "images_per_sec_float": throughput(model, bench),
+        "images_per_sec_int8": throughput(scripted, bench),
+        "model_bytes_float": serialized_nbytes(float_scripted),
+        "model_bytes_int8": serialized_nbytes(scripted),
+        "torch_threads": torch.get_num_threads(),
+    }
+    report["accepted"] = dice_drop <= args.max_dice_drop
+
+    print(f"\nDice float {dice_float:.4f} | int8 {dice_int8:.4f} | "
+          f"drop {dice_drop:+.4f} (max {args.max_dice_drop:.4f})")
+    print(f"Throughput float {report['images_per_sec_float']:.1f} img/s | "
+          f"int8 {report['images_per_sec_int8']:.1f} img/s")
+    print(f"Model size float {report['model_bytes_float'] / 1e6:.1f} MB | "
+          f"int8 {report['model_bytes_int8'] / 1e6:.1f} MB")
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    artifact = args.output_dir / ARTIFACT_NAMES["int8"]
+    if report["accepted"]:
+        torch.jit.save(scripted, str(artifact))
+        report["artifact"] = artifact.name
+        report["artifact_fingerprint"] = file_fingerprint(artifact)
+        print(f"INT8 model written to {artifact}")
+    else:
+        # A stale artifact from an earlier run must not be served either
+        artifact.unlink(missing_ok=True)
+        print("Dice drop exceeds the limit — no artifact written")
+
+    with open(args.output_dir / "quantization_report.json", "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output_dir / 'quantization_report.json'}")
+
+    if not report["accepted"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
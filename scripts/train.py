@@ -10,26 +10,51 @@ import numpy as np
 import matplotlib.pyplot as plt
 from torch.optim import Adam
 from torch.utils.data import DataLoader
-from torch.amp import autocast, GradScaler
+from torch.amp import GradScaler
 from torch.optim.lr_scheduler import LinearLR, CosineAnnealingLR, SequentialLR
 from tqdm import tqdm
-from sklearn.model_selection import train_test_split
 
 from configs.config import (
-    RAW_DATA_DIR, MASK_DIR,
+    RAW_DATA_DIR, MASK_DIR, CACHE_DIR,
     BATCH_SIZE, LR, EPOCHS,
     VAL_SPLIT, SEED, IMG_SIZE,
-    NUM_WORKERS
+    NUM_WORKERS, WORKER_THREADS, PIN_WORKERS,
+    PRECISION, CHANNELS_LAST, COMPILE_MODEL,
+    USE_TENSOR_STORE, TENSOR_STORE_DIR,
+    USE_SHARDS, SHARD_DIR, SHUFFLE_BUFFER
+)
+from src.augment import augment_batch
+from src.execution import (
+    autocast_context,
+    needs_grad_scaler,
+    prepare_model,
+    to_input,
+)
+from src.runtime_config import (
+    apply_runtime_config,
+    available_cpus,
+    loader_worker_init,
+    reserve_cpus,
+    thread_budget,
+)
+from src.shards import ShardedSliceDataset
+from src.tensor_store import has_tensor_store
+from src.train_dataset import (
+    BalancedSliceSampler,
+    LungSegmentationDataset,
+    split_patients,
 )
-from src.train_dataset import LungSegmentationDataset
 from src.model import LungAttentionUNet
 from src.losses import TverskyFocalLoss, dice_score
 
 # Train one epoch
-def train_one_epoch(model, loader, optimizer, criterion, device, scaler):
+def train_one_epoch(model, loader, optimizer, criterion, device, scaler,
+                    augment=True):
     model.train()
     total_loss = 0
     total_dice = 0
+    # Counted, not len(loader): a streamed epoch's length is only expected
+    num_batches = 0
 
     progress_bar = tqdm(loader, desc="Training", leave=False)
 
@@ -37,35 +62,36 @@ def train_one_epoch(model, loader, optimizer, criterion, device, scaler):
 
         optimizer.zero_grad(set_to_none=True)
 
-        images = images.to(device, memory_format= torch.channels_last, non_blocking=True)
+        images = images.to(device, non_blocking=True)
         masks = masks.to(device, non_blocking=True)
-
-        device_type = "cuda" if "cuda" in str(device) else "cpu"
-        with autocast(device_type=device_type, enabled=(device_type == "cuda")):
-            outputs = model(images)
+        if augment:
+            # Whole batch at once, on the training device
+            images, masks = augment_batch(images, masks)
+        images = to_input(images, device, CHANNELS_LAST)
+
+        with autocast_context(device, PRECISION):
+            # Loss in fp32 whatever precision the forward pass ran in
+            outputs = model(images).float()
             loss = criterion(outputs, masks)
 
-        if device_type == "cuda":
-            scaler.scale(loss).backward()
-            scaler.unscale_(optimizer)
-            torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
-            scaler.step(optimizer)
-            scaler.update()
-        else:
-            loss.backward()
-            torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
-            optimizer.step()
+        # A disabled scaler (fp32 / bf16) passes straight through
+        scaler.scale(loss).backward()
+        scaler.unscale_(optimizer)
+        torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
+        scaler.step(optimizer)
+        scaler.update()
 
         batch_dice = dice_score(outputs, masks)
         total_loss += loss.item()
         total_dice += batch_dice
+        num_batches += 1
 
         progress_bar.set_postfix(
             loss=f"{loss.item():.4f}",
             dice=f"{batch_dice:.4f}"
         )
 
-    n = len(loader)
+    n = max(num_batches, 1)
     return total_loss/n, total_dice/n
 
 # Validation
@@ -77,14 +103,13 @@ def validate(model, loader, criterion, device):
 
     progress_bar = tqdm(loader, desc="Validation", leave=False)
 
-    device_type = "cuda" if "cuda" in str(device) else "cpu"
     with torch.no_grad():
         for images, masks in progress_bar:
-            images = images.to(device, memory_format= torch.channels_last, non_blocking=True)
+            images = to_input(images, device, CHANNELS_LAST)
             masks = masks.to(device, non_blocking=True)
 
-            with autocast(device_type=device_type, enabled=(device_type == "cuda")):
-                outputs = model(images)
+            with autocast_context(device, PRECISION):
+                outputs = model(images).float()
                 loss = criterion(outputs, masks)
 
             batch_size = images.size(0)
@@ -109,79 +134,132 @@ def main():
     if device.type == "cuda":
         torch.backends.cudnn.benchmark = True
 
-    scaler = GradScaler(enabled=(device.type == "cuda"))
+    # Leave the DataLoader workers their cores instead of letting the
+    # main process's pools claim every one of them; when pinning, the
+    # main process keeps its own cores and workers split the rest
+    main_cpus, worker_cpus = reserve_cpus(
+        len(available_cpus()) - NUM_WORKERS * WORKER_THREADS
+    )
+    runtime = apply_runtime_config(
+        thread_budget(len(main_cpus)),
+        affinity=main_cpus if PIN_WORKERS else None
+    )
+    print(f"Threads: {runtime['threads']} | workers: {NUM_WORKERS} x "
+          f"{WORKER_THREADS} | pinned: {PIN_WORKERS}")
+
+    scaler = GradScaler(enabled=needs_grad_scaler(device, PRECISION))
+    print(f"Precision: {PRECISION} | channels_last: {CHANNELS_LAST} | "
+          f"torch.compile: {COMPILE_MODEL}")
 
     # Patients
-    mask_dir    = Path(MASK_DIR)
-    patient_ids = [
-    f.stem.replace('_mask', '')
-    for f in mask_dir.glob('*_mask.npy')
-]
-
-    train_ids, val_ids = train_test_split(
-        patient_ids,
-        test_size=VAL_SPLIT,
-        random_state=SEED
-)
+    train_ids, val_ids = split_patients(MASK_DIR, VAL_SPLIT, SEED)
 
-    print(f"Total patients : {len(patient_ids)}")
+    print(f"Total patients : {len(train_ids) + len(val_ids)}")
     print(f"Train patients : {len(train_ids)}")
     print(f"Val patients   : {len(val_ids)}")
 
     print("Train patients:", train_ids)
     print("Val patients:", val_ids)
 
+    # Pre-resized samples, if scripts/build_tensor_store.py has been run
+    store_dirs = {}
+    if USE_TENSOR_STORE:
+        for split in ("train", "val"):
+            path = Path(TENSOR_STORE_DIR) / split
+            if has_tensor_store(path):
+                store_dirs[split] = path
+            else:
+                print(f"No tensor store at {path}, reading the cache")
+
     # Datasets 
-    print("Creating train dataset...")
-    train_dataset = LungSegmentationDataset(
-        RAW_DATA_DIR, 
-        MASK_DIR, 
-        train_ids,
-        img_size=IMG_SIZE,
-        augment=True,
-        min_tumor_pixels=10,
-        bg_ratio=2
-        )
-    print("Train dataset created")
-
-    print("Creating val dataset...")
-    val_dataset = LungSegmentationDataset(
-        RAW_DATA_DIR, 
-        MASK_DIR, 
-        val_ids,
-        img_size=IMG_SIZE,
-        augment=False,
-        min_tumor_pixels=10,
-        bg_ratio=2)
-    print("Val dataset created")
-
-    print("Train samples:", len(train_dataset))
-    print("Val samples:", len(val_dataset))
+    if USE_SHARDS:
+        # Streamed from sequential shards (scripts/write_shards.py)
+        print("Opening train shards...")
+        train_dataset = ShardedSliceDataset(
+            Path(SHARD_DIR) / "train",
+            bg_ratio=2,
+            min_tumor_pixels=10,
+            shuffle_buffer=SHUFFLE_BUFFER,
+            seed=SEED
+            )
+        print("Opening val shards...")
+        val_dataset = ShardedSliceDataset(
+            Path(SHARD_DIR) / "val",
+            bg_ratio=2,
+            min_tumor_pixels=10,
+            shuffle=False,
+            seed=SEED
+            )
+    else:
+        print("Creating train dataset...")
+        train_dataset = LungSegmentationDataset(
+            RAW_DATA_DIR, 
+            MASK_DIR, 
+            train_ids,
+            img_size=IMG_SIZE,
+            augment=False,  # batched in train_one_epoch instead
+            min_tumor_pixels=10,
+            bg_ratio=2,
+            cache_dir=CACHE_DIR,
+            store_dir=store_dirs.get("train")
+            )
+        print("Train dataset created")
+
+        print("Creating val dataset...")
+        val_dataset = LungSegmentationDataset(
+            RAW_DATA_DIR, 
+            MASK_DIR, 
+            val_ids,
+            img_size=IMG_SIZE,
+            augment=False,
+            min_tumor_pixels=10,
+            bg_ratio=2,
+            cache_dir=CACHE_DIR,
+            store_dir=store_dirs.get("val"))
+        print("Val dataset created")
+
+    # Tumor / background balancing is drawn per epoch by the sampler, in
+    # this process, so it reaches persistent workers; shards do their own
+    train_sampler = val_sampler = None
+    if not USE_SHARDS:
+        train_sampler = BalancedSliceSampler(train_dataset, seed=SEED)
+        val_sampler   = BalancedSliceSampler(val_dataset, shuffle=False, seed=SEED)
+    # Whatever draws the epoch's samples: set_epoch(epoch) reseeds it
+    epoch_sampler = train_dataset if USE_SHARDS else train_sampler
+
+    print("Train samples:", len(train_sampler or train_dataset))
+    print("Val samples:", len(val_sampler or val_dataset))
 
     # DataLoaders
     train_loader = DataLoader(
         train_dataset, 
         batch_size=BATCH_SIZE, 
-        shuffle=True,
+        sampler=train_sampler,
         num_workers=NUM_WORKERS,
         pin_memory=True,
-        persistent_workers=(NUM_WORKERS > 0)
+        persistent_workers=(NUM_WORKERS > 0),
+        worker_init_fn=loader_worker_init(WORKER_THREADS, PIN_WORKERS, worker_cpus)
         )
     
     val_loader = DataLoader(
         val_dataset, 
         batch_size=BATCH_SIZE, 
-        shuffle=False,
+        sampler=val_sampler,
         num_workers=NUM_WORKERS,
         pin_memory=True,
-        persistent_workers=(NUM_WORKERS > 0)
+        persistent_workers=(NUM_WORKERS > 0),
+        worker_init_fn=loader_worker_init(WORKER_THREADS, PIN_WORKERS, worker_cpus)
         )
 
     print("Train batches:", len(train_loader))
     print("Val batches:", len(val_loader))
 
     # Model
-    model = LungAttentionUNet(in_channels=3, out_channels=1).to(device, memory_format=torch.channels_last)
+    model = LungAttentionUNet(in_channels=3, out_channels=1)
+    model = prepare_model(model, device, channels_last=CHANNELS_LAST)
+    # Compiled wrapper for the forward passes; checkpoints keep saving
+    # `model`, whose state_dict has no torch.compile key prefix
+    run_model = prepare_model(model, device, CHANNELS_LAST, compile=COMPILE_MODEL)
 
     # Loss & optimizer
     criterion = TverskyFocalLoss(
@@ -250,12 +328,12 @@ def main():
 
     # Epoch loop
     for epoch in range(start_epoch, EPOCHS):
-        train_loader.dataset.resample_per_epoch()
+        epoch_sampler.set_epoch(epoch)
         print(f"\nEpoch [{epoch+1}/{EPOCHS}]")
 
-        train_loss, train_dice = train_one_epoch(model, train_loader, optimizer, criterion, device, scaler)
+        train_loss, train_dice = train_one_epoch(run_model, train_loader, optimizer, criterion, device, scaler)
 
-        val_loss, val_dice = validate(model, val_loader, criterion, device)
+        val_loss, val_dice = validate(run_model, val_loader, criterion, device)
 
         scheduler.step()
 
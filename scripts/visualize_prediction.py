@@ -1,3 +1,4 @@
+import argparse
 import sys
 from pathlib import Path
 
@@ -8,7 +9,9 @@ import torch
 import numpy as np
 import matplotlib.pyplot as plt
 
-from configs.config import RAW_DATA_DIR, MASK_DIR
+from configs.config import RAW_DATA_DIR, MASK_DIR, CACHE_DIR
+from src.cache import load_patient_arrays
+from src.inference import INFERENCE_MODES, segment_volume
 from src.train_dataset import LungSegmentationDataset
 from src.model import LungAttentionUNet
 
@@ -32,9 +35,48 @@ def load_model(device):
     model.eval()
     return model
 
+def show_slice(image, mask, pred, pred_title="Prediction"):
+    plt.figure(figsize=(10, 3))
+
+    plt.subplot(1, 3, 1)
+    plt.title("CT")
+    plt.imshow(image, cmap="gray")
+    plt.axis("off")
+
+    plt.subplot(1, 3, 2)
+    plt.title("Ground Truth")
+    plt.imshow(image, cmap="gray")
+    plt.imshow(mask, cmap="jet", alpha=0.5)
+    plt.axis("off")
+
+    plt.subplot(1, 3, 3)
+    plt.title(pred_title)
+    plt.imshow(pred, cmap="gray")
+    plt.imshow(pred > 0.5, cmap="jet", alpha=0.5)
+    plt.axis("off")
+
+    plt.show()
+
+def visualize_volume(patient_id, mode, max_slices=3):
+    """Full-frame slices of a cached patient, segmented by segment_volume."""
+    print(f"\nPatient: {patient_id} ({mode})")
+    volume, mask = load_patient_arrays(CACHE_DIR, patient_id)
+    if volume is None:
+        print(f"Patient {patient_id} is not cached")
+        return
+
+    model = load_model(device)
+    pred  = segment_volume(model, volume, device, mode=mode)
+
+    tumor_z = np.flatnonzero(mask.reshape(len(mask), -1).any(axis=1))
+    for z in tumor_z[:max_slices]:
+        show_slice(volume[z], mask[z], pred[z], f"Prediction ({mode})")
+
 def visualize_patient(patient_id, max_slices=3):
     print(f"\nPatient: {patient_id}")
-    dataset = LungSegmentationDataset(RAW_DATA_DIR, MASK_DIR, [patient_id])
+    dataset = LungSegmentationDataset(
+        RAW_DATA_DIR, MASK_DIR, [patient_id], cache_dir=CACHE_DIR
+    )
 
     model = load_model(device)
     shown = 0
@@ -56,39 +98,25 @@ def visualize_patient(patient_id, max_slices=3):
         mask = mask.squeeze().numpy()
         pred = pred.squeeze().numpy()
 
-        plt.figure(figsize=(10, 3))
-
-        plt.subplot(1, 3, 1)
-        plt.title("CT")
-        plt.imshow(image, cmap="gray")
-        plt.axis("off")
-
-        plt.subplot(1, 3, 2)
-        plt.title("Ground Truth")
-        plt.imshow(image, cmap="gray")
-        plt.imshow(mask, cmap="jet", alpha=0.5)
-        plt.axis("off")
-
-        plt.subplot(1, 3, 3)
-        plt.title("Prediction")
-        plt.imshow(pred, cmap="gray")
-        plt.imshow(pred > 0.5, cmap="jet", alpha=0.5)
-        plt.axis("off")
-
-        plt.show()
+        show_slice(image, mask, pred)
 
         shown += 1
         if shown >= max_slices:
             break
 
 def main():
-    patients=[
-        "LIDC-IDRI-0001",
-        "LIDC-IDRI-0005"
-    ]
-
-    for pid in patients:
-        visualize_patient(pid, max_slices=2)
+    parser = argparse.ArgumentParser(description="Show predictions on tumor slices")
+    parser.add_argument("--mode", choices=sorted(INFERENCE_MODES), default=None,
+                        help="whole-volume inference mode; default shows lung-crop samples")
+    parser.add_argument("--patients", nargs="+",
+                        default=["LIDC-IDRI-0001", "LIDC-IDRI-0005"])
+    args = parser.parse_args()
+
+    for pid in args.patients:
+        if args.mode is None:
+            visualize_patient(pid, max_slices=2)
+        else:
+            visualize_volume(pid, args.mode, max_slices=2)
 
 if __name__=="__main__":
     main()
\ No newline at end of file
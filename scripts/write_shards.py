@@ -0,0 +1,53 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+from configs.config import (
+    MASK_DIR, CACHE_DIR, VAL_SPLIT, SEED, IMG_SIZE,
+    SHARD_DIR, SAMPLES_PER_SHARD, TENSOR_STORE_DTYPE,
+)
+from src.shards import write_shards
+from src.train_dataset import split_patients
+from src.tensor_store import STORE_DTYPES
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pack the training cache into sequential tar shards, one set per split."
+    )
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR)
+    parser.add_argument("--output-dir", type=Path, default=SHARD_DIR)
+    parser.add_argument("--img-size", type=int, default=IMG_SIZE)
+    parser.add_argument("--dtype", choices=STORE_DTYPES, default=TENSOR_STORE_DTYPE)
+    parser.add_argument("--samples-per-shard", type=int, default=SAMPLES_PER_SHARD)
+    parser.add_argument("--shuffle-buffer", type=int, default=1024,
+                        help="write-side shuffle buffer (samples held in memory)")
+    args = parser.parse_args()
+
+    train_ids, val_ids = split_patients(MASK_DIR, VAL_SPLIT, SEED)
+
+    for split, ids in (("train", train_ids), ("val", val_ids)):
+        start = time.time()
+        print(f"\nWriting {split} shards ({len(ids)} patients)...")
+        index = write_shards(
+            args.cache_dir, args.output_dir / split, ids,
+            img_size=args.img_size, dtype=args.dtype,
+            samples_per_shard=args.samples_per_shard,
+            shuffle_buffer=args.shuffle_buffer, seed=SEED
+        )
+        nbytes = sum(
+            p.stat().st_size for p in (args.output_dir / split).glob("shard-*.tar")
+        )
+        print(f"  {index['num_samples']} samples in {len(index['shards'])} shards | "
+              f"{nbytes / 1e6:.1f} MB | {time.time() - start:.1f}s")
+
+    print(f"\nShards written to {args.output_dir} — copy them to the training "
+          f"mount and set USE_SHARDS = True in configs/config.py")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import math
+import torch
+import torch.nn.functional as F
+
+# Probabilities / ranges of the original per-sample _augment
+AUGMENT_DEFAULTS = {
+    "hflip_p": 0.5,
+    "vflip_p": 0.2,
+    "rotate_p": 0.3,
+    "max_angle": 15.0,
+    "intensity_p": 0.3,
+    "intensity_range": (0.9, 1.1),
+    "noise_p": 0.2,
+    "noise_std": 0.02,
+    "cutout_p": 0.2,
+    "max_holes": 4,
+    "hole_size": (8, 24),
+}
+
+
+def _uniform(low, high, n, device, generator):
+    return low + (high - low) * torch.rand(n, device=device, generator=generator)
+
+
+def _chance(p, n, device, generator):
+    return torch.rand(n, device=device, generator=generator) < p
+
+
+def rotation_params(n, height, width, max_angle, device="cpu", generator=None):
+    """
+    (n, 2, 3) affine_grid matrices rotating each sample about its centre
+    by an angle in [-max_angle, max_angle] degrees. Angles are in pixel
+    space, so the normalised-coordinate matrix is corrected for
+    non-square inputs.
+    """
+    angle = _uniform(-max_angle, max_angle, n, device, generator) * (math.pi / 180)
+    cos, sin = torch.cos(angle), torch.sin(angle)
+    aspect = height / width
+
+    theta = torch.zeros(n, 2, 3, device=device)
+    theta[:, 0, 0] = cos
+    theta[:, 0, 1] = -sin * aspect
+    theta[:, 1, 0] = sin / aspect
+    theta[:, 1, 1] = cos
+    return theta
+
+
+def cutout_mask(n, height, width, max_holes, hole_size, device="cpu",
+                generator=None):
+    """
+    (n, 1, H, W) bool, True inside 1..max_holes rectangles per sample.
+    Holes start at least 16 px from the bottom / right edge and are
+    clipped to the image, as in the original cutout loop.
+    """
+    n_holes = torch.randint(1, max_holes + 1, (n, 1), device=device,
+                            generator=generator)
+    active  = torch.arange(max_holes, device=device) < n_holes
+
+    def spans(size):
+        start  = torch.randint(0, max(1, size - 16 + 1), (n, max_holes),
+                               device=device, generator=generator)
+        length = torch.randint(hole_size[0], hole_size[1] + 1, (n, max_holes),
+                               device=device, generator=generator)
+        pos = torch.arange(size, device=device).view(1, 1, size)
+        return (pos >= start[..., None]) & (pos < (start + length)[..., None])
+
+    # A rectangle is the outer product of its row and column spans, so
+    # all holes of a sample are one (H, holes) @ (holes, W) product
+    rows = (spans(height) & active[..., None]).float()
+    cols = spans(width).float()
+    return (torch.bmm(rows.transpose(1, 2), cols) > 0).unsqueeze(1)
+
+
+def augment_batch(images, masks, generator=None, **overrides):
+    """
+    Augment a collated batch in place of the per-sample numpy pipeline.
+
+    images: (B, C, H, W) float in [0, 1]
+    masks:  (B, 1, H, W) float {0, 1}
+
+    Every sample draws its own flips, rotation, intensity scale, noise
+    and cutout. Each augmentation runs once, vectorised over the samples
+    that drew it; rotation is a single affine_grid / grid_sample
+    (bilinear for images, nearest for masks, zero fill). Works on any
+    device — run it after the batch has been moved to the GPU.
+
+    returns (images, masks), new tensors
+    """
+    cfg = {**AUGMENT_DEFAULTS, **overrides}
+    n, _, height, width = images.shape
+    device = images.device
+    images = images.clone()
+    masks  = masks.to(images.dtype, copy=True)
+
+    def pick(p):
+        return torch.nonzero(_chance(p, n, device, generator)).flatten()
+
+    # Flips are exact, so they are plain index flips
+    for p, dim in ((cfg["hflip_p"], -1), (cfg["vflip_p"], -2)):
+        idx = pick(p)
+        images[idx] = images[idx].flip(dim)
+        masks[idx]  = masks[idx].flip(dim)
+
+    # Rotation: one affine_grid / grid_sample for the selected samples
+    idx = pick(cfg["rotate_p"])
+    if len(idx):
+        theta = rotation_params(len(idx), height, width, cfg["max_angle"],
+                                device, generator)
+        grid = F.affine_grid(theta.to(images.dtype),
+                             [len(idx), *images.shape[1:]], align_corners=False)
+        images[idx] = F.grid_sample(images[idx], grid, mode="bilinear",
+                                    padding_mode="zeros", align_corners=False)
+        masks[idx]  = F.grid_sample(masks[idx], grid, mode="nearest",
+                                    padding_mode="zeros", align_corners=False)
+
+    # Intensity scale and noise — image only, never the mask
+    idx = pick(cfg["intensity_p"])
+    low, high = cfg["intensity_range"]
+    scale = _uniform(low, high, len(idx), device, generator)
+    images[idx] = images[idx] * scale.view(-1, 1, 1, 1).to(images.dtype)
+
+    idx = pick(cfg["noise_p"])
+    noise = torch.randn((len(idx), *images.shape[1:]), device=device,
+                        dtype=images.dtype, generator=generator)
+    images[idx] = images[idx] + cfg["noise_std"] * noise
+    images.clamp_(0.0, 1.0)
+
+    idx = pick(cfg["cutout_p"])
+    holes = cutout_mask(len(idx), height, width, cfg["max_holes"],
+                        cfg["hole_size"], device, generator)
+    images[idx] = images[idx].masked_fill(holes, 0.0)
+
+    return images, masks
@@ -0,0 +1,411 @@
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+import numpy as np
+
+# Consolidated layout (one directory per patient):
+#   {cache_dir}/patients/{pid}/volume.npy   (Z, H, W) float32 | float16 | uint8
+#   {cache_dir}/patients/{pid}/mask.npy     (Z, H, W) uint8 | (Z, H, ceil(W/8)) packbits
+#   {cache_dir}/patients/{pid}/bboxes.npy   (Z, 4)    int32
+#   {cache_dir}/patients/{pid}/index.json    per-slice tumor counts, bbox
+#   {cache_dir}/patients/{pid}/header.json
+#
+# Legacy layout (one file per slice):
+#   {cache_dir}/{pid}/{z:04d}.npy
+#   {cache_dir}/{pid}_masks/{z:04d}.npy
+#   {cache_dir}/{pid}_bboxes.npy
+
+# Version 2 adds the volume / mask encodings; version 1 entries are
+# float32 volumes with uint8 masks
+CACHE_FORMAT_VERSION = 2
+HEADER_NAME = "header.json"
+INDEX_NAME  = "index.json"
+
+# Volumes are windowed to [0, 1]: float16 keeps ~1e-4 precision, uint8
+# stores round(value * 255). Masks are binary, packbits is lossless
+VOLUME_ENCODINGS = ("float32", "float16", "uint8")
+MASK_ENCODINGS   = ("uint8", "packbits")
+
+
+def encode_volume(volume, encoding="float32"):
+    """[0, 1] float volume -> array in the stored encoding"""
+    if encoding not in VOLUME_ENCODINGS:
+        raise ValueError(
+            f"Unknown volume encoding '{encoding}', expected one of {VOLUME_ENCODINGS}"
+        )
+    if encoding == "uint8":
+        return np.rint(np.clip(volume, 0.0, 1.0) * 255).astype(np.uint8)
+    return np.ascontiguousarray(volume, dtype=np.dtype(encoding))
+
+
+def decode_volume(array):
+    """Stored volume (any encoding, told apart by dtype) -> float32 [0, 1]"""
+    if array.dtype == np.uint8:
+        return np.asarray(array, dtype=np.float32) * np.float32(1 / 255)
+    return np.asarray(array, dtype=np.float32)
+
+
+def encode_mask(mask, encoding="uint8"):
+    """
+    Binary mask -> stored encoding. packbits packs each row along the
+    last axis, so a crop of rows y_min:y_max still reads only those rows.
+    """
+    if encoding not in MASK_ENCODINGS:
+        raise ValueError(
+            f"Unknown mask encoding '{encoding}', expected one of {MASK_ENCODINGS}"
+        )
+    mask = np.ascontiguousarray(mask, dtype=np.uint8)
+    if encoding == "packbits":
+        return np.packbits(mask > 0, axis=-1)
+    return mask
+
+
+def patient_cache_dir(cache_dir, pid):
+    return Path(cache_dir) / "patients" / pid
+
+
+def legacy_cache_paths(cache_dir, pid):
+    cache_dir = Path(cache_dir)
+    return (
+        cache_dir / pid,
+        cache_dir / f"{pid}_masks",
+        cache_dir / f"{pid}_bboxes.npy",
+    )
+
+
+def has_patient_cache(cache_dir, pid):
+    return (patient_cache_dir(cache_dir, pid) / HEADER_NAME).exists()
+
+
+def has_legacy_cache(cache_dir, pid):
+    image_dir, mask_dir, bbox_path = legacy_cache_paths(cache_dir, pid)
+    return image_dir.exists() and mask_dir.exists() and bbox_path.exists()
+
+
+def build_patient_index(mask, bboxes, min_tumor_pixels=10, bbox_3d=None):
+    """
+    Everything the training dataset needs to enumerate a patient's
+    samples without touching the mask: per-slice tumor pixel counts,
+    the tumor/background split at `min_tumor_pixels`, the union of the
+    per-slice lung boxes and the volume shape.
+
+    bbox_3d: optional patient-level lung box from get_lung_bboxes
+    """
+    mask   = np.asarray(mask)
+    bboxes = np.asarray(bboxes)
+    counts = np.count_nonzero(mask.reshape(mask.shape[0], -1), axis=1)
+
+    return {
+        "shape": list(mask.shape),
+        "min_tumor_pixels": int(min_tumor_pixels),
+        "tumor_pixel_counts": counts.tolist(),
+        "tumor_slices": np.flatnonzero(counts >= min_tumor_pixels).tolist(),
+        "bg_slices":    np.flatnonzero(counts <  min_tumor_pixels).tolist(),
+        "bbox": [
+            int(bboxes[:, 0].min()), int(bboxes[:, 1].max()),
+            int(bboxes[:, 2].min()), int(bboxes[:, 3].max()),
+        ] if len(bboxes) else [0, 0, 0, 0],
+        "bbox_3d": [int(v) for v in bbox_3d] if bbox_3d is not None else None,
+    }
+
+
+def write_patient_index(out_dir, mask, bboxes, min_tumor_pixels=10,
+                        bbox_3d=None):
+    index = build_patient_index(mask, bboxes, min_tumor_pixels, bbox_3d)
+    with open(Path(out_dir) / INDEX_NAME, "w") as f:
+        json.dump(index, f)
+    return index
+
+
+def load_patient_index(cache_dir, pid):
+    """Index of a consolidated entry, or None if it has none."""
+    path = patient_cache_dir(cache_dir, pid) / INDEX_NAME
+    if not has_patient_cache(cache_dir, pid) or not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def split_slices(index, min_tumor_pixels):
+    """
+    (tumor_slices, bg_slices) for any threshold, straight from the
+    stored per-slice counts — no mask is read.
+    """
+    if index["min_tumor_pixels"] == min_tumor_pixels:
+        return index["tumor_slices"], index["bg_slices"]
+
+    counts = np.asarray(index["tumor_pixel_counts"])
+    return (
+        np.flatnonzero(counts >= min_tumor_pixels).tolist(),
+        np.flatnonzero(counts <  min_tumor_pixels).tolist(),
+    )
+
+
+def write_patient_cache(out_dir, volume, mask, bboxes,
+                        min_tumor_pixels=10, bbox_3d=None,
+                        volume_encoding="float32", mask_encoding="uint8",
+                        **extra):
+    """
+    Write one patient as three contiguous arrays, its slice index
+    and a JSON header. The header is written last, so its presence
+    marks a complete entry.
+
+    volume_encoding / mask_encoding: see VOLUME_ENCODINGS / MASK_ENCODINGS
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    volume = np.ascontiguousarray(volume, dtype=np.float32)
+    mask   = np.ascontiguousarray(mask,   dtype=np.uint8)
+    bboxes = np.ascontiguousarray(bboxes, dtype=np.int32)
+
+    if volume.shape != mask.shape:
+        raise ValueError(
+            f"Image {volume.shape} and mask {mask.shape} shapes differ"
+        )
+    if bboxes.shape != (volume.shape[0], 4):
+        raise ValueError(
+            f"Expected bboxes of shape {(volume.shape[0], 4)}, "
+            f"got {bboxes.shape}"
+        )
+
+    stored_volume = encode_volume(volume, volume_encoding)
+    stored_mask   = encode_mask(mask, mask_encoding)
+
+    np.save(out_dir / "volume.npy", stored_volume)
+    np.save(out_dir / "mask.npy",   stored_mask)
+    np.save(out_dir / "bboxes.npy", bboxes)
+    write_patient_index(out_dir, mask, bboxes, min_tumor_pixels, bbox_3d)
+
+    header = {
+        "format_version": CACHE_FORMAT_VERSION,
+        "shape": list(volume.shape),
+        "volume_dtype": stored_volume.dtype.name,
+        "mask_dtype": stored_mask.dtype.name,
+        "volume_encoding": volume_encoding,
+        "mask_encoding": mask_encoding,
+        **extra,
+    }
+    with open(out_dir / HEADER_NAME, "w") as f:
+        json.dump(header, f, indent=2)
+
+    return header
+
+
+def create_staging_dir(cache_dir, pid):
+    """
+    Fresh hidden directory next to the final entry. Writers fill it and
+    then commit_patient_cache() renames it into place, so readers never
+    see a half-written patient.
+    """
+    root = Path(cache_dir) / "patients"
+    root.mkdir(parents=True, exist_ok=True)
+    return Path(tempfile.mkdtemp(prefix=f".tmp-{pid}-", dir=root))
+
+
+def commit_patient_cache(staging_dir, cache_dir, pid):
+    final_dir = patient_cache_dir(cache_dir, pid)
+    if final_dir.exists():
+        # Leftover from an interrupted, non-atomic write
+        shutil.rmtree(final_dir)
+    os.replace(staging_dir, final_dir)
+    return final_dir
+
+
+def remove_staging_dirs(cache_dir):
+    """Delete staging directories left behind by crashed writers."""
+    removed = 0
+    for path in (Path(cache_dir) / "patients").glob(".tmp-*"):
+        shutil.rmtree(path, ignore_errors=True)
+        removed += 1
+    return removed
+
+
+class PatientCache:
+    """
+    Read-only view of one consolidated patient entry.
+    Arrays are np.memmap views; slicing them reads only the
+    requested bytes from disk / page cache. Reads are decoded to
+    float32 volumes and uint8 masks whatever the stored encoding.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / HEADER_NAME) as f:
+            self.header = json.load(f)
+
+        self.volume = np.load(self.path / "volume.npy", mmap_mode="r")
+        self.mask   = np.load(self.path / "mask.npy",   mmap_mode="r")
+        self.bboxes = np.load(self.path / "bboxes.npy", mmap_mode="r")
+        self.mask_encoding = self.header.get("mask_encoding", "uint8")
+
+    @property
+    def num_slices(self):
+        return self.volume.shape[0]
+
+    def read_stack(self, z_indices, y_min, y_max, x_min, x_max):
+        """(len(z_indices), h, w) float32 crop of the listed slices"""
+        return decode_volume(self.volume[z_indices, y_min:y_max, x_min:x_max])
+
+    def read_mask(self, z, y_min, y_max, x_min, x_max):
+        if self.mask_encoding != "packbits":
+            return np.asarray(self.mask[z, y_min:y_max, x_min:x_max])
+
+        # Unpack only the bytes covering x_min:x_max
+        width = self.volume.shape[2]
+        x_max = width if x_max is None else x_max
+        first = x_min // 8
+        bits  = np.unpackbits(
+            self.mask[z, y_min:y_max, first:(x_max + 7) // 8], axis=-1
+        )
+        return bits[:, x_min - first * 8:x_max - first * 8]
+
+    def read_masks(self):
+        """Whole (Z, H, W) uint8 mask"""
+        if self.mask_encoding != "packbits":
+            return np.asarray(self.mask)
+        return np.unpackbits(self.mask, axis=-1, count=self.volume.shape[2])
+
+    def tumor_pixel_counts(self):
+        if self.mask_encoding == "packbits":
+            # Padding bits are zero, so counting set bits is exact
+            bits = np.unpackbits(self.mask.reshape(self.num_slices, -1), axis=1)
+            return bits.sum(axis=1, dtype=np.int64)
+        return np.count_nonzero(
+            self.mask.reshape(self.num_slices, -1), axis=1
+        )
+
+
+class LegacyPatientCache:
+    """Same interface as PatientCache over the per-slice .npy layout."""
+
+    def __init__(self, cache_dir, pid):
+        self.image_dir, self.mask_dir, bbox_path = legacy_cache_paths(
+            cache_dir, pid
+        )
+        self.bboxes = np.load(bbox_path)
+
+    @property
+    def num_slices(self):
+        return len(self.bboxes)
+
+    def read_stack(self, z_indices, y_min, y_max, x_min, x_max):
+        return np.stack([
+            np.load(self.image_dir / f"{z:04d}.npy")[y_min:y_max, x_min:x_max]
+            for z in z_indices
+        ], axis=0).astype(np.float32)
+
+    def read_mask(self, z, y_min, y_max, x_min, x_max):
+        return np.load(self.mask_dir / f"{z:04d}.npy")[y_min:y_max, x_min:x_max]
+
+    def tumor_pixel_counts(self):
+        mask_slices = sorted(self.mask_dir.glob("*.npy"))
+        return np.array(
+            [np.count_nonzero(np.load(p)) for p in mask_slices],
+            dtype=np.int64
+        )
+
+
+def open_patient_cache(cache_dir, pid):
+    """
+    Open a patient in whichever layout exists, preferring the
+    consolidated one. Returns None if the patient is not cached.
+    """
+    if has_patient_cache(cache_dir, pid):
+        return PatientCache(patient_cache_dir(cache_dir, pid))
+    if has_legacy_cache(cache_dir, pid):
+        return LegacyPatientCache(cache_dir, pid)
+    return None
+
+
+def load_patient_arrays(cache_dir, pid):
+    """
+    Whole preprocessed volume (float32) and binary mask (uint8) of one
+    cached patient, in either layout, or (None, None) if not cached.
+    """
+    cache = open_patient_cache(cache_dir, pid)
+    if cache is None:
+        return None, None
+    z_all  = list(range(cache.num_slices))
+    volume = cache.read_stack(z_all, 0, None, 0, None)
+    mask   = np.stack([cache.read_mask(z, 0, None, 0, None) for z in z_all])
+    return volume, (mask > 0).astype(np.uint8)
+
+
+_HEADER_KEYS = (
+    "format_version", "shape", "volume_dtype", "mask_dtype",
+    "volume_encoding", "mask_encoding",
+)
+
+
+def reencode_patient_cache(cache_dir, pid, volume_encoding="float32",
+                           mask_encoding="uint8", out_cache_dir=None):
+    """
+    Rewrite one consolidated entry in other encodings, into `cache_dir`
+    itself (atomically replacing the entry) or into `out_cache_dir`.
+    Re-encoding a lossy volume never recovers precision: go from the
+    float32 entry when comparing encodings.
+
+    returns the written header
+    """
+    cache = PatientCache(patient_cache_dir(cache_dir, pid))
+    index = load_patient_index(cache_dir, pid) or {}
+    extra = {k: v for k, v in cache.header.items() if k not in _HEADER_KEYS}
+
+    out_cache_dir = Path(out_cache_dir or cache_dir)
+    staging_dir   = create_staging_dir(out_cache_dir, pid)
+    try:
+        header = write_patient_cache(
+            staging_dir,
+            cache.read_stack(slice(None), 0, None, 0, None),
+            cache.read_masks(),
+            np.asarray(cache.bboxes),
+            min_tumor_pixels=index.get("min_tumor_pixels", 10),
+            bbox_3d=index.get("bbox_3d"),
+            volume_encoding=volume_encoding,
+            mask_encoding=mask_encoding,
+            **extra,
+        )
+        del cache
+        commit_patient_cache(staging_dir, out_cache_dir, pid)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    return header
+
+
+def convert_legacy_cache(cache_dir, pid, min_tumor_pixels=10,
+                         volume_encoding="float32", mask_encoding="uint8"):
+    """
+    Rewrite one legacy per-slice entry in the consolidated layout,
+    staged and committed like a fresh entry. Returns the written header.
+    """
+    image_dir, mask_dir, bbox_path = legacy_cache_paths(cache_dir, pid)
+    bboxes = np.load(bbox_path)
+    total_z = len(bboxes)
+
+    first = np.load(image_dir / f"{0:04d}.npy")
+    volume = np.empty((total_z,) + first.shape, dtype=np.float32)
+    mask   = np.zeros((total_z,) + first.shape, dtype=np.uint8)
+
+    for z in range(total_z):
+        volume[z] = np.load(image_dir / f"{z:04d}.npy")
+        mask_path = mask_dir / f"{z:04d}.npy"
+        if mask_path.exists():
+            mask[z] = np.load(mask_path) > 0
+
+    staging_dir = create_staging_dir(cache_dir, pid)
+    try:
+        header = write_patient_cache(
+            staging_dir, volume, mask, bboxes,
+            min_tumor_pixels=min_tumor_pixels,
+            volume_encoding=volume_encoding, mask_encoding=mask_encoding,
+            patient_id=pid, converted_from="legacy",
+        )
+        commit_patient_cache(staging_dir, cache_dir, pid)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    return header
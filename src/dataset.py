@@ -1,9 +1,9 @@
 from pathlib import Path
 import numpy as np
-import pydicom
 import torch
 from torch.utils.data import Dataset
 
+from src.dicom_io import load_series_dir, series_spacing
 from src.preprocessing import (
     convert_to_hu,
     resample_volume,
@@ -27,18 +27,11 @@ class LungCTDataset(Dataset):
         self.series_dir = Path(series_dir)
         self.img_size   = img_size
 
-        self.slices = self._load_slices()
+        pixels, self.slices = load_series_dir(self.series_dir)
+        self.spacing = series_spacing(self.slices)
 
-        pixel_spacing = tuple(map(float,
-                                self.slices[0].PixelSpacing))
-        slice_thickness = float(self.slices[0].SliceThickness)
-        self.spacing = np.array([
-            slice_thickness,
-            pixel_spacing[0],
-            pixel_spacing[1]
-        ])
-
-        raw_volume = convert_to_hu(self.slices)
+        raw_volume = convert_to_hu(self.slices, pixels)
+        del pixels
 
         self.volume = resample_volume(raw_volume, self.spacing)
 
@@ -57,20 +50,7 @@ class LungCTDataset(Dataset):
                 self.volume.shape, dtype=np.uint8
             )
 
-        self.volume = window_and_normalize(self.volume)
-
-    def _load_slices(self):
-        dicom_files = sorted(
-            self.series_dir.rglob("*.dcm"),
-            key=lambda f: float(
-                pydicom.dcmread(f).ImagePositionPatient[2]
-            )
-        )
-        if not dicom_files:
-            raise RuntimeError(
-                f"No DICOM files found in {self.series_dir}"
-            )
-        return [pydicom.dcmread(f) for f in dicom_files]
+        self.volume = window_and_normalize(self.volume, inplace=True)
 
     def __len__(self):
         return self.volume.shape[0]
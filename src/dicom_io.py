@@ -0,0 +1,169 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+import pydicom
+
+
+class InvalidSeriesError(ValueError):
+    """Raised when a set of DICOM headers is not one usable CT series."""
+
+
+def slice_position(header):
+    """
+    Sort key for a DICOM slice: z of ImagePositionPatient,
+    falling back to InstanceNumber for series without it.
+    """
+    if hasattr(header, 'ImagePositionPatient'):
+        return float(header.ImagePositionPatient[2])
+    return float(getattr(header, 'InstanceNumber', 0))
+
+
+def series_spacing(headers):
+    """(z, y, x) voxel spacing in mm taken from the first slice header."""
+    pixel_spacing   = tuple(map(float, headers[0].PixelSpacing))
+    slice_thickness = float(headers[0].SliceThickness)
+    return np.array([
+        slice_thickness,
+        pixel_spacing[0],
+        pixel_spacing[1]
+    ])
+
+
+def _default_opener(source):
+    return source
+
+
+def read_series_headers(sources, opener=_default_opener):
+    """
+    Read only the headers of a series (no pixel data) and sort by z.
+
+    sources: anything `opener` turns into something pydicom.dcmread accepts
+    returns (sorted_sources, sorted_headers)
+    """
+    headers = [
+        pydicom.dcmread(opener(src), stop_before_pixels=True)
+        for src in sources
+    ]
+    order = sorted(range(len(headers)), key=lambda i: slice_position(headers[i]))
+    return [sources[i] for i in order], [headers[i] for i in order]
+
+
+REQUIRED_TAGS = (
+    "Rows", "Columns", "PixelSpacing", "SliceThickness",
+    "RescaleSlope", "RescaleIntercept",
+)
+
+
+def validate_series_headers(headers):
+    """
+    Check header-only reads before any pixel data is decoded: one series,
+    consistent slice geometry and every tag preprocessing relies on.
+    """
+    if not headers:
+        raise InvalidSeriesError("No DICOM slices found")
+
+    for i, ds in enumerate(headers):
+        missing = [tag for tag in REQUIRED_TAGS if tag not in ds]
+        if missing:
+            raise InvalidSeriesError(
+                f"Slice {i} is missing {', '.join(missing)}"
+            )
+
+    series_uids = {str(getattr(ds, "SeriesInstanceUID", "")) for ds in headers}
+    if len(series_uids) > 1:
+        raise InvalidSeriesError(
+            f"Expected one series, found {len(series_uids)}"
+        )
+
+    shapes = {(int(ds.Rows), int(ds.Columns)) for ds in headers}
+    if len(shapes) > 1:
+        raise InvalidSeriesError(
+            f"Slices have different sizes: {sorted(shapes)}"
+        )
+
+
+def decode_series(sources, headers, opener=_default_opener,
+                  num_workers=0, dtype=np.int16):
+    """
+    Decode the pixel data of an already sorted series exactly once,
+    writing each slice straight into a preallocated (Z, H, W) volume.
+
+    num_workers > 0 decodes slices on a thread pool.
+    Values are the raw stored pixels; apply RescaleSlope/Intercept
+    from `headers` (convert_to_hu) to get Hounsfield Units.
+    """
+    rows = int(headers[0].Rows)
+    cols = int(headers[0].Columns)
+    volume = np.empty((len(sources), rows, cols), dtype=dtype)
+    limit  = np.iinfo(dtype) if np.issubdtype(dtype, np.integer) else None
+
+    def decode(i):
+        pixels = pydicom.dcmread(opener(sources[i])).pixel_array
+        if pixels.shape != (rows, cols):
+            raise ValueError(
+                f"Slice {i} has shape {pixels.shape}, "
+                f"expected {(rows, cols)}"
+            )
+        if limit is not None and pixels.size and pixels.max() > limit.max:
+            raise ValueError(
+                f"Slice {i} pixel values exceed {np.dtype(dtype).name}"
+            )
+        volume[i] = pixels
+
+    if num_workers > 0:
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            list(pool.map(decode, range(len(sources))))
+    else:
+        for i in range(len(sources)):
+            decode(i)
+
+    return volume
+
+
+def load_dicom_series(sources, opener=_default_opener, num_workers=0):
+    """
+    Single-pass series loader: header-only sort, then one pixel decode
+    per slice into a preallocated int16 volume.
+
+    returns (volume, headers) with headers sorted to match volume
+    """
+    sources = list(sources)
+    if not sources:
+        raise RuntimeError("No DICOM files to load")
+
+    sources, headers = read_series_headers(sources, opener)
+    volume = decode_series(sources, headers, opener, num_workers)
+    return volume, headers
+
+
+def zip_dicom_members(zf):
+    """DICOM entries of an open ZipFile (same *dcm match as the API used)."""
+    return [
+        info for info in zf.infolist()
+        if not info.is_dir() and info.filename.lower().endswith("dcm")
+    ]
+
+
+def load_zip_series(zf, members=None, num_workers=0):
+    """
+    Load a series straight out of an open ZipFile — no extraction.
+    Headers are read and validated from the compressed stream first;
+    pixel data is then decoded member by member into the volume.
+    """
+    if members is None:
+        members = zip_dicom_members(zf)
+    if not members:
+        raise InvalidSeriesError("No DICOM files in ZIP")
+
+    members, headers = read_series_headers(members, zf.open)
+    validate_series_headers(headers)
+    volume = decode_series(members, headers, zf.open, num_workers)
+    return volume, headers
+
+
+def load_series_dir(series_dir, num_workers=0):
+    """Load every *.dcm file below `series_dir` as one sorted series."""
+    dicom_files = list(Path(series_dir).rglob("*.dcm"))
+    if not dicom_files:
+        raise RuntimeError(f"No DICOM files found in {series_dir}")
+    return load_dicom_series(dicom_files, num_workers=num_workers)
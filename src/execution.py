@@ -0,0 +1,74 @@
+import torch
+
+# "auto" keeps the original behaviour: fp16 autocast on CUDA, fp32 on CPU
+PRECISIONS = ("auto", "fp32", "bf16", "fp16")
+
+
+def device_type(device):
+    return "cuda" if "cuda" in str(device) else "cpu"
+
+
+def autocast_dtype(device, precision="auto"):
+    """Autocast dtype for `precision` on `device`; None means plain fp32."""
+    if precision not in PRECISIONS:
+        raise ValueError(
+            f"Unknown precision '{precision}', expected one of {PRECISIONS}"
+        )
+    if precision == "auto":
+        return torch.float16 if device_type(device) == "cuda" else None
+    return {
+        "fp32": None,
+        "bf16": torch.bfloat16,
+        "fp16": torch.float16,
+    }[precision]
+
+
+def autocast_context(device, precision="auto"):
+    """torch.autocast for the configured precision (disabled for fp32)."""
+    dtype = autocast_dtype(device, precision)
+    if dtype is None:
+        return torch.autocast(device_type(device), enabled=False)
+    return torch.autocast(device_type(device), dtype=dtype)
+
+
+def needs_grad_scaler(device, precision="auto"):
+    """Loss scaling is only needed for fp16; bf16 has fp32's exponent range."""
+    return (
+        device_type(device) == "cuda"
+        and autocast_dtype(device, precision) == torch.float16
+    )
+
+
+def to_input(batch, device, channels_last=True):
+    """Move an (N, C, H, W) batch to `device` in the model's memory format."""
+    memory_format = (
+        torch.channels_last if channels_last and batch.dim() == 4
+        else torch.preserve_format
+    )
+    return batch.to(device, memory_format=memory_format, non_blocking=True)
+
+
+def prepare_model(model, device, channels_last=True, compile=False,
+                  compile_mode=None):
+    """
+    Place the model on `device` (channels_last if requested) and
+    optionally wrap it in torch.compile. The compiled wrapper shares the
+    original parameters, so keep saving the eager model's state_dict.
+    """
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
+    model = model.to(device, memory_format=memory_format)
+    if compile:
+        model = torch.compile(model, mode=compile_mode)
+    return model
+
+
+def inference_forward(model, device, precision="auto", channels_last=True):
+    """
+    model(batch) with the configured input layout and autocast, returning
+    float32 logits — usable as predict_volume's `forward` hook.
+    """
+    def forward(batch):
+        batch = to_input(batch, device, channels_last)
+        with torch.no_grad(), autocast_context(device, precision):
+            return model(batch).float()
+    return forward
@@ -0,0 +1,390 @@
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from src.preprocessing import get_lung_bboxes, resize_image
+
+
+def resize_volume(volume, size=256):
+    """
+    Resize every axial slice of a (Z, H, W) volume to (size, size).
+    Each slice is resized exactly once; the 2.5D stacks built from
+    the result share their neighbouring channels.
+    """
+    resized = np.empty((volume.shape[0], size, size), dtype=np.float32)
+    for z in range(volume.shape[0]):
+        resized[z] = resize_image(volume[z], size)
+    return resized
+
+
+def build_stacks(slices):
+    """
+    Build every 2.5D (prev, current, next) stack of a volume in one step.
+
+    slices: (Z, H, W) tensor
+    returns (Z, 3, H, W) view — edge slices repeat themselves as their
+    missing neighbour, exactly like the per-slice loop in training.
+    """
+    padded = torch.cat([slices[:1], slices, slices[-1:]], dim=0)
+    # unfold gives (Z, H, W, 3) without copying; move window axis to channels
+    return padded.unfold(0, 3, 1).permute(0, 3, 1, 2)
+
+
+def predict_volume(
+    model,
+    volume,
+    device,
+    batch_size=16,
+    img_size=256,
+    threshold=0.5,
+    progress=None,
+    forward=None,
+):
+    """
+    Segment a whole preprocessed CT volume with a 2.5D model.
+
+    volume: (Z, H, W) float32, windowed and normalized to [0, 1]
+    returns (Z, H, W) uint8 binary mask at the volume's resolution
+
+    Slices are resized once, stacked with their neighbours in a single
+    view and pushed through the model in mini-batches of `batch_size`.
+    Sigmoid, upsampling and thresholding all run batched on `device`.
+
+    progress: optional callable(done, total) invoked after every batch
+    forward:  optional callable(batch) -> logits used instead of
+              model(batch), e.g. a scheduler batching across requests
+    """
+    total_z, H, W = volume.shape
+    predictions = np.zeros((total_z, H, W), dtype=np.uint8)
+    if total_z == 0:
+        return predictions
+
+    if forward is None:
+        forward = model
+
+    slices = torch.from_numpy(resize_volume(volume, img_size))
+    stacks = build_stacks(slices)
+
+    _segment_stacks(
+        forward, stacks, np.arange(total_z), predictions,
+        device, batch_size, threshold, progress
+    )
+    return predictions
+
+
+def _segment_stacks(forward, stacks, z_indices, predictions, device,
+                    batch_size, threshold, progress=None):
+    """
+    Run the stacks of `z_indices` through `forward` in mini-batches and
+    write the thresholded, nearest-upsampled masks into `predictions`.
+    """
+    H, W = predictions.shape[1:]
+    with torch.no_grad():
+        for start in range(0, len(z_indices), batch_size):
+            batch_z = z_indices[start:start + batch_size]
+            if batch_z[-1] - batch_z[0] == len(batch_z) - 1:
+                batch = stacks[batch_z[0]:batch_z[-1] + 1]
+            else:
+                batch = stacks[torch.from_numpy(batch_z)]
+            batch = batch.contiguous().to(device)
+
+            probs = torch.sigmoid(forward(batch))
+            probs = F.interpolate(probs, size=(H, W), mode="nearest")
+
+            predictions[batch_z] = (
+                (probs[:, 0] > threshold).to(torch.uint8).cpu().numpy()
+            )
+            if progress is not None:
+                progress(start + len(batch_z), len(z_indices))
+
+
+def triage_scores(model, volume, device, size=128, batch_size=32,
+                  forward=None):
+    """
+    Cheap first pass of the cascade: the same 2.5D model on slices
+    downsampled to (size, size). Returns the per-slice maximum tumor
+    probability, (Z,) float32.
+    """
+    total_z = volume.shape[0]
+    scores = np.zeros(total_z, dtype=np.float32)
+    if forward is None:
+        forward = model
+
+    stacks = build_stacks(torch.from_numpy(resize_volume(volume, size)))
+    with torch.no_grad():
+        for start in range(0, total_z, batch_size):
+            stop  = min(start + batch_size, total_z)
+            probs = torch.sigmoid(forward(stacks[start:stop].contiguous().to(device)))
+            scores[start:stop] = probs.amax(dim=(1, 2, 3)).float().cpu().numpy()
+    return scores
+
+
+def cascade_candidates(scores, triage_threshold=0.1, neighbours=1):
+    """
+    Slices whose triage score reaches `triage_threshold`, grown by
+    `neighbours` slices on each side so nodule edges are not cut off.
+    """
+    flagged = scores >= triage_threshold
+    if neighbours > 0 and flagged.any():
+        kernel  = np.ones(2 * neighbours + 1, dtype=np.int32)
+        flagged = np.convolve(flagged.astype(np.int32), kernel, mode="same") > 0
+    return np.flatnonzero(flagged)
+
+
+def predict_volume_cascade(
+    model,
+    volume,
+    device,
+    batch_size=16,
+    img_size=256,
+    threshold=0.5,
+    triage_size=128,
+    triage_threshold=0.1,
+    neighbours=1,
+    progress=None,
+    forward=None,
+):
+    """
+    Two-stage inference: triage_scores flags candidate slices on a
+    downsampled pass, and only those (plus `neighbours` on each side)
+    are segmented at img_size. All other slices are predicted empty.
+
+    Candidate slices get exactly the output predict_volume would give
+    them; the cost is the recall of slices the triage pass misses,
+    which scripts/evaluate_cascade.py measures per threshold.
+    """
+    total_z, H, W = volume.shape
+    predictions = np.zeros((total_z, H, W), dtype=np.uint8)
+    if total_z == 0:
+        return predictions
+
+    if forward is None:
+        forward = model
+
+    scores = triage_scores(
+        model, volume, device, size=triage_size,
+        batch_size=batch_size * 2, forward=forward
+    )
+    z_indices = cascade_candidates(scores, triage_threshold, neighbours)
+    if len(z_indices) == 0:
+        return predictions
+
+    slices = torch.from_numpy(resize_volume(volume, img_size))
+    _segment_stacks(
+        forward, build_stacks(slices), z_indices, predictions,
+        device, batch_size, threshold, progress
+    )
+    return predictions
+
+
+def crop_stack(volume, z, bbox, size=256):
+    """
+    The training input for slice z: (prev, z, next) cropped to the lung
+    bbox of z and each resized to (size, size), as in
+    LungSegmentationDataset.__getitem__.
+    """
+    y_min, y_max, x_min, x_max = (int(v) for v in bbox)
+    last = volume.shape[0] - 1
+    return np.stack([
+        resize_image(volume[i, y_min:y_max, x_min:x_max], size)
+        for i in (max(0, z - 1), z, min(last, z + 1))
+    ])
+
+
+def predict_volume_roi(
+    model,
+    volume,
+    device,
+    batch_size=16,
+    img_size=256,
+    threshold=0.5,
+    margin=10,
+    progress=None,
+    forward=None,
+):
+    """
+    Segment a volume on lung-cropped inputs, matching the training crop.
+
+    Lung bboxes are computed once for the whole volume; slices with no
+    lung are left empty without running the model. Every other slice is
+    cropped to its bbox (with its neighbours), resized to img_size, and
+    the probabilities are resized back to the crop and pasted in place.
+
+    Arguments and return value as predict_volume.
+    """
+    total_z, H, W = volume.shape
+    predictions = np.zeros((total_z, H, W), dtype=np.uint8)
+    if total_z == 0:
+        return predictions
+
+    if forward is None:
+        forward = model
+
+    bboxes, _, found = get_lung_bboxes(volume, margin=margin)
+    z_indices = np.flatnonzero(found)
+
+    with torch.no_grad():
+        for start in range(0, len(z_indices), batch_size):
+            batch_z = z_indices[start:start + batch_size]
+            batch = torch.from_numpy(np.stack([
+                crop_stack(volume, z, bboxes[z], img_size) for z in batch_z
+            ])).to(device)
+
+            probs = torch.sigmoid(forward(batch))[:, 0].float().cpu().numpy()
+
+            for z, prob in zip(batch_z, probs):
+                y_min, y_max, x_min, x_max = (int(v) for v in bboxes[z])
+                prob = cv2.resize(
+                    prob, (x_max - x_min, y_max - y_min),
+                    interpolation=cv2.INTER_LINEAR
+                )
+                predictions[z, y_min:y_max, x_min:x_max] = prob > threshold
+
+            if progress is not None:
+                progress(start + len(batch_z), len(z_indices))
+
+    return predictions
+
+
+def gaussian_importance(tile_size, sigma_scale=0.125):
+    """
+    (tile_size, tile_size) blending weights: a Gaussian centred on the
+    tile (sigma = sigma_scale * tile_size), peak 1, strictly positive.
+    """
+    centre = (tile_size - 1) / 2.0
+    sigma  = sigma_scale * tile_size
+    g = np.exp(-0.5 * ((np.arange(tile_size) - centre) / sigma) ** 2)
+    weights = np.outer(g, g).astype(np.float32)
+    weights /= weights.max()
+    weights[weights == 0] = weights[weights > 0].min()
+    return weights
+
+
+def tile_starts(length, tile_size, step):
+    """Window offsets covering [0, length) with the last one flush to the end."""
+    if length <= tile_size:
+        return [0]
+    starts = list(range(0, length - tile_size + 1, step))
+    if starts[-1] != length - tile_size:
+        starts.append(length - tile_size)
+    return starts
+
+
+def predict_volume_tiled(
+    model,
+    volume,
+    device,
+    batch_size=16,
+    tile_size=256,
+    overlap=0.5,
+    threshold=0.5,
+    margin=10,
+    sigma_scale=0.125,
+    progress=None,
+    forward=None,
+):
+    """
+    Sliding-window inference at the volume's own (1 mm) resolution.
+
+    Each slice is covered by tile_size windows of its 2.5D stack spaced
+    tile_size * (1 - overlap) apart; only windows that intersect the
+    slice's lung bbox are run, and slices without lung are skipped.
+    Windows from consecutive slices share batches. Overlapping window
+    probabilities are blended with Gaussian weights and thresholded;
+    pixels no window covered stay 0.
+
+    Slices smaller than tile_size are zero-padded (0 = air after
+    window_and_normalize). Other arguments as predict_volume.
+    """
+    total_z, H, W = volume.shape
+    predictions = np.zeros((total_z, H, W), dtype=np.uint8)
+    if total_z == 0:
+        return predictions
+
+    if forward is None:
+        forward = model
+
+    bboxes, _, found = get_lung_bboxes(volume, margin=margin)
+    lung_z = np.flatnonzero(found)
+
+    pad_h, pad_w = max(0, tile_size - H), max(0, tile_size - W)
+    if pad_h or pad_w:
+        volume = np.pad(volume, ((0, 0), (0, pad_h), (0, pad_w)))
+    PH, PW = volume.shape[1:]
+
+    step = max(1, int(round(tile_size * (1.0 - overlap))))
+    ys = np.array(tile_starts(PH, tile_size, step))
+    xs = np.array(tile_starts(PW, tile_size, step))
+
+    # Windows intersecting each slice's lung bbox, in slice order
+    tiles = []
+    for z in lung_z:
+        y_min, y_max, x_min, x_max = bboxes[z]
+        for y in ys[(ys < y_max) & (ys + tile_size > y_min)]:
+            for x in xs[(xs < x_max) & (xs + tile_size > x_min)]:
+                tiles.append((z, int(y), int(x)))
+    if not tiles:
+        return predictions
+
+    remaining = {}
+    for z, _, _ in tiles:
+        remaining[z] = remaining.get(z, 0) + 1
+
+    weights = gaussian_importance(tile_size, sigma_scale)
+    acc = {}
+
+    def finish(z):
+        prob_sum, weight_sum = acc.pop(z)
+        covered = weight_sum > 0
+        prob_sum[covered] /= weight_sum[covered]
+        predictions[z] = (prob_sum > threshold)[:H, :W]
+
+    last = total_z - 1
+    with torch.no_grad():
+        for start in range(0, len(tiles), batch_size):
+            batch_tiles = tiles[start:start + batch_size]
+            batch = torch.from_numpy(np.stack([
+                volume[[max(0, z - 1), z, min(last, z + 1)],
+                       y:y + tile_size, x:x + tile_size]
+                for z, y, x in batch_tiles
+            ]).astype(np.float32, copy=False)).to(device)
+
+            probs = torch.sigmoid(forward(batch))[:, 0].float().cpu().numpy()
+
+            for (z, y, x), prob in zip(batch_tiles, probs):
+                if z not in acc:
+                    acc[z] = (
+                        np.zeros((PH, PW), dtype=np.float32),
+                        np.zeros((PH, PW), dtype=np.float32),
+                    )
+                prob_sum, weight_sum = acc[z]
+                prob_sum[y:y + tile_size, x:x + tile_size]   += prob * weights
+                weight_sum[y:y + tile_size, x:x + tile_size] += weights
+
+                remaining[z] -= 1
+                if remaining[z] == 0:
+                    finish(z)
+
+            if progress is not None:
+                progress(start + len(batch_tiles), len(tiles))
+
+    return predictions
+
+
+INFERENCE_MODES = {
+    "full": predict_volume,
+    "roi": predict_volume_roi,
+    "cascade": predict_volume_cascade,
+    "tiled": predict_volume_tiled,
+}
+
+
+def segment_volume(model, volume, device, mode="full", **kwargs):
+    """Run predict_volume (mode="full") or one of the other INFERENCE_MODES."""
+    if mode not in INFERENCE_MODES:
+        raise ValueError(
+            f"Unknown inference mode '{mode}', expected one of "
+            f"{tuple(INFERENCE_MODES)}"
+        )
+    return INFERENCE_MODES[mode](model, volume, device, **kwargs)
@@ -114,3 +114,19 @@ def dice_score(logits, targets, threshold = 0.5):
     )
 
     return dice.mean().item()
+
+
+def mean_slice_dice(model, loader, threshold=0.5):
+    """
+    Mean per-slice Dice of `model` over a loader of (images, masks), as
+    scripts/evaluate.py scores it (an empty prediction of an empty mask
+    counts 0). Used to compare encodings / quantized models.
+    """
+    scores = []
+    with torch.no_grad():
+        for images, masks in loader:
+            preds = (torch.sigmoid(model(images)) > threshold).float()
+            inter = (preds * masks).sum(dim=(1, 2, 3))
+            total = preds.sum(dim=(1, 2, 3)) + masks.sum(dim=(1, 2, 3))
+            scores.extend((2.0 * inter / (total + 1e-6)).tolist())
+    return sum(scores) / len(scores) if scores else 0.0
@@ -0,0 +1,141 @@
+from pathlib import Path
+import numpy as np
+import torch
+
+from src.model import LungAttentionUNet
+
+# Serving backends: the eager MONAI model or one of the exported artifacts
+BACKENDS = ("eager", "torchscript", "onnx", "int8")
+
+# Formats scripts/export_model.py writes; "int8" comes from
+# scripts/quantize_model.py
+EXPORT_FORMATS = ("torchscript", "onnx")
+
+ARTIFACT_NAMES = {
+    "torchscript": "lung_attention_unet.pt",
+    "onnx": "lung_attention_unet.onnx",
+    "int8": "lung_attention_unet_int8.pt",
+}
+
+
+def load_checkpoint_model(checkpoint_path, device="cpu"):
+    """
+    Eager LungAttentionUNet from a training checkpoint (a dict with
+    'model_state_dict' or a bare state dict), loaded with
+    weights_only=True so the file cannot run arbitrary code.
+
+    returns (model in eval mode, checkpoint)
+    """
+    model = LungAttentionUNet(in_channels=3, out_channels=1).to(device)
+    checkpoint = torch.load(checkpoint_path, map_location=device, weights_only=True)
+
+    if isinstance(checkpoint, dict) and "model_state_dict" in checkpoint:
+        model.load_state_dict(checkpoint['model_state_dict'])
+    else:
+        model.load_state_dict(checkpoint)
+    return model.eval(), checkpoint
+
+
+def export_torchscript(model, path, img_size=256):
+    """Trace and freeze `model`; batch and spatial size stay dynamic."""
+    example = torch.zeros(2, 3, img_size, img_size)
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(model.cpu().eval(), example))
+    traced.save(str(path))
+    return Path(path)
+
+
+def export_onnx(model, path, img_size=256, opset=17):
+    """ONNX graph with dynamic batch, height and width axes."""
+    example = torch.zeros(2, 3, img_size, img_size)
+    dynamic = {0: "batch", 2: "height", 3: "width"}
+    torch.onnx.export(
+        model.cpu().eval(),
+        (example,),
+        str(path),
+        input_names=["input"],
+        output_names=["logits"],
+        dynamic_axes={"input": dynamic, "logits": dynamic},
+        opset_version=opset,
+        dynamo=False,
+    )
+    return Path(path)
+
+
+class OnnxRuntimeModel:
+    """
+    ONNX Runtime session behind the model(batch) -> logits interface
+    the inference functions expect. Inputs and outputs are torch tensors.
+    """
+
+    def __init__(self, path, threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = int(threads)
+        self.session = ort.InferenceSession(
+            str(path), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def eval(self):
+        return self
+
+    def __call__(self, batch):
+        inputs = np.ascontiguousarray(batch.detach().cpu().numpy(), dtype=np.float32)
+        logits = self.session.run(None, {self.input_name: inputs})[0]
+        return torch.from_numpy(logits).to(batch.device)
+
+
+def load_exported_model(backend, path, device="cpu", threads=None):
+    """
+    Load an artifact written by scripts/export_model.py (TorchScript,
+    ONNX) or scripts/quantize_model.py (INT8 TorchScript, CPU only).
+    """
+    if backend == "torchscript":
+        return torch.jit.load(str(path), map_location=device).eval()
+    if backend == "int8":
+        return torch.jit.load(str(path), map_location="cpu").eval()
+    if backend == "onnx":
+        return OnnxRuntimeModel(path, threads=threads)
+    raise ValueError(
+        f"Unknown exported backend '{backend}', expected one of {BACKENDS[1:]}"
+    )
+
+
+def check_parity(reference, candidate, batch_sizes=(1, 4), img_sizes=(256, 128),
+                 atol=1e-4, seed=0):
+    """
+    Compare candidate(x) against reference(x) on random inputs of every
+    batch size / image size combination. Dynamic axes are exercised by
+    sizes other than the 2 x 256 x 256 export example.
+
+    returns {"max_abs_diff", "atol", "passed", "cases": [...]}
+    """
+    generator = torch.Generator().manual_seed(seed)
+    cases = []
+    with torch.no_grad():
+        for img_size in img_sizes:
+            for batch_size in batch_sizes:
+                x = torch.rand(batch_size, 3, img_size, img_size, generator=generator)
+                expected = reference(x)
+                actual   = candidate(x)
+                if tuple(actual.shape) != tuple(expected.shape):
+                    raise ValueError(
+                        f"Output shape {tuple(actual.shape)} != "
+                        f"{tuple(expected.shape)} for input {tuple(x.shape)}"
+                    )
+                cases.append({
+                    "input_shape": list(x.shape),
+                    "max_abs_diff": float((actual - expected).abs().max()),
+                })
+
+    max_diff = max(c["max_abs_diff"] for c in cases)
+    return {
+        "max_abs_diff": max_diff,
+        "atol": atol,
+        "passed": max_diff <= atol,
+        "cases": cases,
+    }
@@ -1,101 +1,64 @@
 import numpy as np
-import SimpleITK as sitk
 import scipy.ndimage as ndi
 import cv2
 
-def convert_to_hu(slices):
+from src.resampling import resample, resample_image_and_mask
+
+def convert_to_hu(slices, pixels=None, out=None):
     """
     Convert raw DICOM pixel values to Hounsfield Units.
     Handles both integer and float slopes correctly.
-    """
-    images = np.stack([s.pixel_array for s in slices]).astype(np.float32)
-
-    for i,s in enumerate(slices):
-        intercept = float(s.RescaleIntercept)
-        slope = float(s.RescaleSlope)
 
-        images[i] = images[i] * slope + intercept
+    pixels: optional (Z, H, W) stored values already decoded by
+            src.dicom_io — `slices` then only needs the headers.
+    out:    optional preallocated (Z, H, W) float32 buffer
 
-    return images.astype(np.float32)
-
-# Resampling 
-def resample_volume(volume, old_spacing, new_spacing=(1.0,1.0,1.0)):
-
-    old_spacing = np.array(old_spacing, dtype=np.float64)   # convert to z,y,x
-    new_spacing = np.array(new_spacing, dtype=np.float64)
-
-    resize_factor = old_spacing / new_spacing
-    new_shape = np.round(
-        np.array(volume.shape) * resize_factor
-    ).astype(int)
-
-    image = sitk.GetImageFromArray(volume.astype(np.float32))
-    # spacing in (x, y, z) for SimpleITK
-    image.SetSpacing([
-        float(old_spacing[2]),   # x
-        float(old_spacing[1]),   # y
-        float(old_spacing[0])    # z
-    ])
+    Slope and intercept are broadcast over the whole stack in two
+    in-place ops; the result is written straight into one float32 buffer.
+    """
+    slopes     = np.array([float(s.RescaleSlope) for s in slices], dtype=np.float32)
+    intercepts = np.array([float(s.RescaleIntercept) for s in slices], dtype=np.float32)
 
+    if pixels is None:
+        first = slices[0].pixel_array
+        shape = (len(slices),) + first.shape
+    else:
+        shape = pixels.shape
 
-    resampler = sitk.ResampleImageFilter()
-    resampler.SetInterpolator(sitk.sitkLinear)
-    resampler.SetOutputSpacing([
-        float(new_spacing[2]),
-        float(new_spacing[1]),
-        float(new_spacing[0])
-    ])
+    if out is None:
+        out = np.empty(shape, dtype=np.float32)
 
-    resampler.SetSize([
-        int(new_shape[2]),
-        int(new_shape[1]),
-        int(new_shape[0])
-    ])
+    if pixels is None:
+        for i, s in enumerate(slices):
+            out[i] = s.pixel_array
+        np.multiply(out, slopes[:, None, None], out=out)
+    else:
+        np.multiply(pixels, slopes[:, None, None], out=out)
 
-    resampler.SetOutputOrigin(image.GetOrigin())
-    resampler.SetOutputDirection(image.GetDirection())
+    np.add(out, intercepts[:, None, None], out=out)
+    return out
 
-    resampled = resampler.Execute(image)
-    result = sitk.GetArrayFromImage(resampled)
+# Resampling 
+def resample_volume(volume, old_spacing, new_spacing=(1.0,1.0,1.0),
+                    backend="sitk", threads=None):
+    """
+    Linear resampling of a CT volume to new_spacing (float32 output).
+    See src.resampling.resample for the backend and thread options.
+    """
+    result = resample(volume, old_spacing, new_spacing, order=1,
+                      backend=backend, threads=threads,
+                      out_dtype=np.float32)
     print(f"  Volume resampled: {volume.shape} → {result.shape}")
-    return result.astype(np.float32)
+    return result
 
 
 # RESAMPLE CT MASK
-def resample_mask(mask, old_spacing, new_spacing=(1.0,1.0,1.0)):
-
-    old_spacing = np.array(old_spacing, dtype=np.float64)
-    new_spacing = np.array(new_spacing, dtype=np.float64)
-
-    resize_factor = old_spacing / new_spacing
-    new_shape = np.round(np.array(mask.shape) * resize_factor).astype(int)
-
-    image = sitk.GetImageFromArray(mask.astype(np.uint8))
-    image.SetSpacing([
-        float(old_spacing[2]),
-        float(old_spacing[1]),
-        float(old_spacing[0])
-    ])
-
-    resampler = sitk.ResampleImageFilter()
-    resampler.SetInterpolator(sitk.sitkNearestNeighbor)
-    resampler.SetOutputSpacing([
-        float(new_spacing[2]),
-        float(new_spacing[1]),
-        float(new_spacing[0])
-    ])
-
-    resampler.SetSize([
-        int(new_shape[2]),
-        int(new_shape[1]),
-        int(new_shape[0])
-    ])
-
-    resampler.SetOutputOrigin(image.GetOrigin())
-    resampler.SetOutputDirection(image.GetDirection())
-
-    resampled = resampler.Execute(image)
-    result = sitk.GetArrayFromImage(resampled)
+def resample_mask(mask, old_spacing, new_spacing=(1.0,1.0,1.0),
+                  backend="sitk", threads=None):
+    """Nearest-neighbour resampling of a binary mask (uint8 output)."""
+    result = resample(np.asarray(mask, dtype=np.uint8), old_spacing,
+                      new_spacing, order=0, backend=backend,
+                      threads=threads, out_dtype=np.uint8)
 
     print(f"  Mask resampled:   {mask.shape} → {result.shape}")
     return (result > 0).astype(np.uint8)
@@ -128,21 +91,48 @@ def verify_image_mask_alignment(image_volume, mask_volume):
     return image_volume, mask_volume
 
 # LUNG WINDOW + NORMALIZATION
-def window_and_normalize(image, min_hu=-1000, max_hu=400):
+def window_and_normalize(image, min_hu=-1000, max_hu=400,
+                         inplace=False, chunk_size=None):
     """
     1. Clip to lung window HU range
     2. Z-score normalize
     3. Rescale to [0, 1] for model input
+
+    A z-score followed by min-max rescaling is, algebraically, just the
+    min-max rescaling of the clipped image (mean and std cancel), so this
+    runs as one clip pass and one affine pass with no full-size
+    temporaries.
+
+    inplace:    reuse `image` as the output when it is float32
+    chunk_size: process this many slices at a time (axis 0); keeps every
+                intermediate to one chunk when `image` is not float32 or
+                is a memmap
     """
+    image = np.asarray(image)
+
+    if inplace and image.dtype == np.float32 and image.flags.writeable:
+        out = image
+    else:
+        out = np.empty(image.shape, dtype=np.float32)
+
+    n    = image.shape[0] if image.ndim > 0 else 1
+    step = chunk_size or n
 
-    image = np.clip(image, min_hu, max_hu)
+    lo, hi = np.inf, -np.inf
+    for start in range(0, n, step):
+        dst = out[start:start + step]
+        np.clip(image[start:start + step], min_hu, max_hu, out=dst)
+        lo = min(lo, float(dst.min()))
+        hi = max(hi, float(dst.max()))
 
-    mean = np.mean(image)
-    std = np.std(image) + 1e-8
-    image = (image - mean) / std
+    scale = np.float32(1.0 / (hi - lo + 1e-8))
+    lo    = np.float32(lo)
+    for start in range(0, n, step):
+        dst = out[start:start + step]
+        np.subtract(dst, lo, out=dst)
+        np.multiply(dst, scale, out=dst)
 
-    image = (image - image.min()) / (image.max() - image.min() + 1e-8)
-    return image.astype(np.float32)
+    return out
 
 #  LUNG BOUNDING BOX
 def get_lung_bbox(slice_img, margin=10):
@@ -187,6 +177,114 @@ def get_lung_bbox(slice_img, margin=10):
 
     return y_min, y_max, x_min, x_max
 
+def get_lung_bboxes(volume, margin=10, downsample=1):
+    """
+    Volume-level get_lung_bbox: the same body/lung segmentation, run once
+    over the whole (Z, H, W) volume with 2D-only structuring elements, so
+    every slice is still processed independently but in a single call.
+
+    downsample > 1 segments a strided copy (iterations scaled to match);
+    boxes are mapped back to full resolution and are approximate.
+
+    returns
+      bboxes  (Z, 4) int32  per-slice (y_min, y_max, x_min, x_max),
+              identical to calling get_lung_bbox on each slice
+      bbox_3d (z_min, z_max, y_min, y_max, x_min, x_max) over slices where
+              lungs were found (max values exclusive), or the full volume
+      found   (Z,) bool  slices where lungs were found; the others get the
+              full (0, H, 0, W) frame, which a found box can also equal
+    """
+    Z, H, W = volume.shape
+    f = max(1, int(downsample))
+    vol = volume[:, ::f, ::f] if f > 1 else volume
+
+    if vol.max() <= 1.0:
+        body_threshold = 0.25
+        lung_threshold = 0.50
+    else:
+        body_threshold = -600
+        lung_threshold = -300
+
+    close_iter = max(1, round(5 / f))
+    open_iter  = max(1, round(2 / f))
+    cross = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
+    morph = dict(borderType=cv2.BORDER_CONSTANT, borderValue=0)
+
+    # Same ops as get_lung_bbox (4-connected cross, zero border) done
+    # with OpenCV per slice, which is an order of magnitude faster
+    body = (vol > body_threshold).view(np.uint8)
+    lung = (vol < lung_threshold).view(np.uint8)
+    flood = np.empty((vol.shape[1] + 2, vol.shape[2] + 2), dtype=np.uint8)
+    for z in range(len(vol)):
+        closed = cv2.dilate(body[z], cross, iterations=close_iter, **morph)
+        closed = cv2.erode(closed, cross, iterations=close_iter, **morph)
+
+        # Fill holes: background not 4-connected to the image border
+        flood[:] = 0
+        flood[1:-1, 1:-1] = closed
+        cv2.floodFill(flood, None, (0, 0), 1, flags=4)
+        filled = closed | (flood[1:-1, 1:-1] == 0)
+
+        opened = cv2.erode(lung[z] & filled, cross, iterations=open_iter, **morph)
+        lung[z] = cv2.dilate(opened, cross, iterations=open_iter, **morph)
+
+    # 4-connected in-plane, no connectivity along z: one label per
+    # slice component, but a single call for the whole volume
+    structure = np.zeros((3, 3, 3), dtype=bool)
+    structure[1] = ndi.generate_binary_structure(2, 1)
+    label, num = ndi.label(lung, structure)
+
+    bboxes = np.tile(np.array([0, H, 0, W], dtype=np.int32), (Z, 1))
+    if num == 0:
+        return bboxes, (0, Z, 0, H, 0, W), np.zeros(Z, dtype=bool)
+
+    sizes   = np.bincount(label.ravel(), minlength=num + 1)[1:]
+    objects = ndi.find_objects(label)
+    comp = np.array([
+        [o[0].start, o[1].start, o[1].stop - 1, o[2].start, o[2].stop - 1]
+        for o in objects
+    ])
+
+    # Two largest components per slice: sort by (z, size), keep the last two
+    order  = np.lexsort((sizes, comp[:, 0]))
+    comp_z = comp[order, 0]
+    keep   = np.ones(num, dtype=bool)
+    keep[:-2] = comp_z[:-2] != comp_z[2:]
+    comp   = comp[order[keep]]
+
+    z_idx = comp[:, 0]
+    y_min = np.full(Z, np.iinfo(np.int64).max)
+    x_min = np.full(Z, np.iinfo(np.int64).max)
+    y_max = np.full(Z, -1)
+    x_max = np.full(Z, -1)
+    np.minimum.at(y_min, z_idx, comp[:, 1] * f)
+    np.maximum.at(y_max, z_idx, comp[:, 2] * f + (f - 1))
+    np.minimum.at(x_min, z_idx, comp[:, 3] * f)
+    np.maximum.at(x_max, z_idx, comp[:, 4] * f + (f - 1))
+
+    found = y_max >= 0
+    y_min = np.maximum(0, y_min - margin)
+    x_min = np.maximum(0, x_min - margin)
+    y_max = np.minimum(H, np.minimum(y_max, H - 1) + margin)
+    x_max = np.minimum(W, np.minimum(x_max, W - 1) + margin)
+    found &= (y_min < y_max) & (x_min < x_max)
+
+    bboxes[found] = np.stack(
+        [y_min[found], y_max[found], x_min[found], x_max[found]], axis=1
+    )
+
+    z_found = np.flatnonzero(found)
+    if len(z_found) == 0:
+        return bboxes, (0, Z, 0, H, 0, W), found
+
+    boxes = bboxes[found]
+    bbox_3d = (
+        int(z_found[0]), int(z_found[-1]) + 1,
+        int(boxes[:, 0].min()), int(boxes[:, 1].max()),
+        int(boxes[:, 2].min()), int(boxes[:, 3].max()),
+    )
+    return bboxes, bbox_3d, found
+
 # Resize
 def resize_image(image, size=256):
    
@@ -228,14 +326,15 @@ def preprocess_patient(dicom_slices, mask_volume, old_spacing):
     # 1. HU conversion
     ct_volume = convert_to_hu(dicom_slices)
 
-    # 2. Resample both to isotropic 1mm spacing
-    ct_resampled   = resample_volume(ct_volume,   old_spacing)
-    mask_resampled = resample_mask(mask_volume,   old_spacing)
+    # 2. Resample both to isotropic 1mm spacing (shared output grid)
+    ct_resampled, mask_resampled = resample_image_and_mask(
+        ct_volume, mask_volume, old_spacing
+    )
 
     # 3. Verify alignment
     verify_image_mask_alignment(ct_resampled, mask_resampled)
 
     # 4. Window and normalize
-    ct_normalized = window_and_normalize(ct_resampled)
+    ct_normalized = window_and_normalize(ct_resampled, inplace=True)
 
     return ct_normalized, mask_resampled
\ No newline at end of file
@@ -0,0 +1,55 @@
+import copy
+import io
+import time
+import torch
+
+
+def quantize_static_fx(model, calibration_batches, backend="x86"):
+    """
+    Post-training static INT8 quantization with FX graph mode.
+
+    Observers are inserted for every conv / activation, fed the
+    calibration batches (N, 3, H, W) to collect activation ranges, and
+    the model is converted to quantized CPU kernels. `model` itself is
+    left untouched.
+
+    backend: "x86" / "fbgemm" (x86 servers) or "qnnpack" (ARM)
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    torch.backends.quantized.engine = backend
+    model = copy.deepcopy(model).cpu().eval()
+    example = (calibration_batches[0].cpu(),)
+
+    prepared = prepare_fx(model, get_default_qconfig_mapping(backend), example)
+    with torch.no_grad():
+        for batch in calibration_batches:
+            prepared(batch.cpu())
+    return convert_fx(prepared)
+
+
+def to_torchscript(model, img_size=256):
+    """Trace + freeze, e.g. for serving a quantized model with torch.jit.load."""
+    example = torch.zeros(1, 3, img_size, img_size)
+    with torch.no_grad():
+        return torch.jit.freeze(torch.jit.trace(model.eval(), example))
+
+
+def serialized_nbytes(scripted):
+    """Size of a TorchScript module as written to disk."""
+    buffer = io.BytesIO()
+    torch.jit.save(scripted, buffer)
+    return buffer.getbuffer().nbytes
+
+
+def throughput(model, batch, repeats=5, warmup=1):
+    """Images per second of model(batch) on the current thread settings."""
+    with torch.no_grad():
+        for _ in range(warmup):
+            model(batch)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model(batch)
+        elapsed = time.perf_counter() - start
+    return batch.shape[0] * repeats / elapsed
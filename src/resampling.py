@@ -0,0 +1,164 @@
+import numpy as np
+import SimpleITK as sitk
+import scipy.ndimage as ndi
+
+BACKENDS = ("sitk", "scipy", "torch")
+
+_SITK_PIXEL_TYPES = {
+    np.dtype(np.uint8): sitk.sitkUInt8,
+    np.dtype(np.int16): sitk.sitkInt16,
+    np.dtype(np.float32): sitk.sitkFloat32,
+    np.dtype(np.float64): sitk.sitkFloat64,
+}
+
+
+def output_shape(shape, old_spacing, new_spacing=(1.0, 1.0, 1.0)):
+    """(z, y, x) shape after resampling from old_spacing to new_spacing."""
+    old_spacing = np.array(old_spacing, dtype=np.float64)
+    new_spacing = np.array(new_spacing, dtype=np.float64)
+
+    resize_factor = old_spacing / new_spacing
+    return tuple(
+        int(n) for n in np.round(np.array(shape) * resize_factor).astype(int)
+    )
+
+
+def _resample_sitk(array, old_spacing, new_spacing, shape, order,
+                   threads, out_dtype):
+    image = sitk.GetImageFromArray(array)
+    # spacing in (x, y, z) for SimpleITK
+    image.SetSpacing([float(v) for v in old_spacing[::-1]])
+
+    resampler = sitk.ResampleImageFilter()
+    resampler.SetInterpolator(
+        sitk.sitkLinear if order == 1 else sitk.sitkNearestNeighbor
+    )
+    resampler.SetOutputSpacing([float(v) for v in new_spacing[::-1]])
+    resampler.SetSize([int(v) for v in shape[::-1]])
+    resampler.SetOutputOrigin(image.GetOrigin())
+    resampler.SetOutputDirection(image.GetDirection())
+    resampler.SetOutputPixelType(_SITK_PIXEL_TYPES[out_dtype])
+    if threads:
+        resampler.SetNumberOfThreads(int(threads))
+
+    return sitk.GetArrayFromImage(resampler.Execute(image))
+
+
+def _resample_scipy(array, old_spacing, new_spacing, shape, order,
+                    out_dtype):
+    # Output voxel i samples input coordinate i * new/old — the same
+    # origin-aligned grid SimpleITK uses (zoom's diagonal fast path)
+    return ndi.affine_transform(
+        array,
+        new_spacing / old_spacing,
+        output_shape=shape,
+        output=out_dtype,
+        order=order,
+        mode="nearest",
+        prefilter=False,
+    )
+
+
+def _resample_torch(array, old_spacing, new_spacing, shape, order,
+                    out_dtype):
+    import torch
+
+    t = torch.from_numpy(np.ascontiguousarray(array))
+    if order == 1:
+        t = t.float()
+
+    # Separable, on the same origin-aligned grid as SimpleITK; axes
+    # that shrink go first so later passes touch fewer voxels
+    axes = sorted(range(3), key=lambda a: shape[a] / t.shape[a])
+    for axis in axes:
+        n_in  = t.shape[axis]
+        n_out = shape[axis]
+        pos  = torch.arange(n_out, dtype=torch.float64)
+        pos  = pos * float(new_spacing[axis] / old_spacing[axis])
+
+        if order == 0:
+            idx = torch.floor(pos + 0.5).clamp(0, n_in - 1).long()
+            t = t.index_select(axis, idx)
+            continue
+
+        lo = torch.floor(pos).clamp(0, n_in - 1)
+        hi = (lo + 1).clamp(max=n_in - 1)
+        w  = (pos - lo).clamp(0, 1).float()
+        view = [1, 1, 1]
+        view[axis] = n_out
+        t = torch.lerp(
+            t.index_select(axis, lo.long()),
+            t.index_select(axis, hi.long()),
+            w.view(view),
+        )
+
+    return t.numpy().astype(out_dtype, copy=False)
+
+
+_RESAMPLERS = {
+    "sitk": _resample_sitk,
+    "scipy": _resample_scipy,
+    "torch": _resample_torch,
+}
+
+
+def resample(array, old_spacing, new_spacing=(1.0, 1.0, 1.0), order=1,
+             backend="sitk", threads=None, out_dtype=np.float32, shape=None):
+    """
+    Resample a (Z, Y, X) array to new_spacing.
+
+    order:     1 = linear (images), 0 = nearest neighbour (masks)
+    backend:   "sitk" (ResampleImageFilter), "scipy" (ndimage) or
+               "torch" (separable interpolation on CPU tensors)
+    threads:   SimpleITK worker threads; None keeps its process default.
+               torch runs on the process's intra-op pool (torch's thread
+               count is process-global, so it is never changed per call)
+               and scipy's ndimage is single-threaded
+    out_dtype: output dtype, produced directly by the backend
+    shape:     explicit output shape; computed from the spacings if None
+
+    All backends sample the same origin-aligned grid. They agree in the
+    interior; at the far edge SimpleITK returns 0 for samples that fall
+    outside the input buffer, while scipy/torch repeat the edge voxel.
+    """
+    if backend not in _RESAMPLERS:
+        raise ValueError(
+            f"Unknown resampling backend '{backend}', expected one of {BACKENDS}"
+        )
+
+    old_spacing = np.array(old_spacing, dtype=np.float64)
+    new_spacing = np.array(new_spacing, dtype=np.float64)
+    if shape is None:
+        shape = output_shape(array.shape, old_spacing, new_spacing)
+
+    if backend == "sitk":
+        return _resample_sitk(
+            array, old_spacing, new_spacing, tuple(shape), order,
+            threads, np.dtype(out_dtype)
+        )
+    return _RESAMPLERS[backend](
+        array, old_spacing, new_spacing, tuple(shape), order,
+        np.dtype(out_dtype)
+    )
+
+
+def resample_image_and_mask(image, mask, old_spacing,
+                            new_spacing=(1.0, 1.0, 1.0),
+                            backend="sitk", threads=None):
+    """
+    Resample a CT volume (linear, float32) and its mask (nearest, uint8)
+    onto one output grid. Both results are guaranteed to share a shape.
+    """
+    if image.shape != mask.shape:
+        raise ValueError(
+            f"Image {image.shape} and mask {mask.shape} must share a grid"
+        )
+
+    shape = output_shape(image.shape, old_spacing, new_spacing)
+    image = resample(image, old_spacing, new_spacing, order=1,
+                     backend=backend, threads=threads,
+                     out_dtype=np.float32, shape=shape)
+    mask  = resample(np.asarray(mask, dtype=np.uint8), old_spacing, new_spacing,
+                     order=0, backend=backend, threads=threads,
+                     out_dtype=np.uint8, shape=shape)
+    return image, (mask > 0).astype(np.uint8)
@@ -0,0 +1,189 @@
+import os
+from functools import partial
+from pathlib import Path
+
+import torch
+
+_NODE_DIR = Path("/sys/devices/system/node")
+
+
+def parse_cpulist(text):
+    """'0-3,8,10-11' (sysfs / taskset format) -> [0, 1, 2, 3, 8, 10, 11]"""
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        lo, _, hi = part.partition("-")
+        cpus.extend(range(int(lo), int(hi or lo) + 1))
+    return cpus
+
+
+def format_cpulist(cpus):
+    """Inverse of parse_cpulist, collapsing consecutive runs."""
+    runs = []
+    for cpu in sorted(cpus):
+        if runs and cpu == runs[-1][1] + 1:
+            runs[-1][1] = cpu
+        else:
+            runs.append([cpu, cpu])
+    return ",".join(f"{lo}-{hi}" if hi > lo else str(lo) for lo, hi in runs)
+
+
+def available_cpus():
+    """CPUs this process may run on (respects taskset / cgroup cpusets)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def numa_nodes(cpus=None):
+    """
+    {node: [cpus]} restricted to `cpus` (default: available_cpus()).
+    Hosts without sysfs NUMA information count as a single node.
+    """
+    cpus = set(available_cpus() if cpus is None else cpus)
+    nodes = {}
+    for node_dir in sorted(_NODE_DIR.glob("node[0-9]*")):
+        try:
+            node_cpus = parse_cpulist((node_dir / "cpulist").read_text())
+        except OSError:
+            continue
+        node_cpus = [c for c in node_cpus if c in cpus]
+        if node_cpus:
+            nodes[int(node_dir.name[4:])] = node_cpus
+    return nodes or {0: sorted(cpus)}
+
+
+def cpu_partition(index, count, cpus=None):
+    """
+    CPUs for process `index` of `count` processes sharing `cpus`.
+
+    Processes are spread across NUMA nodes round-robin first; the CPUs of
+    a node are then split evenly between the processes placed on it, so a
+    process only spans several nodes when there are fewer processes than
+    nodes.
+    """
+    if not 0 <= index < count:
+        raise ValueError(f"Process index {index} outside 0..{count - 1}")
+    nodes = list(numa_nodes(cpus).values())
+    if count <= len(nodes):
+        return sorted(
+            c for i, node in enumerate(nodes) if i % count == index for c in node
+        )
+
+    node = nodes[index % len(nodes)]
+    peers = list(range(index % len(nodes), count, len(nodes)))
+    k, share = peers.index(index), len(peers)
+    return node[k * len(node) // share:(k + 1) * len(node) // share] or node
+
+
+def thread_budget(num_cpus, concurrent_tasks=1):
+    """
+    Per-library thread counts for a process that owns `num_cpus` cores
+    and runs `concurrent_tasks` preprocessing jobs at once.
+
+    Torch's intra-op pool is shared by the whole process, so it gets every
+    core. OpenCV and SimpleITK calls run per task, in parallel, so they
+    share the cores between tasks instead of each taking all of them.
+    """
+    num_cpus = max(1, int(num_cpus))
+    per_task = max(1, num_cpus // max(1, int(concurrent_tasks)))
+    return {
+        "torch": num_cpus,
+        "torch_interop": 1,
+        "opencv": per_task,
+        "sitk": per_task,
+    }
+
+
+def apply_runtime_config(threads, affinity=None):
+    """
+    Pin the process to `affinity` (a list of CPUs, optional) and set the
+    thread pools of torch, OpenCV and SimpleITK from `threads`, a dict
+    like thread_budget() returns. Missing / None entries are left alone.
+
+    returns runtime_status()
+    """
+    if affinity:
+        os.sched_setaffinity(0, affinity)
+
+    if threads.get("torch"):
+        torch.set_num_threads(int(threads["torch"]))
+    if threads.get("torch_interop"):
+        try:
+            torch.set_num_interop_threads(int(threads["torch_interop"]))
+        except RuntimeError:
+            # Only settable before the first inter-op parallel call
+            pass
+    if threads.get("opencv"):
+        import cv2
+        cv2.setNumThreads(int(threads["opencv"]))
+    if threads.get("sitk"):
+        import SimpleITK as sitk
+        sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(int(threads["sitk"]))
+
+    return runtime_status()
+
+
+def runtime_status():
+    """Effective thread counts and affinity of this process."""
+    import cv2
+    import SimpleITK as sitk
+
+    cpus = available_cpus()
+    return {
+        "pid": os.getpid(),
+        "host_cpus": os.cpu_count(),
+        "affinity": format_cpulist(cpus),
+        "numa_nodes": {
+            node: format_cpulist(node_cpus)
+            for node, node_cpus in numa_nodes(cpus).items()
+        },
+        "threads": {
+            "torch": torch.get_num_threads(),
+            "torch_interop": torch.get_num_interop_threads(),
+            "opencv": cv2.getNumThreads(),
+            "sitk": sitk.ProcessObject.GetGlobalDefaultNumberOfThreads(),
+        },
+    }
+
+
+def reserve_cpus(count, cpus=None):
+    """
+    Split `cpus` (default: available_cpus()) into the `count` CPUs of the
+    main process, taken node by node from the first NUMA node, and the
+    rest for its DataLoader workers. When no CPU would be left over, both
+    get all of them.
+
+    returns (main_cpus, worker_cpus)
+    """
+    cpus = available_cpus() if cpus is None else sorted(cpus)
+    ordered = [c for node in numa_nodes(cpus).values() for c in node]
+    ordered += sorted(set(cpus) - set(ordered))
+    main, rest = sorted(ordered[:max(1, count)]), sorted(ordered[max(1, count):])
+    if not rest:
+        return cpus, cpus
+    return main, rest
+
+
+def _init_loader_worker(worker_id, threads, pin, cpus):
+    info = torch.utils.data.get_worker_info()
+    num_workers = info.num_workers if info is not None else 1
+    # Split the CPUs left to the workers (default: the inherited affinity)
+    cpus = cpu_partition(worker_id, num_workers, cpus) if pin else None
+    apply_runtime_config(thread_budget(threads), affinity=cpus)
+
+
+def loader_worker_init(threads=1, pin=False, cpus=None):
+    """
+    DataLoader worker_init_fn giving every worker `threads` threads per
+    library (and, with pin=True, its own slice of `cpus` — pass the
+    worker CPUs of reserve_cpus() to keep them off the main process's)
+    instead of each worker spinning up a pool the size of the host.
+    """
+    return partial(_init_loader_worker, threads=threads, pin=pin, cpus=cpus)
+
+
+def init_process_threads(threads):
+    """ProcessPoolExecutor initializer with the same per-library budget."""
+    apply_runtime_config(thread_budget(threads))
@@ -0,0 +1,249 @@
+import io
+import json
+import math
+import multiprocessing
+import os
+import random
+import tarfile
+from pathlib import Path
+import numpy as np
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+
+from src.cache import decode_volume, encode_volume, open_patient_cache
+from src.tensor_store import STORE_DTYPES, patient_samples
+
+# Sequential shard layout (one directory per split):
+#   {shard_dir}/shard-{i:05d}.tar   uncompressed tar, one member per sample:
+#       {pid}-{z:04d}.npz  image (3, S, S) float16 | uint8, mask packbits,
+#                          tumor_pixels
+#   {shard_dir}/shards.json         shard names and per-sample tumor pixel
+#                                   counts, written last
+#
+# Shards are read front to back with tarfile's streaming mode, so they
+# work on read-only network / object-store mounts without seeking.
+
+SHARD_FORMAT_VERSION = 1
+SHARD_INDEX_NAME = "shards.json"
+
+
+def buffered_shuffle(samples, buffer_size, rng):
+    """
+    Approximate shuffle of a stream: keep `buffer_size` items and emit a
+    random one as each new item arrives. buffer_size <= 1 keeps order.
+    """
+    if buffer_size <= 1:
+        yield from samples
+        return
+
+    buffer = []
+    for sample in samples:
+        if len(buffer) < buffer_size:
+            buffer.append(sample)
+            continue
+        i = rng.randrange(buffer_size)
+        yield buffer[i]
+        buffer[i] = sample
+
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+def _encode_sample(image, mask, tumor_pixels, dtype):
+    buf = io.BytesIO()
+    np.savez(
+        buf,
+        image=encode_volume(image, dtype),
+        mask=np.packbits(mask.reshape(-1) > 0),
+        tumor_pixels=np.int32(tumor_pixels),
+    )
+    return buf.getvalue()
+
+
+def _add_member(tar, name, payload):
+    info = tarfile.TarInfo(name)
+    info.size = len(payload)
+    tar.addfile(info, io.BytesIO(payload))
+
+
+def write_shards(cache_dir, shard_dir, patient_ids, img_size=256,
+                 dtype="float16", samples_per_shard=2048, shuffle_buffer=1024,
+                 seed=42):
+    """
+    Pack every cached slice of `patient_ids` into sequential tar shards.
+    Patients are visited in random order and samples pass through a
+    write-side shuffle buffer, so each shard mixes many patients and a
+    reader's own shuffle buffer has less to do.
+
+    returns the shard index
+    """
+    if dtype not in STORE_DTYPES:
+        raise ValueError(f"Unknown shard dtype '{dtype}', expected one of {STORE_DTYPES}")
+
+    rng = random.Random(seed)
+    patients = list(patient_ids)
+    rng.shuffle(patients)
+
+    def samples():
+        for pid in patients:
+            cache = open_patient_cache(cache_dir, pid)
+            if cache is None:
+                print(f"  [SKIP] No cached masks for {pid}")
+                continue
+            for z, image, mask, count in patient_samples(
+                cache_dir, pid, cache, img_size
+            ):
+                yield f"{pid}-{z:04d}", count, _encode_sample(image, mask, count, dtype)
+            print(f"  {pid} — {cache.num_slices} slices")
+
+    shard_dir = Path(shard_dir)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    # Drop the index first: a half-rewritten split must not look complete
+    (shard_dir / SHARD_INDEX_NAME).unlink(missing_ok=True)
+    for old in [*shard_dir.glob("shard-*.tar"), *shard_dir.glob(".shard-*.tmp")]:
+        old.unlink()
+
+    shards = []
+    tar = None
+    for key, count, payload in buffered_shuffle(samples(), shuffle_buffer, rng):
+        if tar is None or len(shards[-1]["tumor_pixel_counts"]) >= samples_per_shard:
+            if tar is not None:
+                tar.close()
+            name = f"shard-{len(shards):05d}.tar"
+            tar = tarfile.open(shard_dir / f".{name}.tmp", "w")
+            shards.append({"name": name, "tumor_pixel_counts": []})
+        _add_member(tar, f"{key}.npz", payload)
+        shards[-1]["tumor_pixel_counts"].append(count)
+    if tar is not None:
+        tar.close()
+
+    for shard in shards:
+        os.replace(shard_dir / f".{shard['name']}.tmp", shard_dir / shard["name"])
+
+    index = {
+        "format_version": SHARD_FORMAT_VERSION,
+        "img_size": int(img_size),
+        "dtype": dtype,
+        "num_samples": sum(len(s["tumor_pixel_counts"]) for s in shards),
+        "patients": sorted(patients),
+        "shards": shards,
+    }
+    with open(shard_dir / SHARD_INDEX_NAME, "w") as f:
+        json.dump(index, f)
+    return index
+
+
+def has_shards(shard_dir):
+    return (Path(shard_dir) / SHARD_INDEX_NAME).exists()
+
+
+def _distributed_rank():
+    if torch.distributed.is_available() and torch.distributed.is_initialized():
+        return torch.distributed.get_rank(), torch.distributed.get_world_size()
+    return int(os.environ.get("RANK", 0)), int(os.environ.get("WORLD_SIZE", 1))
+
+
+class ShardedSliceDataset(IterableDataset):
+    """
+    Streams (image, mask) samples from the shards of one split.
+
+    Every epoch the shard order is reshuffled (identically on all ranks,
+    from seed + epoch), then shards are dealt out rank-first, worker
+    second, so each shard is read by exactly one worker of one rank.
+    Background slices are kept with the probability that gives
+    `bg_ratio` background per tumor slice on average, over the split.
+    """
+
+    def __init__(self, shard_dir, bg_ratio=2, min_tumor_pixels=10,
+                 shuffle_buffer=2048, shuffle=True, seed=42,
+                 rank=None, world_size=None):
+        self.shard_dir = Path(shard_dir)
+        with open(self.shard_dir / SHARD_INDEX_NAME) as f:
+            self.index = json.load(f)
+
+        self.img_size = self.index["img_size"]
+        self.shards   = [s["name"] for s in self.index["shards"]]
+        self.min_tumor_pixels = min_tumor_pixels
+        self.shuffle_buffer   = shuffle_buffer if shuffle else 0
+        self.shuffle = shuffle
+        self.seed    = seed
+
+        if rank is None or world_size is None:
+            rank, world_size = _distributed_rank()
+        self.rank, self.world_size = rank, world_size
+        if len(self.shards) < world_size:
+            raise ValueError(
+                f"{len(self.shards)} shards cannot feed {world_size} ranks; "
+                f"write smaller shards"
+            )
+
+        counts = np.concatenate([
+            np.asarray(s["tumor_pixel_counts"], dtype=np.int64)
+            for s in self.index["shards"]
+        ]) if self.shards else np.zeros(0, dtype=np.int64)
+        self.num_tumor = int(np.count_nonzero(counts >= min_tumor_pixels))
+        self.num_bg    = int(len(counts) - self.num_tumor)
+        self.bg_keep   = (
+            min(1.0, bg_ratio * self.num_tumor / self.num_bg) if self.num_bg else 0.0
+        )
+
+        # Shared with the DataLoader workers, persistent ones included
+        self._epoch = multiprocessing.Value("i", 0)
+
+        print(f"  {len(self.shards)} shards | tumor: {self.num_tumor} | "
+              f"bg: {self.num_bg} (keep p={self.bg_keep:.3f}) | "
+              f"rank {rank}/{world_size}")
+
+    def set_epoch(self, epoch):
+        self._epoch.value = int(epoch)
+
+    def __len__(self):
+        """Expected samples per epoch on this rank."""
+        expected = self.num_tumor + self.bg_keep * self.num_bg
+        return math.ceil(expected / self.world_size)
+
+    def _worker_shards(self, epoch):
+        shards = list(self.shards)
+        if self.shuffle:
+            random.Random(self.seed + epoch).shuffle(shards)
+        shards = shards[self.rank::self.world_size]
+
+        info = get_worker_info()
+        if info is not None:
+            shards = shards[info.id::info.num_workers]
+        return shards
+
+    def _read_shard(self, name, rng):
+        # "r|" streams the tar front to back, never seeking
+        with tarfile.open(self.shard_dir / name, "r|") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                with np.load(io.BytesIO(tar.extractfile(member).read())) as data:
+                    count = int(data["tumor_pixels"])
+                    if count < self.min_tumor_pixels and rng.random() >= self.bg_keep:
+                        continue
+                    yield data["image"], data["mask"]
+
+    def _decode(self, image, mask):
+        size = self.img_size
+        image = torch.from_numpy(decode_volume(image))
+        mask  = np.unpackbits(mask, count=size * size).reshape(1, size, size)
+        return image, torch.from_numpy(mask.astype(np.float32))
+
+    def __iter__(self):
+        epoch = self._epoch.value
+        info  = get_worker_info()
+        worker = info.id if info is not None else 0
+        # Different stream per rank / worker, reproducible per epoch
+        rng = random.Random(
+            f"{self.seed}-{epoch}-{self.rank}-{worker}" if self.shuffle
+            else self.seed
+        )
+
+        def samples():
+            for name in self._worker_shards(epoch):
+                yield from self._read_shard(name, rng)
+
+        for image, mask in buffered_shuffle(samples(), self.shuffle_buffer, rng):
+            yield self._decode(image, mask)
@@ -0,0 +1,182 @@
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+import numpy as np
+
+from src.cache import (
+    decode_volume,
+    encode_volume,
+    load_patient_index,
+    open_patient_cache,
+)
+from src.preprocessing import resize_image, resize_mask
+
+# Training-resolution store (one directory per split):
+#   {store_dir}/images.npy   (N, 3, S, S) float16 | uint8 (value * 255)
+#   {store_dir}/masks.npy    (N, S*S/8)   uint8, np.packbits of the mask
+#   {store_dir}/slices.npy   (N, 3)       int32: patient index, z, tumor pixels
+#                                         (at cache resolution, as the index)
+#   {store_dir}/manifest.json
+#
+# Every row is one 2.5D sample exactly as LungSegmentationDataset builds
+# it from the cache: slices z-1, z, z+1 cropped to z's lung box and
+# resized to S x S, with the resized binary mask of slice z.
+
+STORE_FORMAT_VERSION = 1
+STORE_DTYPES = ("float16", "uint8")
+MANIFEST_NAME = "manifest.json"
+
+
+def crop_resize_sample(cache, z, img_size=256):
+    """
+    (3, S, S) float32 image and (S, S) uint8 mask of slice z of an open
+    patient cache: neighbours z-1 / z+1 as extra channels (clamped at
+    the ends), all cropped to z's lung box and resized to img_size.
+    """
+    total_z  = cache.num_slices
+    z        = min(z, total_z - 1)
+    prev_idx = max(0, z - 1)
+    next_idx = min(total_z - 1, z + 1)
+
+    y_min, y_max, x_min, x_max = (int(v) for v in cache.bboxes[z])
+
+    # Only the lung crop of the three slices is read
+    image = cache.read_stack(
+        [prev_idx, z, next_idx], y_min, y_max, x_min, x_max
+    )
+    mask  = cache.read_mask(z, y_min, y_max, x_min, x_max)
+
+    image = np.stack([resize_image(image[c], img_size) for c in range(3)])
+    mask  = resize_mask(mask, img_size)
+    return image, mask
+
+
+def patient_samples(cache_dir, pid, cache, img_size=256):
+    """
+    Yield (z, image, mask, tumor_pixels) for every slice of an open
+    patient cache, as crop_resize_sample builds them. tumor_pixels is
+    counted at cache resolution, the counts the dataset splits on.
+    """
+    index  = load_patient_index(cache_dir, pid)
+    counts = (
+        index["tumor_pixel_counts"] if index is not None
+        else cache.tumor_pixel_counts()
+    )
+    for z in range(cache.num_slices):
+        image, mask = crop_resize_sample(cache, z, img_size)
+        yield z, image, mask, int(counts[z])
+
+
+def build_tensor_store(cache_dir, store_dir, patient_ids, img_size=256,
+                       dtype="float16"):
+    """
+    Materialise every cached slice of `patient_ids` at training
+    resolution into one contiguous array per field. Written to a staging
+    directory and renamed into place, so a store is either complete or
+    absent.
+
+    returns the manifest
+    """
+    if dtype not in STORE_DTYPES:
+        raise ValueError(f"Unknown store dtype '{dtype}', expected one of {STORE_DTYPES}")
+
+    caches, patients = [], []
+    for pid in patient_ids:
+        cache = open_patient_cache(cache_dir, pid)
+        if cache is None:
+            print(f"  [SKIP] No cached masks for {pid}")
+            continue
+        caches.append(cache)
+        patients.append(pid)
+    total = sum(cache.num_slices for cache in caches)
+
+    store_dir = Path(store_dir)
+    store_dir.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=f".tmp-{store_dir.name}-",
+                                    dir=store_dir.parent))
+    try:
+        images = np.lib.format.open_memmap(
+            staging / "images.npy", mode="w+", dtype=np.dtype(dtype),
+            shape=(total, 3, img_size, img_size)
+        )
+        masks = np.lib.format.open_memmap(
+            staging / "masks.npy", mode="w+", dtype=np.uint8,
+            shape=(total, (img_size * img_size + 7) // 8)
+        )
+        slices = np.zeros((total, 3), dtype=np.int32)
+
+        row = 0
+        for p, (pid, cache) in enumerate(zip(patients, caches)):
+            for z, image, mask, count in patient_samples(
+                cache_dir, pid, cache, img_size
+            ):
+                images[row] = encode_volume(image, dtype)
+                masks[row]  = np.packbits(mask.reshape(-1) > 0)
+                slices[row] = (p, z, count)
+                row += 1
+            print(f"  {pid} — {cache.num_slices} slices")
+
+        images.flush()
+        masks.flush()
+        del images, masks
+        np.save(staging / "slices.npy", slices)
+
+        manifest = {
+            "format_version": STORE_FORMAT_VERSION,
+            "img_size": int(img_size),
+            "dtype": dtype,
+            "num_samples": int(total),
+            "patients": patients,
+        }
+        with open(staging / MANIFEST_NAME, "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        if store_dir.exists():
+            shutil.rmtree(store_dir)
+        os.replace(staging, store_dir)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return manifest
+
+
+def has_tensor_store(store_dir):
+    return (Path(store_dir) / MANIFEST_NAME).exists()
+
+
+class TensorStore:
+    """
+    Read-only view of one split. Arrays are np.memmap views, so opening
+    is cheap and each sample read touches one contiguous row.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / MANIFEST_NAME) as f:
+            self.manifest = json.load(f)
+
+        self.img_size = self.manifest["img_size"]
+        self.patients = self.manifest["patients"]
+        self.images = np.load(self.path / "images.npy", mmap_mode="r")
+        self.masks  = np.load(self.path / "masks.npy",  mmap_mode="r")
+        self.slices = np.load(self.path / "slices.npy")
+
+    def __len__(self):
+        return len(self.slices)
+
+    def rows(self):
+        """{(pid, z): row} for every stored sample"""
+        return {
+            (self.patients[p], int(z)): row
+            for row, (p, z, _) in enumerate(self.slices)
+        }
+
+    def read(self, row):
+        """(3, S, S) float32 image and (S, S) float32 mask of one row"""
+        image = decode_volume(self.images[row])
+        mask  = np.unpackbits(
+            np.asarray(self.masks[row]), count=self.img_size * self.img_size
+        )
+        return image, mask.reshape(self.img_size, self.img_size).astype(np.float32)
@@ -1,28 +1,38 @@
 from pathlib import Path
 import numpy as np
 import torch
-from torch.utils.data import Dataset
-import torchvision.transforms as T
-from torchvision.transforms import InterpolationMode
-import torchvision.transforms.functional as TF
-import random
-import pydicom
-
-from src.preprocessing import (
-    convert_to_hu,
-    resample_volume,
-    resample_mask,
-    window_and_normalize,
-    get_lung_bbox,
-    resize_image,
-    resize_mask,
-    get_tumor_slices,
-    verify_image_mask_alignment,
-)
+from torch.utils.data import Dataset, Sampler
+from sklearn.model_selection import train_test_split
+
+from configs.config import CACHE_DIR
+from src.augment import augment_batch
+from src.cache import load_patient_index, open_patient_cache, split_slices
+from src.tensor_store import TensorStore, crop_resize_sample
+
+
+def split_patients(mask_dir, val_split, seed):
+    """
+    (train_ids, val_ids) over the patients with a mask in `mask_dir` —
+    the one split every training and evaluation script shares.
+    """
+    patient_ids = [
+        f.stem.replace('_mask', '')
+        for f in Path(mask_dir).glob('*_mask.npy')
+    ]
+    return train_test_split(
+        patient_ids,
+        test_size=val_split,
+        random_state=seed
+    )
 
 
 class LungSegmentationDataset(Dataset):
-
+    """
+    Every cached slice of `patient_ids` as a 2.5D sample. The index is
+    static and held in numpy arrays (patient code, z, tumor flag), so
+    worker processes share it without copy-on-write churn; pair it with
+    BalancedSliceSampler for the per-epoch tumor / background draw.
+    """
 
     def __init__(
         self,
@@ -33,175 +43,164 @@ class LungSegmentationDataset(Dataset):
         augment=False,
         min_tumor_pixels=10,
         bg_ratio=2,
+        cache_dir=CACHE_DIR,
+        store_dir=None,
     ):
         self.img_size  = img_size
         self.augment   = augment
         self.bg_ratio  = bg_ratio
         self.raw_dir   = Path(raw_dir)
         self.mask_dir  = Path(mask_dir)
-
-        self.tumor_samples = []
-        self.bg_samples    = []
-
-        
-        self.patient_series_dirs = {}
-
+        self.cache_dir = Path(cache_dir)
+
+        # Opened lazily in each DataLoader worker (memmaps don't pickle)
+        self._caches = {}
+        self.max_open_patients = 64
+
+        # Optional training-resolution store (scripts/build_tensor_store.py):
+        # stored samples skip the crop / resize, the rest read the cache
+        self.store_dir = Path(store_dir) if store_dir is not None else None
+        self._store = None
+        store_rows = {}
+        if self.store_dir is not None:
+            store = TensorStore(self.store_dir)
+            if store.img_size != img_size:
+                raise ValueError(
+                    f"Tensor store {self.store_dir} holds {store.img_size} px "
+                    f"samples, dataset expects {img_size}"
+                )
+            store_rows = store.rows()
+
+        patients, sample_z, sample_tumor = [], [], []
         for pid in patient_ids:
-            cache_dir = Path("data/cache")
-            mask_cache_dir = cache_dir / f"{pid}_masks"
-            
-            if not mask_cache_dir.exists():
-                print(f"  [SKIP] No cached masks for {pid}")
-                continue
-
-            # Load all mask slices to find tumor indices (once per patient)
-            mask_slices = sorted(list(mask_cache_dir.glob("*.npy")))
-            tumor_indices = []
-            non_tumor_indices = []
-
-            for i, m_path in enumerate(mask_slices):
-                mask_slice = np.load(m_path)
-                if np.sum(mask_slice > 0) >= min_tumor_pixels:
-                    tumor_indices.append(i)
-                else:
-                    non_tumor_indices.append(i)
-
-            for z in tumor_indices:
-                self.tumor_samples.append((pid, z))
-            for z in non_tumor_indices:
-                self.bg_samples.append((pid, z))
+            index = load_patient_index(self.cache_dir, pid)
+
+            if index is not None:
+                # O(1) per patient: the split comes from the stored counts
+                tumor_indices, non_tumor_indices = split_slices(
+                    index, min_tumor_pixels
+                )
+            else:
+                cache = open_patient_cache(self.cache_dir, pid)
+
+                if cache is None:
+                    print(f"  [SKIP] No cached masks for {pid}")
+                    continue
+
+                # No index (legacy layout): count tumor pixels per slice
+                counts = cache.tumor_pixel_counts()
+                tumor_indices     = np.flatnonzero(counts >= min_tumor_pixels)
+                non_tumor_indices = np.flatnonzero(counts <  min_tumor_pixels)
+
+            patients.append(pid)
+            z_all = np.concatenate([tumor_indices, non_tumor_indices])
+            sample_z.append(np.sort(z_all).astype(np.int32))
+            sample_tumor.append(np.isin(sample_z[-1], tumor_indices))
 
             print(f"  {pid} — "
                 f"tumor: {len(tumor_indices)} | "
                 f"bg: {len(non_tumor_indices)}")
 
-        self.samples = self._build_samples()
-
-       
-        print(f"\nTotal samples    : {len(self.samples)}")
-        print(f"Tumor samples    : {len(self.tumor_samples)}")
-        print(f"Background samples: {len(self.bg_samples)}")
-
-    def _build_samples(self):
-
-        num_bg = min(
-            len(self.bg_samples),
-            self.bg_ratio * len(self.tumor_samples)
+        # Sample i is slice sample_z[i] of patients[sample_patient[i]]
+        self.patients       = patients
+        self.sample_patient = np.repeat(
+            np.arange(len(patients), dtype=np.int32),
+            [len(z) for z in sample_z]
         )
-        bg_selected = random.sample(self.bg_samples, num_bg)
-        samples = self.tumor_samples + bg_selected
-        random.shuffle(samples)
-        return samples
-
-    def resample_per_epoch(self):
-        self.samples = self._build_samples()
+        self.sample_z       = np.concatenate(sample_z or [np.zeros(0, np.int32)])
+        self.sample_tumor   = np.concatenate(sample_tumor or [np.zeros(0, bool)])
+        self.tumor_indices  = np.flatnonzero(self.sample_tumor)
+        self.bg_indices     = np.flatnonzero(~self.sample_tumor)
+        # Tensor store row per sample, -1 where the cache is read instead
+        self.store_rows     = np.array([
+            store_rows.get((patients[p], int(z)), -1)
+            for p, z in zip(self.sample_patient, self.sample_z)
+        ], dtype=np.int64)
+
+        print(f"\nTotal slices      : {len(self)}")
+        print(f"Tumor samples     : {len(self.tumor_indices)}")
+        print(f"Background samples: {len(self.bg_indices)}")
 
     def __len__(self):
-        return len(self.samples)
+        return len(self.sample_z)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_caches"] = {}
+        state["_store"] = None
+        return state
+
+    def _get_cache(self, pid):
+        # Small LRU: every memmap holds a file descriptor
+        cache = self._caches.pop(pid, None)
+        if cache is None:
+            cache = open_patient_cache(self.cache_dir, pid)
+            if len(self._caches) >= self.max_open_patients:
+                del self._caches[next(iter(self._caches))]
+        self._caches[pid] = cache
+        return cache
 
     def __getitem__(self, idx):
-        pid, z = self.samples[idx]
-
-        cache_dir = Path("data/cache")
-        pid_dir   = cache_dir / pid
-        mask_cache_dir = cache_dir / f"{pid}_masks"
-        bbox_path = cache_dir / f"{pid}_bboxes.npy"
+        pid = self.patients[self.sample_patient[idx]]
+        z   = int(self.sample_z[idx])
 
-        bboxes  = np.load(bbox_path)
-        total_z = len(bboxes)
+        row = self.store_rows[idx]
+        if row >= 0:
+            if self._store is None:
+                self._store = TensorStore(self.store_dir)
+            image, mask = self._store.read(row)
+        else:
+            image, mask = crop_resize_sample(self._get_cache(pid), z, self.img_size)
+            mask = (mask > 0).astype(np.float32)
 
-        z        = min(z, total_z - 1)
-        prev_idx = max(0, z - 1)
-        next_idx = min(total_z - 1, z + 1)
+        image = torch.from_numpy(image)
+        mask  = torch.from_numpy(mask).unsqueeze(0)
 
-        prev_slice = np.load(pid_dir / f"{prev_idx:04d}.npy")
-        curr_slice = np.load(pid_dir / f"{z:04d}.npy")
-        next_slice = np.load(pid_dir / f"{next_idx:04d}.npy")
-
-        mask = np.load(mask_cache_dir / f"{z:04d}.npy").astype(np.float32)
-
-        y_min, y_max, x_min, x_max = bboxes[z]
-        del bboxes
-
-        image = np.stack(
-            [prev_slice, curr_slice, next_slice],
-            axis=0
-        ).astype(np.float32)
-
-   
-        image = image[:, y_min:y_max, x_min:x_max]
-        mask  = mask[y_min:y_max, x_min:x_max]
+        if self.augment:
+            # Per-sample fallback; training augments whole batches with
+            # src.augment.augment_batch after collation instead
+            image, mask = augment_batch(image[None], mask[None])
+            image, mask = image[0], mask[0]
 
-        resized = []
-        for c in range(3):
-            resized.append(resize_image(image[c], self.img_size))
-        image = np.stack(resized, axis=0)
-        mask  = resize_mask(mask, self.img_size)
+        return image, mask
 
-  
-        mask = (mask > 0).astype(np.float32)
 
-        if self.augment:
-            image, mask = self._augment(image, mask)
+class BalancedSliceSampler(Sampler):
+    """
+    Per-epoch tumor / background balancing for LungSegmentationDataset:
+    every tumor slice plus up to bg_ratio x as many background slices,
+    drawn without replacement.
 
-      
-        image = torch.tensor(image, dtype=torch.float32)
-        mask  = torch.tensor(
-            mask, dtype=torch.float32
-        ).unsqueeze(0)
+    The draw depends only on seed + epoch, through its own
+    torch.Generator. The sampler runs in the main process and hands
+    indices to the workers, so set_epoch() takes effect with persistent
+    workers too.
+    """
 
-        return image, mask
+    def __init__(self, dataset, bg_ratio=None, shuffle=True, seed=0):
+        self.tumor_indices = dataset.tumor_indices
+        self.bg_indices    = dataset.bg_indices
+        bg_ratio = dataset.bg_ratio if bg_ratio is None else bg_ratio
+        self.num_bg  = min(len(self.bg_indices),
+                           int(bg_ratio * len(self.tumor_indices)))
+        self.shuffle = shuffle
+        self.seed    = seed
+        self.epoch   = 0
 
+    def set_epoch(self, epoch):
+        self.epoch = int(epoch)
 
-    def _augment(self, image, mask):
-        """
-        All augmentations in numpy space.
-        image: (3, H, W) float32
-        mask:  (H, W)    float32
-        """
-
-        #  Horizontal flip — axis=2 is width for (3,H,W)
-        if random.random() < 0.5:
-            image = np.flip(image, axis=2).copy()
-            mask  = np.flip(mask,  axis=1).copy()
-
-        #  Vertical flip
-        if random.random() < 0.2:
-            image = np.flip(image, axis=1).copy()
-            mask  = np.flip(mask,  axis=0).copy()
-
-        #  Rotation — consistent for image and mask
-        if random.random() < 0.3:
-            angle = random.uniform(-15, 15)
-            img_t  = torch.from_numpy(image)           # (3,H,W)
-            msk_t  = torch.from_numpy(mask).unsqueeze(0)  # (1,H,W)
-
-            img_t  = TF.rotate(img_t,  angle,
-                        interpolation=InterpolationMode.BILINEAR)
-            msk_t  = TF.rotate(msk_t, angle,
-                        interpolation=InterpolationMode.NEAREST)
-
-            image = img_t.numpy()
-            mask  = msk_t.squeeze(0).numpy()
-
-        #  Brightness/contrast — image ONLY, never mask
-        if random.random() < 0.3:
-            factor = random.uniform(0.9, 1.1)
-            image  = np.clip(image * factor, 0.0, 1.0)
-
-        #  Gaussian noise — image ONLY
-        if random.random() < 0.2:
-            noise = np.random.normal(0, 0.02, image.shape).astype(np.float32)
-            image = np.clip(image + noise, 0.0, 1.0)
-
-        if random.random() < 0.2:
-            h, w    = mask.shape
-            n_holes = random.randint(1, 4)
-            for _ in range(n_holes):
-                y1 = random.randint(0, h - 16)
-                x1 = random.randint(0, w - 16)
-                y2 = min(h, y1 + random.randint(8, 24))
-                x2 = min(w, x1 + random.randint(8, 24))
-                image[:, y1:y2, x1:x2] = 0.0
-
-        return image, mask
\ No newline at end of file
+    def __len__(self):
+        return len(self.tumor_indices) + self.num_bg
+
+    def __iter__(self):
+        generator = torch.Generator().manual_seed(self.seed + self.epoch)
+        pick = torch.randperm(len(self.bg_indices), generator=generator)
+        indices = np.concatenate([
+            self.tumor_indices, self.bg_indices[pick[:self.num_bg].numpy()]
+        ])
+        if self.shuffle:
+            indices = indices[torch.randperm(len(indices), generator=generator).numpy()]
+        else:
+            indices.sort()
+        return iter(indices.tolist())
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import tempfile
+import threading
+from pathlib import Path
+import numpy as np
+
+
+def series_key(headers, pixels):
+    """
+    Content address of a DICOM series: SeriesInstanceUID, everything
+    that changes the HU volume or its geometry (rescale, spacing) and a
+    hash of the stored pixel data itself.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(str(getattr(headers[0], "SeriesInstanceUID", "")).encode())
+    for ds in (headers[0], headers[-1]):
+        h.update(repr((
+            [float(v) for v in ds.PixelSpacing],
+            float(ds.SliceThickness),
+        )).encode())
+    h.update(np.array(
+        [[float(ds.RescaleSlope), float(ds.RescaleIntercept)] for ds in headers]
+    ).tobytes())
+    h.update(repr((pixels.shape, pixels.dtype.str)).encode())
+    h.update(memoryview(np.ascontiguousarray(pixels)).cast("B"))
+    return h.hexdigest()
+
+
+def file_fingerprint(path, chunk_size=1 << 20):
+    """Content hash of a file, e.g. a model checkpoint."""
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def derive_key(*parts):
+    """Combine a base key with extra qualifiers (model, settings…)."""
+    return hashlib.blake2b(
+        "|".join(str(p) for p in parts).encode(), digest_size=20
+    ).hexdigest()
+
+
+class VolumeCache:
+    """
+    On-disk cache of numpy arrays under content-addressed keys,
+    evicted least-recently-used first once it exceeds `max_bytes`.
+
+    Entries are written to a temp file and renamed into place, and a
+    hit refreshes the file's mtime, which is the LRU clock — so several
+    API worker processes can share one directory.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return self.root / f"{key}.npy"
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            array = np.load(path)
+            os.utime(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        return array
+
+    def put(self, key, array):
+        if self.max_bytes <= 0:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Drop oldest entries until the cache fits in max_bytes."""
+        with self._lock:
+            entries = []
+            for path in self.root.glob("*.npy"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+
+    def stats(self):
+        sizes = [p.stat().st_size for p in self.root.glob("*.npy")]
+        return {
+            "entries": len(sizes),
+            "bytes": sum(sizes),
+            "max_bytes": self.max_bytes,
+        }
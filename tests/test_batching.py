@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+import torch
+
+from api.batching import BatchScheduler
+
+
+def slow_model(delay):
+    def forward(batch):
+        time.sleep(delay)
+        return batch[:, :1] * 2
+    return forward
+
+
+def run_requests(scheduler, num_requests, chunks, chunk_size, stagger=0.0):
+    errors = []
+
+    def request(i):
+        time.sleep(i * stagger)
+        for _ in range(chunks):
+            batch = torch.full((chunk_size, 3, 8, 8), float(i))
+            out = scheduler.forward(batch)
+            if not torch.equal(out, batch[:, :1] * 2):
+                errors.append(i)
+
+    threads = [
+        threading.Thread(target=request, args=(i,)) for i in range(num_requests)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=30)
+    assert not any(t.is_alive() for t in threads)
+    assert not errors
+
+
+def test_concurrent_requests_share_forwards():
+    # API defaults: 16-stack chunks, batches of up to 32, 5 ms wait,
+    # against a model slower than the wait
+    scheduler = BatchScheduler(
+        slow_model(0.05), max_batch_size=32, max_wait_ms=5.0
+    ).start()
+    try:
+        run_requests(scheduler, num_requests=2, chunks=10, chunk_size=16,
+                     stagger=0.01)
+        stats = scheduler.stats()
+    finally:
+        scheduler.stop()
+
+    shared = sum(n for k, n in stats["requests_per_batch"].items() if k > 1)
+    assert shared > 0
+    assert stats["mean_batch_size"] > 16
+
+
+def test_many_small_chunks_fill_batches():
+    scheduler = BatchScheduler(
+        slow_model(0.02), max_batch_size=32, max_wait_ms=5.0
+    ).start()
+    try:
+        run_requests(scheduler, num_requests=8, chunks=5, chunk_size=8)
+        stats = scheduler.stats()
+    finally:
+        scheduler.stop()
+
+    assert stats["stacks"] == 8 * 5 * 8
+    assert stats["batches"] < 8 * 5 / 2
+
+
+def test_stop_refuses_new_work():
+    scheduler = BatchScheduler(slow_model(0.0)).start()
+    scheduler.stop()
+    with pytest.raises(RuntimeError):
+        scheduler.forward(torch.zeros(1, 3, 8, 8))
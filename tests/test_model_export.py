@@ -0,0 +1,40 @@
+import pytest
+import torch
+
+from src.model import LungAttentionUNet
+from src.model_export import (
+    check_parity,
+    export_onnx,
+    export_torchscript,
+    load_exported_model,
+)
+
+# Two batch sizes and two resolutions, none of them the export example
+BATCH_SIZES = (1, 3)
+IMG_SIZES   = (64, 96)
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    return LungAttentionUNet(in_channels=3, out_channels=1).eval()
+
+
+def test_torchscript_matches_eager(model, tmp_path):
+    path = export_torchscript(model, tmp_path / "model.ts", img_size=64)
+    exported = load_exported_model("torchscript", path)
+
+    parity = check_parity(model, exported, batch_sizes=BATCH_SIZES,
+                          img_sizes=IMG_SIZES)
+    assert parity["passed"], parity
+    assert len(parity["cases"]) == 4
+
+
+def test_onnx_dynamic_axes_match_eager(model, tmp_path):
+    path = export_onnx(model, tmp_path / "model.onnx", img_size=64)
+    exported = load_exported_model("onnx", path, threads=1)
+
+    parity = check_parity(model, exported, batch_sizes=BATCH_SIZES,
+                          img_sizes=IMG_SIZES)
+    assert parity["passed"], parity
+    assert len(parity["cases"]) == 4